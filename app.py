@@ -22,7 +22,8 @@ def index():
             'pagamentos': '/api/pagamentos',
             'presencas': '/api/presencas',
             'atividades': '/api/atividades',
-            'chatbot': '/api/chatbot'
+            'chatbot': '/api/chatbot',
+            'dashboard': '/api/dashboard'
         }
     }
 
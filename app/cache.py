@@ -0,0 +1,180 @@
+"""
+Cache de leitura das rotas GET (turmas, professores, alunos).
+
+O backend é escolhido por CACHE_URL: "memory://" (padrão) usa um LRU com TTL em cada
+worker; "redis://..." usa um servidor Redis (ou compatível) compartilhado pelos workers.
+As rotas usam @em_cache(...) e as gravações chamam invalidar_cache(...) com as tags
+afetadas depois do commit, ex. 'turmas' remove todas as entradas de turmas e
+'alunos:turma:3' apenas as listagens de alunos filtradas pela turma 3.
+
+Nas rotas com @condicional a chave inclui a ETag (versões dos recursos), então um worker
+nunca serve uma entrada gravada antes da última alteração, mesmo com o cache local.
+"""
+from flask import current_app, g, request
+from prometheus_client import Counter
+from app.serializacao import dumps_bytes
+from collections import OrderedDict
+from functools import wraps
+import logging
+import threading
+import time
+import orjson
+
+logger = logging.getLogger(__name__)
+
+CACHE_ACERTOS = Counter('cache_acertos', 'Leituras atendidas pelo cache', ['backend'])
+CACHE_FALHAS = Counter('cache_falhas', 'Leituras que não estavam no cache', ['backend'])
+CACHE_REMOCOES = Counter('cache_remocoes', 'Entradas removidas do cache', ['backend', 'motivo'])
+
+# Cabeçalhos da resposta original guardados junto com o corpo
+CABECALHOS_GUARDADOS = ('Content-Type', 'X-Next-Cursor', 'Link', 'X-Total-Count')
+
+class CacheLocal:
+    """LRU com TTL em memória do processo, com índice de tags para invalidação"""
+    nome = 'memoria'
+    compartilhado = False  # invalidar_cache só alcança o worker que gravou
+
+    def __init__(self, max_entradas=1000, ttl=60):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._entradas = OrderedDict()  # chave -> (expira_em, valor, tags)
+        self._tags = {}  # tag -> chaves
+        self._lock = threading.Lock()
+
+    def get(self, chave):
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                return None
+            if entrada[0] <= time.monotonic():
+                self._remover(chave, 'expiracao')
+                return None
+            self._entradas.move_to_end(chave)
+            return entrada[1]
+
+    def set(self, chave, valor, tags=()):
+        with self._lock:
+            if chave in self._entradas:
+                self._remover(chave, None)
+            self._entradas[chave] = (time.monotonic() + self.ttl, valor, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(chave)
+            while len(self._entradas) > self.max_entradas:
+                self._remover(next(iter(self._entradas)), 'lru')
+
+    def invalidar(self, *tags):
+        with self._lock:
+            for tag in tags:
+                for chave in list(self._tags.get(tag, ())):
+                    self._remover(chave, 'invalidacao')
+
+    def _remover(self, chave, motivo):
+        _, _, tags = self._entradas.pop(chave)
+        for tag in tags:
+            chaves = self._tags.get(tag)
+            if chaves is not None:
+                chaves.discard(chave)
+                if not chaves:
+                    del self._tags[tag]
+        if motivo:
+            CACHE_REMOCOES.labels(self.nome, motivo).inc()
+
+class CacheRedis:
+    """
+    Cache em um servidor que fala o protocolo do Redis. Cada tag é um SET com as chaves
+    marcadas por ela. Falhas de conexão viram falhas de cache, não erros na requisição.
+    """
+    nome = 'redis'
+    compartilhado = True
+
+    def __init__(self, cliente, ttl=60, prefixo='escola:cache:'):
+        self.cliente = cliente
+        self.ttl = ttl
+        self.prefixo = prefixo
+
+    def get(self, chave):
+        import redis
+        try:
+            return self.cliente.get(self.prefixo + chave)
+        except redis.RedisError:
+            logger.warning('Cache Redis indisponível na leitura', exc_info=True)
+            return None
+
+    def set(self, chave, valor, tags=()):
+        import redis
+        try:
+            pipe = self.cliente.pipeline()
+            pipe.set(self.prefixo + chave, valor, ex=self.ttl)
+            for tag in tags:
+                # O SET da tag expira junto com a entrada mais nova marcada por ela
+                pipe.sadd(self._chave_tag(tag), chave)
+                pipe.expire(self._chave_tag(tag), self.ttl)
+            pipe.execute()
+        except redis.RedisError:
+            logger.warning('Cache Redis indisponível na gravação', exc_info=True)
+
+    def invalidar(self, *tags):
+        import redis
+        try:
+            for tag in tags:
+                chaves = self.cliente.smembers(self._chave_tag(tag))
+                pipe = self.cliente.pipeline()
+                for chave in chaves:
+                    pipe.delete(self.prefixo + chave.decode('utf-8'))
+                pipe.delete(self._chave_tag(tag))
+                pipe.execute()
+                CACHE_REMOCOES.labels(self.nome, 'invalidacao').inc(len(chaves))
+        except redis.RedisError:
+            logger.warning('Cache Redis indisponível na invalidação', exc_info=True)
+
+    def _chave_tag(self, tag):
+        return f'{self.prefixo}tag:{tag}'
+
+def criar_cache(config):
+    """Backend de cache a partir de CACHE_URL, CACHE_TTL e CACHE_MAX_ENTRADAS"""
+    url = config.get('CACHE_URL') or 'memory://'
+    ttl = config.get('CACHE_TTL', 60)
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        import redis
+        return CacheRedis(redis.Redis.from_url(url, socket_timeout=0.5), ttl=ttl)
+    return CacheLocal(max_entradas=config.get('CACHE_MAX_ENTRADAS', 1000), ttl=ttl)
+
+def _cache():
+    return current_app.extensions['cache']
+
+def invalidar_cache(*tags):
+    """Remove do cache as entradas marcadas com as tags (chamar depois do commit)"""
+    _cache().invalidar(*tags)
+
+def _empacotar(resposta):
+    cabecalhos = {nome: resposta.headers[nome] for nome in CABECALHOS_GUARDADOS if nome in resposta.headers}
+    return dumps_bytes(cabecalhos) + b'\n' + resposta.get_data()
+
+def _desempacotar(valor):
+    cabecalhos, corpo = valor.split(b'\n', 1)
+    return current_app.response_class(corpo, headers=orjson.loads(cabecalhos))
+
+def em_cache(recurso, tags=None):
+    """
+    Decorador das rotas GET: guarda a resposta 200 marcada com a tag do recurso e com as
+    tags extras devolvidas por tags(**view_args). Respostas em streaming não são guardadas.
+    """
+    def decorador(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = _cache()
+            versao = g.get('etag_recursos') or f"{request.full_path}|{request.headers.get('Accept', '')}"
+            chave = f'{recurso}:{versao}'
+
+            valor = cache.get(chave)
+            if valor is not None:
+                CACHE_ACERTOS.labels(cache.nome).inc()
+                return _desempacotar(valor)
+            CACHE_FALHAS.labels(cache.nome).inc()
+
+            resposta = current_app.make_response(view(*args, **kwargs))
+            if resposta.status_code == 200 and not resposta.is_streamed:
+                cache.set(chave, _empacotar(resposta), [recurso, *(tags(**kwargs) if tags else ())])
+            return resposta
+        return wrapper
+    return decorador
@@ -0,0 +1,103 @@
+"""Comandos de manutenção disponíveis via `flask --app main <comando>`"""
+import click
+from flask import Flask
+
+def registrar_comandos(app: Flask):
+    @app.cli.command('recalcular-frequencia')
+    def recalcular_frequencia_cmd():
+        """Reconstrói o resumo mensal de frequência a partir de presencas"""
+        from app.frequencia import recalcular_frequencia
+        recalcular_frequencia()
+        click.echo('✅ Resumo de frequência recalculado')
+
+    @app.cli.command('hash-senhas')
+    def hash_senhas_cmd():
+        """Converte as senhas ainda em texto puro para hash com SENHA_METODO"""
+        from app import db
+        from app.models import Usuario
+        from app.senhas import eh_hash
+        usuarios = [u for u in Usuario.query.all() if not eh_hash(u.senha)]
+        hashes = app.extensions['senhas'].gerar_varios([u.senha for u in usuarios])
+        for usuario, senha in zip(usuarios, hashes):
+            usuario.senha = senha
+        db.session.commit()
+        click.echo(f'✅ {len(usuarios)} senha(s) convertida(s) para hash')
+
+    @app.cli.command('migrar')
+    @click.option('--pendentes', is_flag=True, help='Só lista as migrações ainda não aplicadas')
+    def migrar_cmd(pendentes):
+        """Aplica as migrações de database/migracoes ainda não aplicadas (PostgreSQL)"""
+        from app import db
+        from app.migracoes import aplicar_migracoes, migracoes_pendentes
+        if pendentes:
+            for _, caminho in migracoes_pendentes(db.engine):
+                click.echo(caminho.name)
+            return
+        aplicadas = aplicar_migracoes(db.engine)
+        for nome in aplicadas:
+            click.echo(f'✅ {nome}')
+        if not aplicadas:
+            click.echo('Nenhuma migração pendente')
+
+    @app.cli.command('particoes')
+    def particoes_cmd():
+        """Cria as partições de presencas do ano atual e dos próximos PRESENCAS_ANOS_FUTUROS anos"""
+        from app import db
+        from app.particoes import garantir_particoes, listar_particoes, particionada
+        conexao = db.session.connection()
+        if not particionada(conexao):
+            click.echo('presencas não é particionada neste banco (migração 002 não aplicada?)')
+            return
+        criadas = garantir_particoes(conexao, app.config['PRESENCAS_ANOS_FUTUROS'])
+        db.session.commit()
+        for ano in criadas:
+            click.echo(f'✅ Partição presencas_{ano} criada')
+        for ano, nome, linhas in listar_particoes(db.session.connection()):
+            click.echo(f'{nome}: ~{linhas} linha(s)')
+
+    @app.cli.command('arquivar-presencas')
+    @click.argument('antes_de', type=int)
+    @click.option('--remover', is_flag=True, help='Apaga as partições em vez de movê-las para o schema arquivo')
+    def arquivar_presencas_cmd(antes_de, remover):
+        """Tira de presencas as partições dos anos anteriores a ANTES_DE"""
+        from app import db
+        from app.particoes import SCHEMA_ARQUIVO, arquivar_particoes
+        from app.versoes import registrar_alteracao
+        arquivadas = arquivar_particoes(db.session.connection(), antes_de, remover=remover)
+        if arquivadas:
+            registrar_alteracao('presencas')
+        db.session.commit()
+        destino = 'removida' if remover else f'movida para o schema {SCHEMA_ARQUIVO}'
+        for nome in arquivadas:
+            click.echo(f'✅ {nome} {destino}')
+        if not arquivadas:
+            click.echo('Nenhuma partição anterior a esse ano')
+
+    @app.cli.command('importar')
+    @click.argument('tipo', type=click.Choice(['alunos', 'pagamentos']))
+    @click.argument('arquivo', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--retomar', type=int, help='id de uma importação interrompida do mesmo arquivo')
+    @click.option('--encoding', default='utf-8-sig', show_default=True, help='Codificação do CSV')
+    def importar_cmd(tipo, arquivo, retomar, encoding):
+        """Importa alunos ou pagamentos de um CSV ou XLSX (como POST /api/importacoes/<tipo>)"""
+        from pathlib import Path
+        from app import db
+        from app.importacao import ArquivoInvalido, RetomadaInvalida, importar
+        from app.models import Importacao
+        anterior = None
+        if retomar is not None:
+            anterior = db.session.get(Importacao, retomar)
+            if anterior is None:
+                raise click.ClickException(f'Importação {retomar} não encontrada')
+        try:
+            with open(arquivo, 'rb') as conteudo:
+                importacao = importar(tipo, conteudo, Path(arquivo).name, retomar=anterior, encoding=encoding)
+        except (ArquivoInvalido, RetomadaInvalida) as e:
+            raise click.ClickException(str(e))
+        click.echo(
+            f'Importação {importacao.id_importacao} ({importacao.status}): {importacao.linhas_lidas} linha(s) lida(s), '
+            f'{importacao.importadas} importada(s), {importacao.atualizadas} atualizada(s), '
+            f'{importacao.ignoradas} ignorada(s), {importacao.com_erro} com erro'
+        )
+        if importacao.status != 'concluida':
+            raise click.ClickException(f'{importacao.mensagem}; retome com --retomar {importacao.id_importacao}')
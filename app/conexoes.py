@@ -0,0 +1,77 @@
+"""Configuração do pool de conexões do SQLAlchemy e métricas do pool para o Prometheus"""
+from prometheus_client import Gauge, Histogram
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+import os
+import time
+
+POOL_CONEXOES_EM_USO = Gauge(
+    'db_pool_conexoes_em_uso',
+    'Conexões do pool do SQLAlchemy emprestadas no momento'
+)
+POOL_ESPERA_CHECKOUT = Histogram(
+    'db_pool_espera_checkout_segundos',
+    'Tempo esperando uma conexão livre no pool do SQLAlchemy',
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+class QueuePoolMedido(QueuePool):
+    """QueuePool que registra quanto tempo cada checkout esperou por uma conexão"""
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_ESPERA_CHECKOUT.observe(time.perf_counter() - inicio)
+
+def _env_bool(nome, padrao):
+    valor = os.environ.get(nome)
+    if valor is None:
+        return padrao
+    return valor.strip().lower() in ('1', 'true', 'sim', 'yes')
+
+def opcoes_engine(uri):
+    """
+    Monta SQLALCHEMY_ENGINE_OPTIONS a partir das variáveis de ambiente:
+
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE e DB_POOL_PRE_PING
+    configuram o pool de cada worker do gunicorn. DB_POOLER=pgbouncer indica que há um
+    pooler externo em modo transaction, então prepared statements no servidor são desligados.
+    """
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite':
+        # SQLite (testes) usa o pool próprio do Flask-SQLAlchemy
+        return {}
+
+    opcoes = {
+        'poolclass': QueuePoolMedido,
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': _env_bool('DB_POOL_PRE_PING', True),
+    }
+
+    if os.environ.get('DB_POOLER', '').strip().lower() == 'pgbouncer':
+        # Em modo transaction cada comando pode cair em outra conexão do servidor,
+        # então um prepared statement criado antes pode não existir mais
+        driver = url.get_driver_name()
+        if driver == 'psycopg':
+            opcoes['connect_args'] = {'prepare_threshold': None}
+        elif driver == 'asyncpg':
+            opcoes['connect_args'] = {'statement_cache_size': 0, 'prepared_statement_cache_size': 0}
+        # psycopg2 não usa prepared statements no servidor
+
+    return opcoes
+
+def instrumentar_pool(engine):
+    """Mantém o gauge de conexões em uso atualizado a partir dos eventos do pool"""
+    @event.listens_for(engine, 'checkout')
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        POOL_CONEXOES_EM_USO.inc()
+
+    @event.listens_for(engine, 'checkin')
+    def _checkin(dbapi_connection, connection_record):
+        POOL_CONEXOES_EM_USO.dec()
@@ -0,0 +1,111 @@
+"""Funções auxiliares para consultas que dependem do banco (PostgreSQL em produção, SQLite nos testes)"""
+from sqlalchemy import Text, func, literal_column
+from app import db
+from decimal import Decimal
+import json
+
+def nome_dialeto():
+    """Nome do dialeto do banco em uso ('postgresql', 'sqlite', ...)"""
+    return db.session.get_bind().dialect.name
+
+def agregar_json(**campos):
+    """
+    Agrega as linhas do grupo em uma lista JSON de objetos com os campos informados.
+    Usa json_agg/json_build_object no PostgreSQL e json_group_array/json_object no SQLite.
+    """
+    pares = []
+    for chave, coluna in campos.items():
+        pares.extend([literal_column(f"'{chave}'"), coluna])
+
+    if nome_dialeto() == 'postgresql':
+        # Como texto, para que ler_json decodifique os valores numéricos como Decimal
+        return func.json_agg(func.json_build_object(*pares)).cast(Text)
+    return func.json_group_array(func.json_object(*pares))
+
+def ler_json(valor):
+    """Decodifica o texto de agregar_json mantendo números como Decimal"""
+    if isinstance(valor, (str, bytes)):
+        return json.loads(valor, parse_float=Decimal)
+    return valor or []
+
+def insert_ignorando_conflitos(tabela):
+    """
+    INSERT ... ON CONFLICT DO NOTHING para a tabela (PostgreSQL e SQLite).
+    Retorna None quando o banco não suporta, para que o chamador use o caminho alternativo.
+    """
+    dialeto = nome_dialeto()
+    if dialeto == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialeto == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert(tabela).on_conflict_do_nothing()
+
+def upsert(tabela, colunas_conflito, colunas_atualizar, **expressoes):
+    """
+    INSERT ... ON CONFLICT (colunas_conflito) DO UPDATE SET colunas_atualizar = excluded.*
+    (PostgreSQL e SQLite). Retorna None quando o banco não suporta.
+    expressoes: colunas atualizadas com uma expressão própria, ex. versao=tabela.c.versao + 1
+    """
+    dialeto = nome_dialeto()
+    if dialeto == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialeto == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    stmt = insert(tabela)
+    return stmt.on_conflict_do_update(
+        index_elements=colunas_conflito,
+        set_={**{coluna: stmt.excluded[coluna] for coluna in colunas_atualizar}, **expressoes}
+    )
+
+def inicio_do_mes(coluna):
+    """Primeiro dia do mês de uma coluna de data"""
+    if nome_dialeto() == 'postgresql':
+        return func.date_trunc(literal_column("'month'"), coluna).cast(db.Date)
+    return func.date(coluna, literal_column("'start of month'"))
+
+def _nos_plano_postgres(conexao, sql, parametros=None):
+    """Nós do plano do EXPLAIN (FORMAT JSON) no PostgreSQL"""
+    plano = conexao.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + sql, parametros or ()).scalar()
+    if isinstance(plano, str):
+        plano = json.loads(plano)
+    nos = [plano[0]['Plan']]
+    while nos:
+        no = nos.pop()
+        yield no
+        nos.extend(no.get('Plans', ()))
+
+def tabelas_lidas(conexao, sql, parametros=None):
+    """Tabelas (e partições) que o plano da consulta lê no PostgreSQL"""
+    return {no['Relation Name'] for no in _nos_plano_postgres(conexao, sql, parametros) if 'Relation Name' in no}
+
+def tabelas_varridas(conexao, sql, parametros=None):
+    """
+    Tabelas lidas por inteiro no plano da consulta (EXPLAIN): "Seq Scan" no PostgreSQL;
+    no SQLite, "SCAN tabela" sem índice ou percorrendo um índice que não é parcial.
+    """
+    if conexao.dialect.name == 'postgresql':
+        return {
+            no['Relation Name'] for no in _nos_plano_postgres(conexao, sql, parametros)
+            if no['Node Type'] == 'Seq Scan'
+        }
+
+    varridas = set()
+    for linha in conexao.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql, parametros or ()):
+        partes = linha[3].split()
+        if len(partes) < 2 or partes[0] != 'SCAN' or partes[1].startswith('('):
+            continue  # SEARCH (usa índice) ou varredura de subconsulta/CTE já materializada
+        tabela = partes[1]
+        indice = partes[partes.index('INDEX') + 1] if 'INDEX' in partes else None
+        if indice is None or not _indice_parcial_sqlite(conexao, tabela, indice):
+            varridas.add(tabela)
+    return varridas
+
+def _indice_parcial_sqlite(conexao, tabela, indice):
+    return any(
+        linha[1] == indice and linha[4]
+        for linha in conexao.exec_driver_sql(f'PRAGMA index_list("{tabela}")')
+    )
@@ -0,0 +1,78 @@
+"""
+Modo de exportação das listagens: as linhas são lidas do banco em lotes (cursor no servidor
+com yield_per) e enviadas ao cliente à medida que chegam, como NDJSON ou CSV.
+A memória por requisição fica constante, independente do tamanho do resultado.
+"""
+from flask import Response, request, stream_with_context
+from app import db
+from app.serializacao import dumps_bytes
+from datetime import date, datetime
+import csv
+import io
+
+FORMATOS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+TAMANHO_LOTE = 1000
+
+def formato_exportacao():
+    """
+    Formato pedido pelo cliente: parâmetro ?format=ndjson|csv ou cabeçalho Accept.
+    Retorna None para a resposta JSON normal.
+    """
+    formato = request.args.get('format')
+    if formato:
+        return formato.lower() if formato.lower() in FORMATOS else None
+
+    melhor = request.accept_mimetypes.best_match(['application/json', *FORMATOS.values()])
+    for nome, mimetype in FORMATOS.items():
+        if melhor == mimetype:
+            return nome
+    return None
+
+def exportar(consulta, nome_arquivo, formato, agrupar=None):
+    """
+    Executa a consulta (select de colunas) em lotes e devolve uma resposta em streaming.
+
+    agrupar: função opcional que recebe o iterador de registros (dicts) e produz os objetos
+    do NDJSON, por exemplo juntando as linhas de um join em um objeto com lista aninhada.
+    No CSV as linhas são sempre enviadas planas.
+    """
+    def executar():
+        return db.session.execute(consulta.execution_options(yield_per=TAMANHO_LOTE))
+
+    def registros():
+        for linha in executar().mappings():
+            yield dict(linha)
+
+    if formato == 'csv':
+        corpo = _gerar_csv(executar)
+    else:
+        corpo = _gerar_ndjson(agrupar(registros()) if agrupar else registros())
+
+    return Response(
+        stream_with_context(corpo),
+        mimetype=FORMATOS[formato],
+        headers={'Content-Disposition': f'attachment; filename={nome_arquivo}.{formato}'}
+    )
+
+def _gerar_ndjson(registros):
+    for registro in registros:
+        yield dumps_bytes(registro) + b'\n'
+
+def _gerar_csv(executar):
+    resultado = executar()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # Cabeçalho pelas colunas da consulta: a exportação sem linhas ainda traz o cabeçalho
+    writer.writerow(resultado.keys())
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for linha in resultado:
+        writer.writerow([valor.isoformat() if isinstance(valor, (date, datetime)) else valor for valor in linha])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
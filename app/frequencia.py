@@ -0,0 +1,141 @@
+"""
+Resumo de frequência por aluno e mês (tabela frequencia_mensal).
+
+As rotas de presença chamam atualizar_frequencia para os pares (aluno, mês) que gravaram;
+recalcular_frequencia reconstrói a tabela (comando `flask recalcular-frequencia`), exceto os
+meses dos anos já arquivados, cujas presenças não estão mais na tabela.
+Os relatórios usam consultar_frequencia, que soma os meses completos do resumo e lê de
+presencas apenas os dias dos meses incompletos nas pontas do período.
+"""
+from app import db
+from app.dialeto import inicio_do_mes, upsert
+from app.models import Aluno, Presenca, FrequenciaMensal
+from app.particoes import primeiro_ano_ativo
+from app.versoes import registrar_alteracao
+from sqlalchemy import case, exists, func, insert, literal, or_, select, union_all
+from datetime import date, timedelta
+
+def _inicio_mes(dia):
+    return dia.replace(day=1)
+
+def _proximo_mes(dia):
+    return (dia.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+def _agregado_presencas(*filtros):
+    """SELECT id_aluno, total_dias, dias_presentes de presencas, agrupado por aluno"""
+    return select(
+        Presenca.id_aluno,
+        func.count().label('total_dias'),
+        func.sum(case((Presenca.presente, 1), else_=0)).label('dias_presentes')
+    ).where(*filtros).group_by(Presenca.id_aluno)
+
+def atualizar_frequencia(ids_alunos, dias):
+    """
+    Recalcula o resumo dos alunos nos meses das datas informadas.
+    Deve ser chamada na mesma transação da gravação em presencas (antes do commit).
+    """
+    ids_alunos = list(set(ids_alunos))
+    if not ids_alunos:
+        return
+
+    db.session.flush()
+    colunas = ['id_aluno', 'mes', 'id_turma', 'total_dias', 'dias_presentes']
+    for mes in {_inicio_mes(dia) for dia in dias}:
+        fim = _proximo_mes(mes) - timedelta(days=1)
+        agregado = _agregado_presencas(
+            Presenca.id_aluno.in_(ids_alunos),
+            Presenca.data_presenca.between(mes, fim)
+        ).subquery()
+        linhas = select(
+            agregado.c.id_aluno,
+            literal(mes, db.Date),
+            Aluno.id_turma,
+            agregado.c.total_dias,
+            agregado.c.dias_presentes
+        ).join(Aluno, Aluno.id_aluno == agregado.c.id_aluno).where(agregado.c.total_dias > 0)  # WHERE: exigido pelo SQLite antes do ON CONFLICT
+
+        # Upsert em vez de DELETE + INSERT: duas gravações simultâneas do mesmo aluno e mês
+        # não violam a chave (id_aluno, mes)
+        stmt = upsert(FrequenciaMensal.__table__, ['id_aluno', 'mes'], ['id_turma', 'total_dias', 'dias_presentes'])
+        if stmt is None:
+            db.session.execute(FrequenciaMensal.__table__.delete().where(
+                FrequenciaMensal.id_aluno.in_(ids_alunos),
+                FrequenciaMensal.mes == mes
+            ))
+            db.session.execute(insert(FrequenciaMensal).from_select(colunas, linhas))
+            continue
+        db.session.execute(stmt.from_select(colunas, linhas))
+        # Alunos que ficaram sem presenças no mês
+        db.session.execute(FrequenciaMensal.__table__.delete().where(
+            FrequenciaMensal.id_aluno.in_(ids_alunos),
+            FrequenciaMensal.mes == mes,
+            ~exists().where(
+                Presenca.id_aluno == FrequenciaMensal.id_aluno,
+                Presenca.data_presenca.between(mes, fim)
+            )
+        ))
+
+def recalcular_frequencia():
+    """
+    Reconstrói o resumo a partir de presencas em um único INSERT ... SELECT. Os meses dos anos
+    arquivados (partições desanexadas) são mantidos como estão.
+    """
+    mes = inicio_do_mes(Presenca.data_presenca)
+    apagar = FrequenciaMensal.__table__.delete()
+    linhas = select(
+        Presenca.id_aluno,
+        mes,
+        Aluno.id_turma,
+        func.count(),
+        func.sum(case((Presenca.presente, 1), else_=0))
+    ).join(Aluno, Aluno.id_aluno == Presenca.id_aluno).group_by(Presenca.id_aluno, mes, Aluno.id_turma)
+
+    primeiro_ano = primeiro_ano_ativo(db.session.connection())
+    if primeiro_ano is not None:
+        inicio = date(primeiro_ano, 1, 1)
+        apagar = apagar.where(FrequenciaMensal.mes >= inicio)
+        linhas = linhas.where(Presenca.data_presenca >= inicio)
+
+    db.session.execute(apagar)
+    db.session.execute(insert(FrequenciaMensal).from_select(
+        ['id_aluno', 'mes', 'id_turma', 'total_dias', 'dias_presentes'], linhas
+    ))
+    registrar_alteracao('presencas')
+    db.session.commit()
+
+def consultar_frequencia(data_inicio, data_fim, id_turma=None):
+    """
+    Frequência por aluno no período, com o nome do aluno, em uma única consulta.
+    Retorna linhas com id_aluno, nome_completo, total_dias e dias_presentes.
+    """
+    primeiro_mes_cheio = data_inicio if data_inicio.day == 1 else _proximo_mes(data_inicio)
+    fim_ultimo_mes_cheio = _inicio_mes(data_fim + timedelta(days=1)) - timedelta(days=1)
+
+    if primeiro_mes_cheio <= fim_ultimo_mes_cheio:
+        # Meses completos vêm do resumo; as pontas, de presencas
+        meses = select(
+            FrequenciaMensal.id_aluno,
+            FrequenciaMensal.total_dias,
+            FrequenciaMensal.dias_presentes
+        ).where(FrequenciaMensal.mes.between(primeiro_mes_cheio, _inicio_mes(fim_ultimo_mes_cheio)))
+        pontas = _agregado_presencas(or_(
+            Presenca.data_presenca.between(data_inicio, primeiro_mes_cheio - timedelta(days=1)),
+            Presenca.data_presenca.between(fim_ultimo_mes_cheio + timedelta(days=1), data_fim)
+        ))
+        partes = union_all(meses, pontas).subquery()
+    else:
+        partes = _agregado_presencas(Presenca.data_presenca.between(data_inicio, data_fim)).subquery()
+
+    query = select(
+        Aluno.id_aluno,
+        Aluno.nome_completo,
+        func.sum(partes.c.total_dias).label('total_dias'),
+        func.sum(partes.c.dias_presentes).label('dias_presentes')
+    ).join(partes, partes.c.id_aluno == Aluno.id_aluno)
+
+    if id_turma is not None:
+        query = query.where(Aluno.id_turma == id_turma)
+
+    return db.session.execute(
+        query.group_by(Aluno.id_aluno, Aluno.nome_completo).order_by(Aluno.id_aluno)
+    ).all()
@@ -0,0 +1,458 @@
+"""
+Importação em lote de alunos e pagamentos a partir de CSV ou XLSX.
+
+O arquivo é lido em streaming (módulo csv, ou openpyxl em modo read_only para .xlsx) e
+processado em lotes de IMPORTACAO_LOTE linhas. Para cada lote:
+
+1. as linhas são validadas de uma vez: conversão de datas (AAAA-MM-DD ou DD/MM/AAAA) e
+   valores (850.00 ou 850,00), tamanho das colunas do modelo, status do pagamento contra o
+   CHECK da tabela, repetições dentro do lote e existência das turmas/alunos referidos, com
+   uma única consulta IN por lote;
+2. as válidas vão para a tabela temporária importacao_lote (COPY no PostgreSQL com
+   psycopg2, INSERT em lote nos demais bancos) e são mescladas na tabela definitiva com
+   comandos de conjunto:
+   - alunos: entram os que ainda não existem; o mesmo nome (sem diferenciar maiúsculas),
+     data de nascimento e turma contam como ignorados, então reenviar o arquivo não duplica;
+   - pagamentos: o par (id_aluno, referencia) identifica a mensalidade, que é atualizada se
+     já existe (ex. Pendente -> Pago vindo do extrato do banco) ou inserida;
+3. os erros das linhas rejeitadas (até IMPORTACAO_MAX_ERROS por importação), os contadores e
+   importacoes.ultima_linha são gravados na mesma transação do lote.
+
+Se um lote falha, os anteriores continuam gravados e a importação fica "interrompida";
+enviar o mesmo arquivo com retomar=<id_importacao> pula as linhas até ultima_linha. Só uma
+requisição processa a importação por vez (_assumir); uma "em_andamento" parada há mais de
+IMPORTACAO_ABANDONO segundos é tida como abandonada e também pode ser retomada.
+"""
+from flask import current_app
+from prometheus_client import Counter
+from sqlalchemy import Column, Integer, MetaData, Table, insert, or_, select, text, update
+from app import db
+from app.cache import invalidar_cache
+from app.instrumentacao import em_lotes
+from app.models import Aluno, Importacao, ImportacaoErro, Pagamento, Turma
+from app.versoes import registrar_alteracao
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal, InvalidOperation
+import codecs
+import csv
+import io
+import itertools
+import logging
+
+logger = logging.getLogger(__name__)
+
+IMPORTACAO_LINHAS = Counter(
+    'importacao_linhas', 'Linhas de arquivos importados em lote', ['tipo', 'resultado']
+)
+
+TABELA_LOTE = 'importacao_lote'
+STATUS_PAGAMENTO = ('Pago', 'Pendente')  # CHECK de pagamentos.status
+
+class ArquivoInvalido(ValueError):
+    """Arquivo que não pode ser importado (formato, codificação ou cabeçalho)"""
+
+class RetomadaInvalida(ValueError):
+    """retomar aponta para uma importação de outro arquivo, já concluída ou em andamento em outra requisição"""
+
+def _agora():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def _texto(coluna):
+    tamanho = coluna.type.length
+
+    def converter(valor):
+        texto = str(valor).strip()
+        if tamanho and len(texto) > tamanho:
+            raise ValueError(f'Mais de {tamanho} caracteres')
+        return texto
+    return converter
+
+def _data(valor):
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    for formato in ('%Y-%m-%d', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(str(valor).strip(), formato).date()
+        except ValueError:
+            pass
+    raise ValueError('Data inválida (use AAAA-MM-DD ou DD/MM/AAAA)')
+
+def _inteiro(valor):
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    texto = str(valor).strip()
+    if not texto.isdigit():
+        raise ValueError('Número inteiro inválido')
+    return int(texto)
+
+def _valor(valor):
+    texto = str(valor).strip().replace('R$', '').strip()
+    if ',' in texto:  # 1.234,56
+        texto = texto.replace('.', '').replace(',', '.')
+    try:
+        numero = Decimal(texto).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError('Valor inválido')
+    if numero < 0 or numero >= Decimal('100000000'):  # NUMERIC(10, 2)
+        raise ValueError('Valor fora do intervalo')
+    return numero
+
+def _status(valor):
+    texto = str(valor).strip().capitalize()
+    if texto not in STATUS_PAGAMENTO:
+        raise ValueError(f"Status deve ser {' ou '.join(STATUS_PAGAMENTO)}")
+    return texto
+
+# Por tipo: colunas do arquivo (nome, conversão, obrigatória), na ordem da tabela temporária
+COLUNAS = {
+    'alunos': [
+        ('nome_completo', _texto(Aluno.__table__.c.nome_completo), True),
+        ('data_nascimento', _data, True),
+        ('id_turma', _inteiro, True),
+        ('nome_responsavel', _texto(Aluno.__table__.c.nome_responsavel), True),
+        ('telefone_responsavel', _texto(Aluno.__table__.c.telefone_responsavel), True),
+        ('email_responsavel', _texto(Aluno.__table__.c.email_responsavel), True),
+        ('informacoes_adicionais', str, False),
+    ],
+    'pagamentos': [
+        ('id_aluno', _inteiro, True),
+        ('data_pagamento', _data, True),
+        ('valor_pago', _valor, True),
+        ('forma_pagamento', _texto(Pagamento.__table__.c.forma_pagamento), True),
+        ('referencia', _texto(Pagamento.__table__.c.referencia), True),
+        ('status', _status, True),
+    ],
+}
+TABELAS = {'alunos': Aluno.__table__, 'pagamentos': Pagamento.__table__}
+# Por tipo: coluna que referencia outra tabela, a chave referida e a mensagem se não existir
+REFERENCIAS = {
+    'alunos': ('id_turma', Turma.id_turma, 'Turma não encontrada'),
+    'pagamentos': ('id_aluno', Aluno.id_aluno, 'Aluno não encontrado'),
+}
+# Por tipo: colunas que identificam o mesmo registro (repetição dentro do arquivo)
+CHAVES = {
+    'alunos': lambda linha: (linha['nome_completo'].lower(), linha['data_nascimento'], linha['id_turma']),
+    'pagamentos': lambda linha: (linha['id_aluno'], linha['referencia']),
+}
+
+MESCLAR = {
+    'alunos': ["""
+        INSERT INTO alunos (nome_completo, data_nascimento, id_turma, nome_responsavel,
+                            telefone_responsavel, email_responsavel, informacoes_adicionais)
+        SELECT l.nome_completo, l.data_nascimento, l.id_turma, l.nome_responsavel,
+               l.telefone_responsavel, l.email_responsavel, COALESCE(l.informacoes_adicionais, '')
+        FROM importacao_lote l
+        WHERE NOT EXISTS (
+            SELECT 1 FROM alunos a
+            WHERE a.id_turma = l.id_turma
+              AND a.data_nascimento = l.data_nascimento
+              AND lower(a.nome_completo) = lower(l.nome_completo)
+        )
+        ORDER BY l.linha
+    """],
+    # O UPDATE vem antes: só alcança as mensalidades que já existiam antes do lote
+    'pagamentos': ["""
+        UPDATE pagamentos
+        SET data_pagamento = l.data_pagamento, valor_pago = l.valor_pago,
+            forma_pagamento = l.forma_pagamento, status = l.status
+        FROM importacao_lote l
+        WHERE pagamentos.id_aluno = l.id_aluno AND pagamentos.referencia = l.referencia
+    """, """
+        INSERT INTO pagamentos (id_aluno, data_pagamento, valor_pago, forma_pagamento, referencia, status)
+        SELECT l.id_aluno, l.data_pagamento, l.valor_pago, l.forma_pagamento, l.referencia, l.status
+        FROM importacao_lote l
+        WHERE NOT EXISTS (
+            SELECT 1 FROM pagamentos p WHERE p.id_aluno = l.id_aluno AND p.referencia = l.referencia
+        )
+        ORDER BY l.linha
+    """],
+}
+
+def _normalizar(nome):
+    return str(nome or '').strip().lower().replace(' ', '_')
+
+def ler_arquivo(arquivo, nome_arquivo, encoding='utf-8-sig'):
+    """(cabeçalho, linhas) do CSV ou XLSX; linhas gera (número da linha, valores) sem ler o arquivo inteiro"""
+    extensao = nome_arquivo.rsplit('.', 1)[-1].lower() if '.' in nome_arquivo else ''
+    if extensao == 'xlsx':
+        return _ler_xlsx(arquivo)
+    if extensao in ('csv', 'txt'):
+        return _ler_csv(arquivo, encoding)
+    raise ArquivoInvalido('Formato não suportado (use .csv ou .xlsx)')
+
+def _ler_csv(arquivo, encoding):
+    try:
+        texto = codecs.getreader(encoding)(arquivo)
+        primeira = texto.readline()
+    except LookupError:
+        raise ArquivoInvalido(f'Codificação desconhecida: {encoding}')
+    except UnicodeDecodeError:
+        raise ArquivoInvalido(f'O arquivo não está em {encoding} (informe o encoding, ex. latin-1)')
+    if not primeira.strip():
+        raise ArquivoInvalido('Arquivo vazio')
+    # Planilhas em português salvam CSV com ponto e vírgula
+    delimitador = ';' if primeira.count(';') > primeira.count(',') else ','
+    leitor = csv.reader(itertools.chain([primeira], texto), delimiter=delimitador)
+    cabecalho = next(leitor)
+    linhas = (
+        (numero, valores) for numero, valores in enumerate(leitor, start=2)
+        if any(valor.strip() for valor in valores)
+    )
+    return cabecalho, linhas
+
+def _ler_xlsx(arquivo):
+    try:
+        import openpyxl
+    except ImportError:
+        raise ArquivoInvalido('Importar .xlsx requer o pacote openpyxl')
+    try:
+        pasta = openpyxl.load_workbook(arquivo, read_only=True, data_only=True)
+    except Exception:
+        raise ArquivoInvalido('Planilha .xlsx inválida')
+    planilha = pasta.active.iter_rows(values_only=True)
+    cabecalho = next(planilha, None)
+    if not cabecalho:
+        pasta.close()
+        raise ArquivoInvalido('Arquivo vazio')
+
+    def linhas():
+        try:
+            for numero, valores in enumerate(planilha, start=2):
+                if any(valor not in (None, '') for valor in valores):
+                    yield numero, valores
+        finally:
+            pasta.close()
+    return list(cabecalho), linhas()
+
+def _posicoes(tipo, cabecalho):
+    """{coluna: posição no arquivo}; colunas desconhecidas são ignoradas"""
+    nomes = [_normalizar(nome) for nome in cabecalho]
+    faltando = [nome for nome, _, obrigatoria in COLUNAS[tipo] if obrigatoria and nome not in nomes]
+    if faltando:
+        raise ArquivoInvalido(f"Colunas obrigatórias ausentes: {', '.join(faltando)}")
+    return {nome: nomes.index(nome) for nome, _, _ in COLUNAS[tipo] if nome in nomes}
+
+def _validar(tipo, posicoes, lote):
+    """(válidas, erros) do lote: registros convertidos e [(linha, coluna, mensagem)]"""
+    convertidas, erros = [], []
+    for numero, valores in lote:
+        registro, erro = {'linha': numero}, None
+        for nome, converter, obrigatoria in COLUNAS[tipo]:
+            posicao = posicoes.get(nome)
+            valor = valores[posicao] if posicao is not None and posicao < len(valores) else None
+            if valor is None or (isinstance(valor, str) and not valor.strip()):
+                if obrigatoria:
+                    erro = (numero, nome, 'Campo obrigatório')
+                    break
+                registro[nome] = None
+                continue
+            try:
+                registro[nome] = converter(valor)
+            except ValueError as e:
+                erro = (numero, nome, str(e))
+                break
+        if erro:
+            erros.append(erro)
+        else:
+            convertidas.append(registro)
+
+    # Uma consulta por lote para as referências
+    coluna, chave, mensagem = REFERENCIAS[tipo]
+    referidos = {registro[coluna] for registro in convertidas}
+    existentes = set(db.session.execute(select(chave).where(chave.in_(referidos))).scalars()) if referidos else set()
+
+    validas, vistas = [], {}
+    for registro in convertidas:
+        identificacao = CHAVES[tipo](registro)
+        if registro[coluna] not in existentes:
+            erros.append((registro['linha'], coluna, mensagem))
+        elif identificacao in vistas:
+            erros.append((registro['linha'], None, f'Repete a linha {vistas[identificacao]}'))
+        else:
+            vistas[identificacao] = registro['linha']
+            validas.append(registro)
+    erros.sort()
+    return validas, erros
+
+def _tabela_lote(tipo):
+    tabela = TABELAS[tipo]
+    return Table(
+        TABELA_LOTE, MetaData(), Column('linha', Integer),
+        *(Column(nome, tabela.c[nome].type) for nome, _, _ in COLUNAS[tipo]),
+        prefixes=['TEMPORARY']
+    )
+
+def _carregar(conexao, tipo, validas):
+    """Cria importacao_lote e carrega as linhas válidas (COPY no PostgreSQL)"""
+    lote = _tabela_lote(tipo)
+    conexao.execute(text(f'DROP TABLE IF EXISTS {TABELA_LOTE}'))
+    lote.create(conexao)
+
+    if conexao.dialect.name == 'postgresql' and conexao.dialect.driver == 'psycopg2':
+        nomes = [coluna.name for coluna in lote.columns]
+        buffer = io.StringIO()
+        escritor = csv.writer(buffer)
+        for registro in validas:
+            # No formato csv do COPY, campo vazio sem aspas é NULL
+            escritor.writerow(['' if registro[nome] is None else registro[nome] for nome in nomes])
+        buffer.seek(0)
+        cursor = conexao.connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY {TABELA_LOTE} ({', '.join(nomes)}) FROM STDIN WITH (FORMAT csv)", buffer)
+        finally:
+            cursor.close()
+        return
+    conexao.execute(insert(lote), validas)
+
+def _mesclar(conexao, tipo, validas):
+    """Carrega e mescla as linhas válidas; retorna quantas foram inseridas"""
+    _carregar(conexao, tipo, validas)
+    inseridas = 0
+    for comando in MESCLAR[tipo]:
+        resultado = conexao.execute(text(comando))
+        if comando.lstrip().startswith('INSERT'):
+            inseridas = resultado.rowcount
+    conexao.execute(text(f'DROP TABLE {TABELA_LOTE}'))
+    return inseridas
+
+def _lotes(linhas, tamanho):
+    while True:
+        lote = list(itertools.islice(linhas, tamanho))
+        if not lote:
+            return
+        yield lote
+
+def _processar_lote(importacao, posicoes, lote):
+    """Valida, grava e atualiza os contadores de um lote (sem commit); retorna as válidas"""
+    tipo = importacao.tipo
+    validas, erros = _validar(tipo, posicoes, lote)
+    inseridas = _mesclar(db.session.connection(), tipo, validas) if validas else 0
+
+    espaco = max(0, current_app.config['IMPORTACAO_MAX_ERROS'] - importacao.com_erro)
+    if erros and espaco:
+        db.session.execute(insert(ImportacaoErro), [
+            {'id_importacao': importacao.id_importacao, 'linha': linha, 'coluna': coluna, 'mensagem': mensagem[:255]}
+            for linha, coluna, mensagem in erros[:espaco]
+        ])
+
+    importacao.linhas_lidas += len(lote)
+    importacao.importadas += inseridas
+    if tipo == 'pagamentos':
+        importacao.atualizadas += len(validas) - inseridas
+    else:
+        importacao.ignoradas += len(validas) - inseridas
+    importacao.com_erro += len(erros)
+    importacao.ultima_linha = lote[-1][0]
+    importacao.atualizado_em = _agora()
+    if validas:
+        registrar_alteracao(tipo)
+    return validas, erros
+
+def _invalidar(tipo, validas):
+    if tipo == 'alunos':
+        invalidar_cache('alunos')
+    else:
+        invalidar_cache(*{f"chatbot:pagamento:{registro['id_aluno']}" for registro in validas})
+
+def _assumir(importacao, agora):
+    """
+    Marca a importação a retomar como em andamento com um UPDATE condicional, para que duas
+    requisições (em workers diferentes) não processem as mesmas linhas. Uma importação em
+    andamento sem avanço há IMPORTACAO_ABANDONO segundos é tida como abandonada (processo
+    que caiu) e pode ser assumida.
+    """
+    abandonada = agora - timedelta(seconds=current_app.config['IMPORTACAO_ABANDONO'])
+    resultado = db.session.execute(
+        update(Importacao)
+        .where(
+            Importacao.id_importacao == importacao.id_importacao,
+            Importacao.status != 'concluida',
+            or_(Importacao.status != 'em_andamento', Importacao.atualizado_em < abandonada)
+        )
+        .values(status='em_andamento', mensagem=None, atualizado_em=agora)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    if not resultado.rowcount:
+        if importacao.status == 'concluida':
+            raise RetomadaInvalida('A importação já foi concluída')
+        raise RetomadaInvalida('A importação está em andamento em outra requisição')
+
+def _conferir_dono(importacao, ultima_linha):
+    """
+    Trava a linha da importação até o commit do lote e confere que ninguém avançou desde o
+    último lote desta requisição (a importação foi assumida depois de tida como abandonada)
+    """
+    gravada = db.session.execute(
+        select(Importacao.ultima_linha)
+        .where(Importacao.id_importacao == importacao.id_importacao)
+        .with_for_update()
+    ).scalar_one()
+    if gravada != ultima_linha:
+        raise RetomadaInvalida('A importação foi retomada por outra requisição')
+
+def importar(tipo, arquivo, nome_arquivo, retomar=None, encoding='utf-8-sig', id_usuario=None, tamanho_lote=None):
+    """
+    Importa o arquivo (objeto binário) de alunos ou pagamentos, lote a lote; retorna a
+    Importacao, concluída ou interrompida (com a mensagem). retomar é uma Importacao anterior
+    do mesmo arquivo: as linhas até a ultima_linha dela são puladas.
+    """
+    if tipo not in COLUNAS:
+        raise ArquivoInvalido(f"Tipo de importação desconhecido: {tipo} (use {', '.join(COLUNAS)})")
+    tamanho_nome = Importacao.__table__.c.nome_arquivo.type.length
+    if len(nome_arquivo) > tamanho_nome:
+        raise ArquivoInvalido(f'Nome do arquivo com mais de {tamanho_nome} caracteres')
+    if retomar is not None:
+        if retomar.tipo != tipo or retomar.nome_arquivo != nome_arquivo:
+            raise RetomadaInvalida('A importação a retomar é de outro tipo ou arquivo')
+        if retomar.status == 'concluida':
+            raise RetomadaInvalida('A importação já foi concluída')
+    cabecalho, linhas = ler_arquivo(arquivo, nome_arquivo, encoding)
+    posicoes = _posicoes(tipo, cabecalho)
+    em_lotes()
+
+    agora = _agora()
+    importacao = retomar
+    if importacao is None:
+        importacao = Importacao(tipo=tipo, nome_arquivo=nome_arquivo, id_usuario=id_usuario, criado_em=agora,
+                                status='em_andamento', atualizado_em=agora)
+        db.session.add(importacao)
+        db.session.commit()
+    else:
+        _assumir(importacao, agora)
+
+    ultima_linha = importacao.ultima_linha
+    pendentes = ((numero, valores) for numero, valores in linhas if numero > ultima_linha)
+    try:
+        for lote in _lotes(pendentes, tamanho_lote or current_app.config['IMPORTACAO_LOTE']):
+            _conferir_dono(importacao, ultima_linha)
+            validas, erros = _processar_lote(importacao, posicoes, lote)
+            db.session.commit()
+            ultima_linha = lote[-1][0]
+            _invalidar(tipo, validas)
+            IMPORTACAO_LINHAS.labels(tipo, 'valida').inc(len(validas))
+            IMPORTACAO_LINHAS.labels(tipo, 'erro').inc(len(erros))
+    except RetomadaInvalida:
+        db.session.rollback()
+        raise
+    except Exception as e:
+        db.session.rollback()
+        if isinstance(e, UnicodeDecodeError):
+            mensagem = f'O arquivo não está em {encoding} depois da linha {importacao.ultima_linha} (informe o encoding, ex. latin-1)'
+        elif isinstance(e, csv.Error):
+            mensagem = f'CSV inválido depois da linha {importacao.ultima_linha}: {e}'
+        else:
+            logger.exception('Importação %s interrompida depois da linha %d', importacao.id_importacao, importacao.ultima_linha)
+            mensagem = f'Erro ao gravar o lote depois da linha {importacao.ultima_linha}'
+        importacao.status = 'interrompida'
+        importacao.mensagem = mensagem
+        importacao.atualizado_em = _agora()
+        db.session.commit()
+        return importacao
+
+    importacao.status = 'concluida'
+    importacao.atualizado_em = _agora()
+    db.session.commit()
+    return importacao
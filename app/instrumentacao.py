@@ -0,0 +1,140 @@
+"""
+Instrumentação dos comandos SQL de cada requisição e detector de N+1.
+
+Os eventos before/after_cursor_execute do engine medem cada comando enviado ao banco e o
+somam na medição da requisição atual (g.sql). No fim da requisição:
+
+- sql_comandos_por_requisicao e sql_tempo_por_requisicao_segundos (por endpoint) recebem
+  o total de comandos e o tempo gasto no banco;
+- um mesmo comando repetido SQL_LIMIAR_REPETICOES vezes ou mais (o texto é igual, só os
+  parâmetros mudam) é contado em sql_n_mais_1 e registrado no log, pois quase sempre é um
+  relacionamento carregado dentro de um laço;
+- com DEBUG ou SQL_CABECALHOS a resposta leva X-SQL-Comandos, X-SQL-Tempo-Ms e
+  X-SQL-Repeticoes;
+- com SQL_ESTRITO (usado nos testes) a requisição que passar do orçamento de comandos do
+  endpoint (SQL_ORCAMENTOS, ou SQL_ORCAMENTO_PADRAO) ou que tiver N+1 levanta
+  OrcamentoSQLExcedido, que o cliente de testes propaga e faz o teste falhar.
+
+Rotas que processam dados em lotes (importações) chamam em_lotes(): os comandos crescem com
+o tamanho do arquivo e se repetem por lote de propósito, então orçamento e N+1 não se aplicam.
+
+Comandos fora de uma requisição (threads de fundo, comandos do flask) não são medidos, nem
+os executados depois do after_request por respostas em streaming (exportações).
+"""
+from flask import current_app, g, has_request_context, request
+from prometheus_client import Counter, Histogram
+from sqlalchemy import event
+from collections import Counter as Contagem
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+SQL_COMANDOS = Histogram(
+    'sql_comandos_por_requisicao', 'Comandos SQL executados por requisição', ['endpoint'],
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 100, 250)
+)
+SQL_TEMPO = Histogram(
+    'sql_tempo_por_requisicao_segundos', 'Tempo gasto no banco por requisição', ['endpoint'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+SQL_N_MAIS_1 = Counter('sql_n_mais_1', 'Requisições com o mesmo comando SQL repetido (N+1)', ['endpoint'])
+
+# Execuções guardadas por requisição (a contagem continua além disso)
+MAX_EXECUCOES = 500
+
+class OrcamentoSQLExcedido(AssertionError):
+    """Rota passou do orçamento de comandos SQL ou repetiu um comando (modo estrito)"""
+
+class MedicaoSQL:
+    """Comandos SQL de uma requisição: quantidade, tempo total e repetições por texto"""
+
+    def __init__(self):
+        self.comandos = 0
+        self.tempo = 0.0
+        self.por_texto = Contagem()
+        self.execucoes = []  # (comando, parâmetros, duração) na ordem de execução
+        self.em_lotes = False
+
+    def registrar(self, comando, parametros, duracao):
+        self.comandos += 1
+        self.tempo += duracao
+        self.por_texto[comando] += 1
+        if len(self.execucoes) < MAX_EXECUCOES:
+            self.execucoes.append((comando, parametros, duracao))
+
+    def mais_repetido(self):
+        """(comando, vezes) do comando mais repetido, ou (None, 0)"""
+        if not self.por_texto:
+            return None, 0
+        return self.por_texto.most_common(1)[0]
+
+def ler_orcamentos(valor):
+    """'pagamentos.relatorio_periodo=3,alunos.get_alunos=4' -> {endpoint: comandos}"""
+    orcamentos = {}
+    for item in filter(None, (parte.strip() for parte in (valor or '').split(','))):
+        endpoint, _, comandos = item.partition('=')
+        orcamentos[endpoint.strip()] = int(comandos)
+    return orcamentos
+
+def em_lotes():
+    """Marca a requisição atual como processamento em lotes (sem orçamento nem detector de N+1)"""
+    medicao = g.get('sql') if has_request_context() else None
+    if medicao is not None:
+        medicao.em_lotes = True
+
+def instrumentar_sql(app, engine):
+    """Liga os eventos do engine e os hooks da aplicação"""
+    # O início fica no contexto da execução, não em conn.info: after_cursor_execute não é
+    # chamado quando o comando falha, e nada deve sobrar na conexão devolvida ao pool
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.inicio_comando = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _depois(conn, cursor, statement, parameters, context, executemany):
+        inicio = getattr(context, 'inicio_comando', None)
+        if inicio is None:
+            return
+        duracao = time.perf_counter() - inicio
+        if has_request_context():
+            medicao = g.get('sql')
+            if medicao is not None:
+                medicao.registrar(statement, parameters, duracao)
+
+    app.before_request(_iniciar_medicao)
+    app.after_request(_encerrar_medicao)
+
+def _iniciar_medicao():
+    g.sql = MedicaoSQL()
+
+def _encerrar_medicao(resposta):
+    medicao = g.get('sql')  # Fica em g para o registro de requisições lentas (app.lentidao)
+    if medicao is None:
+        return resposta
+    config = current_app.config
+    endpoint = request.endpoint or 'desconhecido'
+    SQL_COMANDOS.labels(endpoint).observe(medicao.comandos)
+    SQL_TEMPO.labels(endpoint).observe(medicao.tempo)
+
+    comando, repeticoes = medicao.mais_repetido()
+    n_mais_1 = repeticoes >= config['SQL_LIMIAR_REPETICOES'] and not medicao.em_lotes
+    if n_mais_1:
+        SQL_N_MAIS_1.labels(endpoint).inc()
+        logger.warning('Possível N+1 em %s: comando executado %d vezes: %s', endpoint, repeticoes, comando[:300])
+
+    if current_app.debug or config['SQL_CABECALHOS']:
+        resposta.headers['X-SQL-Comandos'] = str(medicao.comandos)
+        resposta.headers['X-SQL-Tempo-Ms'] = f'{medicao.tempo * 1000:.1f}'
+        resposta.headers['X-SQL-Repeticoes'] = str(repeticoes)
+
+    if config['SQL_ESTRITO'] and not medicao.em_lotes:
+        orcamento = config['SQL_ORCAMENTOS'].get(endpoint, config['SQL_ORCAMENTO_PADRAO'])
+        if orcamento is not None and medicao.comandos > orcamento:
+            raise OrcamentoSQLExcedido(
+                f'{endpoint} executou {medicao.comandos} comandos SQL (orçamento: {orcamento})'
+            )
+        if n_mais_1:
+            raise OrcamentoSQLExcedido(f'N+1 em {endpoint}: {repeticoes}x {comando[:300]}')
+    return resposta
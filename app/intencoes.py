@@ -0,0 +1,83 @@
+"""
+Classificação de intenções do ChatBot por palavras-chave.
+
+As palavras e frases de todas as intenções são indexadas uma vez, na construção do
+classificador, em um dicionário de frases normalizadas (minúsculas e sem acentos).
+A mensagem é quebrada em palavras e percorrida uma única vez, procurando a frase mais longa
+que começa em cada posição; cada frase encontrada soma um ponto para as suas intenções.
+Como a comparação é por palavra inteira, 'oi' não casa mais dentro de 'noite'.
+"""
+import unicodedata
+
+# Depois de tirar os acentos o texto é ASCII: letras viram minúsculas e o resto, espaço
+_TABELA_ASCII = bytes(
+    c + 32 if 65 <= c <= 90 else c if 97 <= c <= 122 or 48 <= c <= 57 else 32
+    for c in range(256)
+)
+
+def _palavras(texto):
+    """Palavras da mensagem em minúsculas e sem acentos ('Presença!' -> ['presenca'])"""
+    sem_acentos = unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore')
+    return sem_acentos.translate(_TABELA_ASCII).decode('ascii').split()
+
+def normalizar(texto):
+    """Forma normalizada do texto, para comparar 'Presenças' com 'presencas'"""
+    return ' '.join(_palavras(texto))
+
+class ClassificadorIntencoes:
+    def __init__(self, palavras_por_intencao):
+        """palavras_por_intencao: dict ordenado intenção -> lista de palavras/frases"""
+        self.ordem = {intencao: i for i, intencao in enumerate(palavras_por_intencao)}
+        self.intencoes_por_frase = {}
+        for intencao, frases in palavras_por_intencao.items():
+            for frase in frases:
+                palavras = _palavras(frase)
+                # O plural em 's' da última palavra também conta ('faltas', 'atividades')
+                for variante in (palavras, palavras[:-1] + [palavras[-1] + 's']):
+                    intencoes = self.intencoes_por_frase.setdefault(' '.join(variante), [])
+                    if intencao not in intencoes:
+                        intencoes.append(intencao)
+
+        # Tamanhos das frases de várias palavras, indexados pela primeira palavra
+        self.tamanhos_por_inicio = {}
+        for frase in self.intencoes_por_frase:
+            palavras = frase.split(' ')
+            if len(palavras) > 1:
+                self.tamanhos_por_inicio.setdefault(palavras[0], set()).add(len(palavras))
+        self.tamanhos_por_inicio = {
+            inicio: sorted(tamanhos, reverse=True) for inicio, tamanhos in self.tamanhos_por_inicio.items()
+        }
+
+    def pontuar(self, mensagem):
+        """Intenções encontradas com a pontuação de cada uma, da mais provável para a menos"""
+        palavras = _palavras(mensagem)
+        frases = self.intencoes_por_frase
+        tamanhos_por_inicio = self.tamanhos_por_inicio
+        pontos = {}
+        posicao = 0
+        total = len(palavras)
+        while posicao < total:
+            palavra = palavras[posicao]
+            tamanho = 1
+            intencoes = None
+            # Frase mais longa que começa nesta palavra ('boa tarde' vence 'tarde')
+            if palavra in tamanhos_por_inicio:
+                for tamanho in tamanhos_por_inicio[palavra]:
+                    intencoes = frases.get(' '.join(palavras[posicao:posicao + tamanho]))
+                    if intencoes is not None:
+                        break
+                else:
+                    tamanho = 1
+            if intencoes is None:
+                intencoes = frases.get(palavra)
+            if intencoes is not None:
+                for intencao in intencoes:
+                    pontos[intencao] = pontos.get(intencao, 0) + 1
+            posicao += tamanho
+        # Empate: vale a ordem em que as intenções foram declaradas
+        return sorted(pontos.items(), key=lambda item: (-item[1], self.ordem[item[0]]))
+
+    def classificar(self, mensagem):
+        """Intenção mais provável ou None"""
+        pontuacao = self.pontuar(mensagem)
+        return pontuacao[0][0] if pontuacao else None
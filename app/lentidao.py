@@ -0,0 +1,263 @@
+"""
+Registro de requisições lentas, com os comandos SQL e amostras da pilha Python.
+
+Cada requisição guarda só o instante de início (e os comandos SQL que a instrumentação de
+app.instrumentacao já mede). Uma thread por worker acorda a cada LENTAS_INTERVALO_MS e,
+apenas para as requisições que já passaram da metade de LENTAS_LIMIAR_MS, anota a pilha em
+que a thread da requisição está (amostragem: nenhum hook de profiler fica ligado). Assim
+as requisições rápidas custam dois acessos a um dicionário e o registro pode ficar sempre
+ligado em produção.
+
+Ao terminar acima do limiar, a requisição vira uma linha JSON no arquivo do worker em
+LENTAS_DIRETORIO (lentas-<pid>.jsonl, com rotação por tamanho): duração, endpoint, os
+comandos SQL mais demorados com os parâmetros redigidos (textos viram '<texto N>'; números,
+datas e booleanos ficam, pois são o que reproduz o plano) e as pilhas mais amostradas no
+formato "folded" (a;b;c), que ferramentas de flamegraph leem direto. Um arquivo por worker
+evita que dois processos do gunicorn girem o mesmo arquivo; resumir_lentas lê todos eles
+para a rota /api/diagnostico/lentas. LENTAS_LIMIAR_MS vazio desliga o registro. Nas
+respostas em streaming (exportações) só conta o tempo até o início do envio.
+"""
+from flask import current_app, g, request
+from prometheus_client import Counter
+from collections import Counter as Contagem, defaultdict
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+REQUISICOES_LENTAS = Counter('requisicoes_lentas', 'Requisições acima de LENTAS_LIMIAR_MS', ['endpoint'])
+
+PROFUNDIDADE_PILHA = 48
+
+class AmostradorPilhas:
+    """Thread que amostra a pilha das requisições em andamento há mais de `apos` segundos"""
+
+    def __init__(self, intervalo=0.01):
+        self.intervalo = intervalo
+        self._ativas = {}  # id da thread -> [inicio, apos, Contagem de pilhas]
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def iniciar(self, apos):
+        """Passa a acompanhar a thread atual; retorna a contagem de pilhas que será preenchida"""
+        self._garantir_thread()
+        pilhas = Contagem()
+        self._ativas[threading.get_ident()] = (time.perf_counter(), apos, pilhas)
+        return pilhas
+
+    def encerrar(self):
+        self._ativas.pop(threading.get_ident(), None)
+
+    def _garantir_thread(self):
+        # O pid muda depois do fork dos workers do gunicorn, que não herdam a thread
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                threading.Thread(target=self._executar, name='amostrador-pilhas', daemon=True).start()
+                self._pid = os.getpid()
+
+    def _executar(self):
+        while True:
+            time.sleep(self.intervalo)
+            self.amostrar()
+
+    def amostrar(self):
+        agora = time.perf_counter()
+        candidatas = [
+            (thread, pilhas) for thread, (inicio, apos, pilhas) in list(self._ativas.items())
+            if agora - inicio >= apos
+        ]
+        if not candidatas:
+            return
+        quadros = sys._current_frames()
+        for thread, pilhas in candidatas:
+            quadro = quadros.get(thread)
+            if quadro is not None:
+                pilhas[_pilha(quadro)] += 1
+
+def _pilha(quadro):
+    """Pilha no formato folded: da chamada mais externa para a mais interna, separadas por ';'"""
+    partes = []
+    while quadro is not None and len(partes) < PROFUNDIDADE_PILHA:
+        codigo = quadro.f_code
+        arquivo = '/'.join(Path(codigo.co_filename).parts[-2:])
+        partes.append(f'{arquivo}:{codigo.co_name}:{quadro.f_lineno}')
+        quadro = quadro.f_back
+    return ';'.join(reversed(partes))
+
+def redigir(valor):
+    """Parâmetros SQL sem os textos (nomes, e-mails, senhas), mantendo ids, datas e valores"""
+    if isinstance(valor, dict):
+        return {chave: redigir(item) for chave, item in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [redigir(item) for item in valor]
+    if valor is None or isinstance(valor, (bool, int, float)):
+        return valor
+    if isinstance(valor, Decimal):
+        return str(valor)
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    if isinstance(valor, (str, bytes)):
+        return f'<texto {len(valor)}>'
+    return f'<{type(valor).__name__}>'
+
+class RegistroLentas:
+    def __init__(self, intervalo=0.01, tamanho_arquivo=5 * 1024 * 1024, arquivos=3):
+        self.amostrador = AmostradorPilhas(intervalo)
+        self.tamanho_arquivo = tamanho_arquivo
+        self.arquivos = arquivos
+        self._destino = None  # (diretorio, pid, handler)
+        self._lock = threading.Lock()
+
+    def gravar(self, diretorio, registro):
+        linha = json.dumps(registro, ensure_ascii=False, default=str)
+        self._handler(diretorio).handle(logging.makeLogRecord({'msg': linha, 'levelno': logging.INFO}))
+
+    def _handler(self, diretorio):
+        destino = self._destino
+        if destino is not None and destino[0] == diretorio and destino[1] == os.getpid():
+            return destino[2]
+        with self._lock:
+            if self._destino is not None:
+                self._destino[2].close()
+            Path(diretorio).mkdir(parents=True, exist_ok=True)
+            _remover_antigos(diretorio)
+            handler = RotatingFileHandler(
+                Path(diretorio) / f'lentas-{os.getpid()}.jsonl',
+                maxBytes=self.tamanho_arquivo, backupCount=self.arquivos, encoding='utf-8'
+            )
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self._destino = (diretorio, os.getpid(), handler)
+            return handler
+
+def _remover_antigos(diretorio, dias=7):
+    """Apaga arquivos de workers que não gravam há dias (o pid muda a cada reinício)"""
+    limite = time.time() - dias * 86400
+    for caminho in Path(diretorio).glob('lentas-*.jsonl*'):
+        try:
+            if caminho.stat().st_mtime < limite:
+                caminho.unlink()
+        except FileNotFoundError:
+            pass
+
+def instrumentar_lentidao(app):
+    """Cria o registro a partir da configuração e liga os hooks da aplicação"""
+    app.extensions['lentas'] = RegistroLentas(
+        intervalo=app.config['LENTAS_INTERVALO_MS'] / 1000,
+        tamanho_arquivo=app.config['LENTAS_TAMANHO_ARQUIVO'],
+        arquivos=app.config['LENTAS_ARQUIVOS']
+    )
+    app.before_request(_iniciar_requisicao)
+    app.after_request(_encerrar_requisicao)
+
+def _iniciar_requisicao():
+    limiar = current_app.config['LENTAS_LIMIAR_MS']
+    if limiar is None:
+        return
+    g.lentas_inicio = time.perf_counter()
+    g.lentas_pilhas = current_app.extensions['lentas'].amostrador.iniciar(limiar / 2000)
+
+def _encerrar_requisicao(resposta):
+    inicio = g.pop('lentas_inicio', None)
+    if inicio is None:
+        return resposta
+    duracao = time.perf_counter() - inicio
+    registro = current_app.extensions['lentas']
+    registro.amostrador.encerrar()
+
+    config = current_app.config
+    if config['LENTAS_LIMIAR_MS'] is None or duracao * 1000 < config['LENTAS_LIMIAR_MS']:
+        return resposta
+    endpoint = request.endpoint or 'desconhecido'
+    REQUISICOES_LENTAS.labels(endpoint).inc()
+    try:
+        registro.gravar(config['LENTAS_DIRETORIO'], _montar(endpoint, resposta, duracao, config))
+    except Exception:
+        logger.exception('Erro ao registrar requisição lenta em %s', endpoint)
+    return resposta
+
+def _montar(endpoint, resposta, duracao, config):
+    usuario = g.get('usuario')
+    registro = {
+        'em': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'endpoint': endpoint,
+        'metodo': request.method,
+        'caminho': request.path,
+        'argumentos': sorted(request.args),  # Só os nomes: os valores podem ter dados pessoais
+        'status': resposta.status_code,
+        'duracao_ms': round(duracao * 1000, 1),
+        'usuario': usuario['id_usuario'] if usuario else None,
+        'pid': os.getpid(),
+    }
+
+    medicao = g.get('sql')
+    if medicao is not None:
+        mais_lentos = sorted(
+            enumerate(medicao.execucoes), key=lambda item: item[1][2], reverse=True
+        )[:config['LENTAS_MAX_COMANDOS']]
+        comando, repeticoes = medicao.mais_repetido()
+        registro['sql'] = {
+            'comandos': medicao.comandos,
+            'tempo_ms': round(medicao.tempo * 1000, 1),
+            'mais_repetido': {'comando': comando[:300], 'vezes': repeticoes} if comando else None,
+            'mais_lentos': [
+                {'ordem': ordem, 'comando': texto[:2000], 'parametros': redigir(parametros),
+                 'duracao_ms': round(tempo * 1000, 2)}
+                for ordem, (texto, parametros, tempo) in sorted(mais_lentos)
+            ],
+        }
+
+    pilhas = Contagem(dict(g.pop('lentas_pilhas', None) or {}))  # Cópia: o amostrador pode estar escrevendo
+    registro['amostras'] = sum(pilhas.values())
+    registro['pilhas'] = [
+        {'pilha': pilha, 'amostras': amostras}
+        for pilha, amostras in pilhas.most_common(config['LENTAS_MAX_PILHAS'])
+    ]
+    return registro
+
+def ler_lentas(diretorio, desde=None):
+    """Registros de todos os arquivos (de todos os workers) em diretorio, a partir de desde"""
+    for caminho in sorted(Path(diretorio).glob('lentas-*.jsonl*')):
+        try:
+            with open(caminho, encoding='utf-8') as arquivo:
+                for linha in arquivo:
+                    try:
+                        registro = json.loads(linha)
+                    except ValueError:
+                        continue  # Linha cortada por uma rotação em andamento
+                    if desde is None or registro['em'] >= desde:
+                        yield registro
+        except FileNotFoundError:
+            continue  # Girado ou removido enquanto lia
+
+def resumir_lentas(diretorio, horas=24, limite=10):
+    """Endpoints com mais tempo total em requisições lentas, cada um com a sua pior requisição"""
+    desde = (datetime.now(timezone.utc) - timedelta(hours=horas)).isoformat(timespec='seconds')
+    por_endpoint = defaultdict(list)
+    for registro in ler_lentas(diretorio, desde):
+        por_endpoint[registro['endpoint']].append(registro)
+
+    resumo = []
+    for endpoint, registros in por_endpoint.items():
+        duracoes = [registro['duracao_ms'] for registro in registros]
+        comandos = [registro['sql']['comandos'] for registro in registros if 'sql' in registro]
+        resumo.append({
+            'endpoint': endpoint,
+            'ocorrencias': len(registros),
+            'duracao_total_ms': round(sum(duracoes), 1),
+            'duracao_media_ms': round(sum(duracoes) / len(duracoes), 1),
+            'duracao_max_ms': max(duracoes),
+            'comandos_sql_media': round(sum(comandos) / len(comandos), 1) if comandos else None,
+            'pior': max(registros, key=lambda registro: registro['duracao_ms']),
+        })
+    resumo.sort(key=lambda item: item['duracao_total_ms'], reverse=True)
+    return resumo[:limite]
@@ -0,0 +1,180 @@
+"""
+Limites de requisições por IP, por login ou por usuário (janela deslizante aproximada).
+
+Cada regra tem um orçamento "n/segundos" lido da configuração LIMITE_<REGRA>, ex.
+LIMITE_LOGIN_IP="20/60". A contagem usa duas janelas fixas: a atual e a anterior, com peso
+proporcional ao quanto a anterior ainda cobre da janela deslizante. Assim não há rajada
+dupla na virada da janela e cada chave guarda só dois contadores.
+
+O armazenamento é escolhido por LIMITES_URL: "memory://" (padrão) conta em cada worker;
+"redis://..." conta em um Redis compartilhado, para que o limite valha para todos os
+workers do gunicorn. Os blueprints registram as regras com limitar(...), que roda no
+before_request, antes de qualquer acesso ao banco. Requisições acima do limite recebem 429
+com Retry-After; a tentativa rejeitada também conta, então uma rajada contínua segue
+bloqueada até diminuir.
+
+Atrás do frontend, todas as requisições chegam do mesmo endereço. ProxyConfiavel lê o IP do
+navegador em X-Forwarded-For, mas só quando a requisição vem de um endereço listado em
+PROXIES_CONFIAVEIS; de qualquer outro cliente o cabeçalho é ignorado, para que não sirva
+para trocar de chave a cada tentativa.
+"""
+from flask import current_app, g, jsonify, request
+from prometheus_client import Counter
+from werkzeug.middleware.proxy_fix import ProxyFix
+from collections import OrderedDict
+import ipaddress
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+LIMITES_REJEITADAS = Counter('limites_rejeitadas', 'Requisições rejeitadas por limite de taxa', ['regra'])
+
+def ler_limite(valor):
+    """'20/60' -> (20, 60.0): 20 requisições a cada 60 segundos"""
+    quantidade, _, segundos = valor.partition('/')
+    return int(quantidade), float(segundos or 1)
+
+def _janela(agora, segundos):
+    """Número da janela fixa atual e fração dela já decorrida"""
+    posicao = agora / segundos
+    numero = math.floor(posicao)
+    return numero, posicao - numero
+
+def _estimar(anterior, atual, decorrido):
+    return anterior * (1 - decorrido) + atual
+
+class LimitesLocal:
+    """Contadores em memória do worker; as chaves menos usadas saem quando passa de max_chaves"""
+    nome = 'memoria'
+
+    def __init__(self, max_chaves=10000):
+        self.max_chaves = max_chaves
+        self._contadores = OrderedDict()  # chave -> [numero_janela, anterior, atual]
+        self._lock = threading.Lock()
+
+    def consumir(self, chave, quantidade, segundos):
+        """Conta a requisição; retorna 0 se permitida ou os segundos até liberar"""
+        numero, decorrido = _janela(time.time(), segundos)
+        with self._lock:
+            contador = self._contadores.get(chave)
+            if contador is None:
+                contador = self._contadores[chave] = [numero, 0, 0]
+                while len(self._contadores) > self.max_chaves:
+                    self._contadores.popitem(last=False)
+            else:
+                self._contadores.move_to_end(chave)
+            if contador[0] != numero:
+                # Passou uma janela: a atual vira anterior; passaram duas ou mais: zera
+                contador[1] = contador[2] if contador[0] == numero - 1 else 0
+                contador[0], contador[2] = numero, 0
+            contador[2] += 1
+            estimado = _estimar(contador[1], contador[2], decorrido)
+        return _espera(estimado, quantidade, segundos, decorrido)
+
+class LimitesRedis:
+    """
+    Contadores em um servidor que fala o protocolo do Redis, uma chave por janela que expira
+    sozinha. Falhas de conexão liberam a requisição em vez de derrubar o login.
+    """
+    nome = 'redis'
+
+    def __init__(self, cliente, prefixo='escola:limites:'):
+        self.cliente = cliente
+        self.prefixo = prefixo
+
+    def consumir(self, chave, quantidade, segundos):
+        import redis
+        numero, decorrido = _janela(time.time(), segundos)
+        atual = f'{self.prefixo}{chave}:{numero}'
+        try:
+            pipe = self.cliente.pipeline()
+            pipe.get(f'{self.prefixo}{chave}:{numero - 1}')
+            pipe.incr(atual)
+            pipe.expire(atual, math.ceil(segundos * 2))
+            anterior, contagem, _ = pipe.execute()
+        except redis.RedisError:
+            logger.warning('Armazenamento de limites Redis indisponível', exc_info=True)
+            return 0
+        estimado = _estimar(int(anterior or 0), contagem, decorrido)
+        return _espera(estimado, quantidade, segundos, decorrido)
+
+def _espera(estimado, quantidade, segundos, decorrido):
+    if estimado <= quantidade:
+        return 0
+    # Sem novas requisições, o peso da janela anterior cai até ela sair de vez
+    return max(1, math.ceil((1 - decorrido) * segundos))
+
+def criar_limites(config):
+    """Armazenamento dos contadores a partir de LIMITES_URL"""
+    url = config.get('LIMITES_URL') or 'memory://'
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        import redis
+        return LimitesRedis(redis.Redis.from_url(url, socket_timeout=0.5))
+    return LimitesLocal(max_chaves=config.get('LIMITES_MAX_CHAVES', 10000))
+
+class ProxyConfiavel:
+    """Aplica ProxyFix (um salto de X-Forwarded-For) só às requisições vindas dos proxies informados"""
+
+    def __init__(self, wsgi_app, proxies):
+        self.wsgi_app = wsgi_app
+        self.com_proxy = ProxyFix(wsgi_app, x_for=1)
+        self.redes = [ipaddress.ip_network(proxy, strict=False) for proxy in proxies]
+
+    def _confiavel(self, endereco):
+        try:
+            ip = ipaddress.ip_address(endereco or '')
+        except ValueError:
+            return False
+        return any(ip in rede for rede in self.redes)
+
+    def __call__(self, environ, start_response):
+        if self._confiavel(environ.get('REMOTE_ADDR')):
+            return self.com_proxy(environ, start_response)
+        return self.wsgi_app(environ, start_response)
+
+def ler_proxies(valor):
+    """PROXIES_CONFIAVEIS="172.28.0.10,10.0.0.0/24" -> lista de endereços/redes"""
+    return [proxy.strip() for proxy in (valor or '').split(',') if proxy.strip()]
+
+def por_ip():
+    return request.remote_addr or 'desconhecido'
+
+def por_login():
+    """Login informado no corpo (sem ele, a regra não se aplica)"""
+    dados = request.get_json(silent=True)
+    login = dados.get('login') if isinstance(dados, dict) else None
+    return login.strip().lower() if isinstance(login, str) and login.strip() else None
+
+def por_usuario():
+    """Usuário do token de acesso ou, em rota pública, o IP"""
+    usuario = g.get('usuario')
+    return f"usuario:{usuario['id_usuario']}" if usuario else por_ip()
+
+def limitar(blueprint, regra, chave=por_ip, endpoints=None):
+    """
+    Aplica a regra LIMITE_<REGRA> às requisições do blueprint (ou só às views em endpoints),
+    contando separadamente cada valor devolvido por chave(). Regra vazia na configuração
+    desativa o limite.
+    """
+    nome_config = f'LIMITE_{regra.upper()}'
+
+    @blueprint.before_request
+    def verificar_limite():
+        if request.method == 'OPTIONS':
+            return None
+        if endpoints is not None and request.endpoint.rpartition('.')[2] not in endpoints:
+            return None
+        valor = current_app.config.get(nome_config)
+        identificador = chave()
+        if not valor or identificador is None:
+            return None
+
+        quantidade, segundos = ler_limite(valor)
+        espera = current_app.extensions['limites'].consumir(f'{regra}:{identificador}', quantidade, segundos)
+        if espera:
+            LIMITES_REJEITADAS.labels(regra).inc()
+            return jsonify({'error': 'Muitas requisições, tente novamente em instantes'}), 429, {'Retry-After': str(espera)}
+        return None
@@ -0,0 +1,109 @@
+"""
+Migrações versionadas do banco (database/migracoes/NNN_descricao.sql).
+
+database/init.sql cria o esquema inicial; cada arquivo de database/migracoes é aplicado uma
+única vez, em ordem de versão, pelo comando `flask --app main migrar`, que registra a versão
+em migracoes_aplicadas. Os arquivos são SQL do PostgreSQL; no SQLite (testes) o esquema,
+incluindo os índices, vem de db.create_all() a partir dos modelos.
+
+Cada migração roda em uma transação, exceto as marcadas com "-- sem-transacao" na primeira
+linha (ex. CREATE INDEX CONCURRENTLY), cujos comandos rodam um a um em autocommit e por isso
+devem poder ser repetidos (IF NOT EXISTS / IF EXISTS) caso a migração falhe no meio. Um
+CREATE INDEX CONCURRENTLY interrompido deixa o índice criado, mas inválido, e o IF NOT EXISTS
+da nova tentativa o manteria assim; antes de rodar um desses arquivos, os índices que ele cria
+e que estão inválidos (pg_index.indisvalid) são removidos.
+"""
+from pathlib import Path
+from sqlalchemy import text
+import re
+
+DIRETORIO = Path(__file__).resolve().parent.parent / 'database' / 'migracoes'
+MARCADOR_SEM_TRANSACAO = '-- sem-transacao'
+
+# O SQL vai direto ao driver, sem interpretar '%' como marcador de parâmetro (ex. format('%I'))
+SEM_PARAMETROS = {'no_parameters': True}
+
+# Impede que dois processos apliquem as migrações ao mesmo tempo
+CHAVE_TRAVA = 741019
+
+def listar_migracoes(diretorio=DIRETORIO):
+    """[(versao, caminho)] dos arquivos NNN_*.sql, em ordem"""
+    migracoes = []
+    for caminho in Path(diretorio).glob('*.sql'):
+        versao = re.match(r'(\d+)_', caminho.name)
+        if versao:
+            migracoes.append((int(versao.group(1)), caminho))
+    return sorted(migracoes)
+
+def _comandos(sql):
+    """Comandos do arquivo, sem as linhas de comentário"""
+    linhas = [linha for linha in sql.splitlines() if not linha.lstrip().startswith('--')]
+    return [comando.strip() for comando in '\n'.join(linhas).split(';') if comando.strip()]
+
+def _indices_concorrentes(sql):
+    """Nomes dos índices criados com CREATE INDEX CONCURRENTLY no arquivo"""
+    nomes = []
+    for comando in _comandos(sql):
+        criado = re.match(r'CREATE (?:UNIQUE )?INDEX CONCURRENTLY (?:IF NOT EXISTS )?(\w+)', comando, re.IGNORECASE)
+        if criado:
+            nomes.append(criado.group(1))
+    return nomes
+
+def _remover_indices_invalidos(conexao, nomes):
+    """Remove os índices inválidos deixados por um CREATE INDEX CONCURRENTLY que falhou"""
+    if not nomes:
+        return []
+    invalidos = conexao.execute(text(
+        'SELECT classe.relname FROM pg_index indice JOIN pg_class classe ON classe.oid = indice.indexrelid '
+        'WHERE NOT indice.indisvalid AND classe.relname = ANY(:nomes) AND pg_table_is_visible(classe.oid)'
+    ), {'nomes': nomes}).scalars().all()
+    for nome in invalidos:
+        conexao.exec_driver_sql(f'DROP INDEX CONCURRENTLY IF EXISTS "{nome}"')
+    return invalidos
+
+def _aplicadas(conexao):
+    conexao.execute(text(
+        'CREATE TABLE IF NOT EXISTS migracoes_aplicadas ('
+        'versao INTEGER PRIMARY KEY, nome VARCHAR(255) NOT NULL, '
+        "aplicada_em TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'utc'))"
+    ))
+    return set(conexao.execute(text('SELECT versao FROM migracoes_aplicadas')).scalars())
+
+def migracoes_pendentes(engine, diretorio=DIRETORIO):
+    with engine.begin() as conexao:
+        aplicadas = _aplicadas(conexao)
+    return [(versao, caminho) for versao, caminho in listar_migracoes(diretorio) if versao not in aplicadas]
+
+def aplicar_migracoes(engine, diretorio=DIRETORIO):
+    """Aplica as migrações pendentes em ordem; retorna os nomes dos arquivos aplicados"""
+    if engine.dialect.name != 'postgresql':
+        raise RuntimeError('As migrações são escritas para PostgreSQL; use db.create_all() em outros bancos')
+
+    aplicados = []
+    # Trava de sessão em uma conexão sem transação aberta (CONCURRENTLY espera as transações abertas)
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as trava:
+        trava.execute(text('SELECT pg_advisory_lock(:chave)'), {'chave': CHAVE_TRAVA})
+        try:
+            for versao, caminho in migracoes_pendentes(engine, diretorio):
+                sql = caminho.read_text(encoding='utf-8')
+                if sql.lstrip().startswith(MARCADOR_SEM_TRANSACAO):
+                    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conexao:
+                        _remover_indices_invalidos(conexao, _indices_concorrentes(sql))
+                        for comando in _comandos(sql):
+                            conexao.exec_driver_sql(comando, execution_options=SEM_PARAMETROS)
+                    with engine.begin() as conexao:
+                        _registrar(conexao, versao, caminho)
+                else:
+                    with engine.begin() as conexao:
+                        conexao.exec_driver_sql(sql, execution_options=SEM_PARAMETROS)
+                        _registrar(conexao, versao, caminho)
+                aplicados.append(caminho.name)
+        finally:
+            trava.execute(text('SELECT pg_advisory_unlock(:chave)'), {'chave': CHAVE_TRAVA})
+    return aplicados
+
+def _registrar(conexao, versao, caminho):
+    conexao.execute(
+        text('INSERT INTO migracoes_aplicadas (versao, nome) VALUES (:versao, :nome)'),
+        {'versao': versao, 'nome': caminho.name}
+    )
@@ -24,6 +24,7 @@ class Professor(db.Model):
 
 class Turma(db.Model):
     __tablename__ = 'turmas'
+    __table_args__ = (db.Index('idx_turmas_professor', 'id_professor'),)
     
     id_turma = db.Column(db.Integer, primary_key=True, autoincrement=True)
     nome_turma = db.Column(db.String(50), nullable=False)
@@ -34,6 +35,7 @@ class Turma(db.Model):
 
 class Aluno(db.Model):
     __tablename__ = 'alunos'
+    __table_args__ = (db.Index('idx_alunos_turma_id', 'id_turma', 'id_aluno'),)
     
     id_aluno = db.Column(db.Integer, primary_key=True, autoincrement=True)
     nome_completo = db.Column(db.String(255), nullable=False)
@@ -47,8 +49,24 @@ class Aluno(db.Model):
     pagamentos = db.relationship('Pagamento', backref='aluno', lazy=True)
     presencas = db.relationship('Presenca', backref='aluno', lazy=True)
 
+# Busca por prefixo do nome sem diferenciar maiúsculas (LIKE 'ana%')
+db.Index('idx_alunos_nome_prefixo', db.func.lower(Aluno.nome_completo).label('nome_minusculo'),
+         postgresql_ops={'nome_minusculo': 'text_pattern_ops'})
+
 class Pagamento(db.Model):
     __tablename__ = 'pagamentos'
+    # Índices das consultas das rotas (database/migracoes/001_indices_compostos.sql)
+    __table_args__ = (
+        db.Index('idx_pagamentos_aluno', 'id_aluno'),
+        # Pendências por aluno (ChatBot) e relatório de inadimplência, sem ler os pagos
+        db.Index('idx_pagamentos_pendentes', 'id_aluno', 'id_pagamento',
+                 postgresql_include=['data_pagamento', 'valor_pago', 'referencia'],
+                 postgresql_where=db.text("status = 'Pendente'"),
+                 sqlite_where=db.text("status = 'Pendente'")),
+        # Relatório por período, com o status para os totais
+        db.Index('idx_pagamentos_data_status', 'data_pagamento', 'status',
+                 postgresql_include=['valor_pago']),
+    )
     
     id_pagamento = db.Column(db.Integer, primary_key=True, autoincrement=True)
     id_aluno = db.Column(db.Integer, db.ForeignKey('alunos.id_aluno'), nullable=False)
@@ -60,14 +78,33 @@ class Pagamento(db.Model):
 
 class Presenca(db.Model):
     __tablename__ = 'presencas'
+    # No PostgreSQL a tabela é particionada por ano de data_presenca (app.particoes) e a chave
+    # primária no banco é (id_presenca, data_presenca); id_presenca segue único pela sequência.
+    # A restrição única (id_aluno, data_presenca) atende as consultas por aluno e período
+    __table_args__ = (
+        db.UniqueConstraint('id_aluno', 'data_presenca'),
+        db.Index('idx_presencas_data_aluno', 'data_presenca', 'id_aluno', postgresql_include=['presente']),
+    )
     
     id_presenca = db.Column(db.Integer, primary_key=True, autoincrement=True)
     id_aluno = db.Column(db.Integer, db.ForeignKey('alunos.id_aluno'), nullable=False)
     data_presenca = db.Column(db.Date, nullable=False)
     presente = db.Column(db.Boolean, nullable=False)
 
+class FrequenciaMensal(db.Model):
+    """Resumo de presenças por aluno e mês, mantido a cada gravação em presencas"""
+    __tablename__ = 'frequencia_mensal'
+    __table_args__ = (db.Index('idx_frequencia_mensal_mes', 'mes', 'id_aluno'),)
+    
+    id_aluno = db.Column(db.Integer, db.ForeignKey('alunos.id_aluno', ondelete='CASCADE'), primary_key=True)
+    mes = db.Column(db.Date, primary_key=True)  # Primeiro dia do mês
+    id_turma = db.Column(db.Integer, db.ForeignKey('turmas.id_turma', ondelete='CASCADE'), nullable=False)
+    total_dias = db.Column(db.Integer, nullable=False)
+    dias_presentes = db.Column(db.Integer, nullable=False)
+
 class Atividade(db.Model):
     __tablename__ = 'atividades'
+    __table_args__ = (db.Index('idx_atividades_data_id', 'data_realizacao', 'id_atividade'),)
     
     id_atividade = db.Column(db.Integer, primary_key=True, autoincrement=True)
     descricao = db.Column(db.Text, nullable=False)
@@ -75,6 +112,63 @@ class Atividade(db.Model):
 
 class AtividadeAluno(db.Model):
     __tablename__ = 'atividade_aluno'
+    # A chave primária começa por id_atividade; as consultas por aluno usam este índice
+    __table_args__ = (db.Index('idx_atividade_aluno_aluno', 'id_aluno', 'id_atividade'),)
     
     id_atividade = db.Column(db.Integer, db.ForeignKey('atividades.id_atividade'), primary_key=True)
-    id_aluno = db.Column(db.Integer, db.ForeignKey('alunos.id_aluno'), primary_key=True)
\ No newline at end of file
+    id_aluno = db.Column(db.Integer, db.ForeignKey('alunos.id_aluno'), primary_key=True)
+
+class VersaoRecurso(db.Model):
+    """Versão de cada recurso da API, incrementada a cada gravação (ETag / Last-Modified)"""
+    __tablename__ = 'versoes_recursos'
+    
+    recurso = db.Column(db.String(50), primary_key=True)
+    versao = db.Column(db.BigInteger, nullable=False, default=1)
+    atualizado_em = db.Column(db.DateTime, nullable=False)
+
+class ConversaChatbot(db.Model):
+    """Mensagens trocadas com o ChatBot, gravadas em lote por app.registro_conversas"""
+    __tablename__ = 'conversas_chatbot'
+    __table_args__ = (
+        db.Index('idx_conversas_chatbot_criado_em', 'criado_em'),
+        db.Index('idx_conversas_chatbot_aluno', 'id_aluno', 'criado_em'),
+    )
+    
+    id_conversa = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    id_aluno = db.Column(db.Integer, db.ForeignKey('alunos.id_aluno', ondelete='SET NULL'), nullable=True)
+    mensagem = db.Column(db.Text, nullable=False)
+    intencao = db.Column(db.String(20), nullable=True)
+    resposta = db.Column(db.Text, nullable=False)
+    criado_em = db.Column(db.DateTime, nullable=False)
+
+class Importacao(db.Model):
+    """Importação em lote de alunos ou pagamentos (app.importacao), retomável a partir de ultima_linha"""
+    __tablename__ = 'importacoes'
+    
+    id_importacao = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    tipo = db.Column(db.String(20), nullable=False)  # alunos, pagamentos
+    nome_arquivo = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(20), nullable=False)  # em_andamento, concluida, interrompida
+    id_usuario = db.Column(db.Integer, db.ForeignKey('usuarios.id_usuario', ondelete='SET NULL'), nullable=True)
+    ultima_linha = db.Column(db.Integer, nullable=False, default=1)  # Última linha já gravada (1 = cabeçalho)
+    linhas_lidas = db.Column(db.Integer, nullable=False, default=0)
+    importadas = db.Column(db.Integer, nullable=False, default=0)
+    atualizadas = db.Column(db.Integer, nullable=False, default=0)
+    ignoradas = db.Column(db.Integer, nullable=False, default=0)
+    com_erro = db.Column(db.Integer, nullable=False, default=0)
+    mensagem = db.Column(db.Text, nullable=True)
+    criado_em = db.Column(db.DateTime, nullable=False)
+    atualizado_em = db.Column(db.DateTime, nullable=False)
+
+class ImportacaoErro(db.Model):
+    """Linha rejeitada em uma importação, com a coluna e o motivo"""
+    __tablename__ = 'importacao_erros'
+    __table_args__ = (
+        db.Index('idx_importacao_erros_linha', 'id_importacao', 'linha'),
+    )
+    
+    id_erro = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    id_importacao = db.Column(db.Integer, db.ForeignKey('importacoes.id_importacao', ondelete='CASCADE'), nullable=False)
+    linha = db.Column(db.Integer, nullable=False)
+    coluna = db.Column(db.String(50), nullable=True)
+    mensagem = db.Column(db.String(255), nullable=False)
@@ -0,0 +1,84 @@
+"""
+Partições anuais de presencas (PostgreSQL, migração 002_presencas_particionada).
+
+garantir_particoes cria as partições do ano atual e dos próximos PRESENCAS_ANOS_FUTUROS anos
+(comando `flask --app main particoes`, executado ao subir a API), para que a chamada do
+primeiro dia letivo do ano nunca caia na partição padrão. arquivar_particoes desanexa as
+partições dos anos anteriores ao informado e as move para o schema "arquivo" (ou as apaga):
+os relatórios desses anos continuam vindo de frequencia_mensal, que não é arquivada. Os anos
+anteriores à partição anexada mais antiga (primeiro_ano_ativo) ficam fechados: as rotas não
+gravam presenças neles e recalcular_frequencia não apaga o resumo deles.
+
+No SQLite (testes) presencas não é particionada e as funções não fazem nada.
+"""
+from sqlalchemy import text
+from datetime import date
+import re
+
+SCHEMA_ARQUIVO = 'arquivo'
+
+def particionada(conexao):
+    """Se presencas é uma tabela particionada neste banco"""
+    if conexao.dialect.name != 'postgresql':
+        return False
+    return bool(conexao.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('presencas'))"
+    )).scalar())
+
+def listar_particoes(conexao):
+    """[(ano, nome, linhas_estimadas)] das partições anuais, em ordem"""
+    linhas = conexao.execute(text(
+        'SELECT c.relname, c.reltuples FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+        "WHERE i.inhparent = to_regclass('presencas')"
+    )).all()
+    particoes = []
+    for nome, linhas_estimadas in linhas:
+        ano = re.fullmatch(r'presencas_(\d{4})', nome)
+        if ano:
+            particoes.append((int(ano.group(1)), nome, max(int(linhas_estimadas), 0)))
+    return sorted(particoes)
+
+def primeiro_ano_ativo(conexao):
+    """Ano da partição anexada mais antiga (None se presencas não é particionada)"""
+    if not particionada(conexao):
+        return None
+    particoes = listar_particoes(conexao)
+    return particoes[0][0] if particoes else None
+
+def criar_particoes(conexao, anos):
+    """Cria as partições que faltam; retorna os anos criados"""
+    return [
+        ano for ano in anos
+        if conexao.execute(text('SELECT criar_particao_presencas(:ano)'), {'ano': ano}).scalar()
+    ]
+
+def garantir_particoes(conexao, anos_futuros=1, hoje=None):
+    """Partições do ano atual e dos próximos anos_futuros anos"""
+    if not particionada(conexao):
+        return []
+    ano = (hoje or date.today()).year
+    return criar_particoes(conexao, range(ano, ano + anos_futuros + 1))
+
+def arquivar_particoes(conexao, antes_de, remover=False):
+    """
+    Desanexa as partições dos anos < antes_de e as move para o schema arquivo (ou apaga,
+    com remover=True). Retorna os nomes das partições arquivadas.
+    """
+    if not particionada(conexao):
+        return []
+    if antes_de > date.today().year:
+        raise ValueError('Não é possível arquivar o ano atual')
+    if not remover:
+        conexao.execute(text(f'CREATE SCHEMA IF NOT EXISTS {SCHEMA_ARQUIVO}'))
+
+    arquivadas = []
+    for ano, nome, _ in listar_particoes(conexao):
+        if ano >= antes_de:
+            break
+        conexao.execute(text(f'ALTER TABLE presencas DETACH PARTITION {nome}'))
+        if remover:
+            conexao.execute(text(f'DROP TABLE {nome}'))
+        else:
+            conexao.execute(text(f'ALTER TABLE {nome} SET SCHEMA {SCHEMA_ARQUIVO}'))
+        arquivadas.append(nome)
+    return arquivadas
@@ -0,0 +1,176 @@
+"""
+Profiling sob demanda de qualquer rota da API.
+
+Um administrador envia o cabeçalho X-Perfil na requisição:
+
+- "pstats": cProfile em volta da view; o resultado é o arquivo .prof do pstats (abre com
+  `python -m pstats`, snakeviz etc.);
+- "texto": o mesmo cProfile, já impresso pelo pstats (50 funções por tempo acumulado);
+- "speedscope": amostragem da pilha da requisição a cada PERFIL_INTERVALO_MS por uma
+  thread criada só para ela, no formato JSON do https://www.speedscope.app. Mede tempo de
+  parede (inclui a espera pelo banco) e quase não atrasa a rota.
+
+Por padrão o perfil substitui o corpo da resposta (o status original vai em
+X-Perfil-Status). Com "X-Perfil-Destino: arquivo" a resposta é a normal e o perfil é gravado
+em PERFIL_DIRETORIO, com o nome em X-Perfil-Arquivo; os arquivos são listados e baixados em
+/api/diagnostico/perfis. Funciona igual no app.run e nos workers do gunicorn: o perfil liga
+no before_request e desliga no after_request da própria requisição, na thread que a atende.
+Só um perfil por processo de cada vez (o cProfile não admite dois); o segundo recebe 409.
+
+Sem o cabeçalho, o custo é uma consulta a request.headers. PERFIL_HABILITADO=False
+desliga o recurso; usuários que não são administradores têm o cabeçalho ignorado.
+"""
+from flask import Response, current_app, g, jsonify, request
+from app.lentidao import _pilha
+from collections import Counter as Contagem
+from datetime import datetime
+from pathlib import Path
+import cProfile
+import io
+import json
+import marshal
+import os
+import pstats
+import sys
+import threading
+
+CABECALHO = 'X-Perfil'
+FORMATOS = ('pstats', 'texto', 'speedscope')
+EXTENSOES = {'pstats': '.prof', 'texto': '.txt', 'speedscope': '.speedscope.json'}
+LINHAS_TEXTO = 50
+
+# cProfile só aceita um profiler ativo por vez
+_em_andamento = threading.Lock()
+
+class AmostragemRequisicao:
+    """Thread que amostra a pilha de uma única thread até parar()"""
+
+    def __init__(self, thread, intervalo):
+        self.thread = thread
+        self.intervalo = intervalo
+        self.pilhas = Contagem()
+        self._parar = threading.Event()
+        self._executora = threading.Thread(target=self._executar, name='perfil-amostragem', daemon=True)
+        self._executora.start()
+
+    def _executar(self):
+        while not self._parar.wait(self.intervalo):
+            quadro = sys._current_frames().get(self.thread)
+            if quadro is not None:
+                self.pilhas[_pilha(quadro)] += 1
+
+    def parar(self):
+        self._parar.set()
+        self._executora.join()
+
+def instrumentar_perfil(app):
+    """Liga os hooks (depois de autenticar, que define g.usuario)"""
+    app.before_request(_iniciar_perfil)
+    app.after_request(_encerrar_perfil)
+    app.teardown_request(_descartar_perfil)
+
+def _iniciar_perfil():
+    formato = request.headers.get(CABECALHO)
+    if not formato or not current_app.config['PERFIL_HABILITADO']:
+        return None
+    usuario = g.get('usuario')
+    if usuario is None or usuario['nivel_acesso'] != 'administrador':
+        return None
+    formato = formato.strip().lower()
+    if formato not in FORMATOS:
+        return jsonify({'error': f"{CABECALHO} deve ser um de: {', '.join(FORMATOS)}"}), 400
+    if not _em_andamento.acquire(blocking=False):
+        return jsonify({'error': 'Outro perfil está em andamento neste worker'}), 409
+
+    try:
+        if formato == 'speedscope':
+            coletor = AmostragemRequisicao(threading.get_ident(), current_app.config['PERFIL_INTERVALO_MS'] / 1000)
+        else:
+            coletor = cProfile.Profile()
+            coletor.enable()
+    except Exception:
+        _em_andamento.release()
+        raise
+    g.perfil = (formato, coletor)
+    return None
+
+def _parar(coletor):
+    if isinstance(coletor, AmostragemRequisicao):
+        coletor.parar()
+    else:
+        coletor.disable()
+
+def _descartar_perfil(erro=None):
+    """Garante que o profiler para e a trava é liberada mesmo se a view levantar exceção"""
+    perfil = g.pop('perfil', None)
+    if perfil is not None:
+        _parar(perfil[1])
+        _em_andamento.release()
+
+def _encerrar_perfil(resposta):
+    perfil = g.pop('perfil', None)
+    if perfil is None:
+        return resposta
+    formato, coletor = perfil
+    try:
+        _parar(coletor)
+        conteudo = _exportar(formato, coletor)
+    finally:
+        _em_andamento.release()
+
+    nome = '{}-{}-{}{}'.format(
+        datetime.now().strftime('%Y%m%dT%H%M%S%f'), request.endpoint or 'desconhecido', os.getpid(), EXTENSOES[formato]
+    )
+    if request.headers.get('X-Perfil-Destino', '').lower() == 'arquivo':
+        diretorio = Path(current_app.config['PERFIL_DIRETORIO'])
+        diretorio.mkdir(parents=True, exist_ok=True)
+        (diretorio / nome).write_bytes(conteudo)
+        resposta.headers['X-Perfil-Arquivo'] = nome
+        return resposta
+
+    if formato == 'texto':
+        return Response(conteudo, mimetype='text/plain', headers={'X-Perfil-Status': str(resposta.status_code)})
+    return Response(conteudo, mimetype='application/json' if formato == 'speedscope' else 'application/octet-stream', headers={
+        'X-Perfil-Status': str(resposta.status_code),
+        'Content-Disposition': f'attachment; filename="{nome}"',
+    })
+
+def _exportar(formato, coletor):
+    if formato == 'speedscope':
+        return json.dumps(speedscope(coletor.pilhas, coletor.intervalo, request.endpoint)).encode('utf-8')
+    coletor.create_stats()
+    if formato == 'pstats':
+        return marshal.dumps(coletor.stats)  # Mesmo conteúdo que Profile.dump_stats grava
+    saida = io.StringIO()
+    pstats.Stats(coletor, stream=saida).sort_stats('cumulative').print_stats(LINHAS_TEXTO)
+    return saida.getvalue().encode('utf-8')
+
+def speedscope(pilhas, intervalo, nome):
+    """Perfil amostrado do speedscope a partir das pilhas folded ('arquivo:funcao:linha;...')"""
+    quadros, indices = [], {}
+    amostras, pesos = [], []
+    for pilha, quantidade in pilhas.items():
+        amostra = []
+        for parte in pilha.split(';'):
+            if parte not in indices:
+                arquivo, funcao, linha = parte.rsplit(':', 2)
+                indices[parte] = len(quadros)
+                quadros.append({'name': funcao, 'file': arquivo, 'line': int(linha) if linha.isdigit() else 0})
+            amostra.append(indices[parte])
+        amostras.append(amostra)
+        pesos.append(round(quantidade * intervalo * 1000, 3))
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': nome,
+        'exporter': 'escola-infantil',
+        'shared': {'frames': quadros},
+        'profiles': [{
+            'type': 'sampled',
+            'name': nome,
+            'unit': 'milliseconds',
+            'startValue': 0,
+            'endValue': round(sum(pesos), 3),
+            'samples': amostras,
+            'weights': pesos,
+        }],
+    }
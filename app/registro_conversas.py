@@ -0,0 +1,133 @@
+"""
+Registro das conversas do ChatBot fora do caminho da requisição.
+
+A rota só coloca a conversa em uma fila limitada em memória; uma thread do worker esvazia
+a fila e grava as conversas em lotes na tabela conversas_chatbot. Com a fila cheia a
+conversa espera no máximo CHATBOT_LOG_ESPERA segundos por espaço e depois é descartada
+(contada em chatbot_conversas_descartadas), para que o banco lento nunca atrase o chat.
+Ao encerrar o processo o que estiver na fila é gravado antes da saída. Se o INSERT do lote
+falhar, as conversas são regravadas uma a uma, para que uma linha ruim não descarte as demais.
+"""
+from prometheus_client import Counter, Gauge
+from sqlalchemy import insert
+import atexit
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CONVERSAS_NA_FILA = Gauge('chatbot_conversas_na_fila', 'Conversas aguardando gravação no banco')
+CONVERSAS_DESCARTADAS = Counter('chatbot_conversas_descartadas', 'Conversas descartadas com a fila cheia')
+CONVERSAS_GRAVADAS = Counter('chatbot_conversas_gravadas', 'Conversas gravadas no banco')
+CONVERSAS_FALHAS = Counter('chatbot_conversas_falhas', 'Conversas perdidas por erro ao gravar o lote')
+
+_FIM = object()
+
+class RegistroConversas:
+    def __init__(self, app, tamanho_fila=1000, tamanho_lote=100, intervalo=1.0, espera=0.0):
+        self.app = app
+        self.tamanho_lote = tamanho_lote
+        self.intervalo = intervalo
+        self.espera = espera
+        self.fila = queue.Queue(maxsize=tamanho_fila)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def registrar(self, **conversa):
+        """Enfileira a conversa; retorna False se ela foi descartada por falta de espaço"""
+        self._iniciar()
+        try:
+            if self.espera > 0:
+                self.fila.put(conversa, timeout=self.espera)
+            else:
+                self.fila.put_nowait(conversa)
+        except queue.Full:
+            CONVERSAS_DESCARTADAS.inc()
+            return False
+        CONVERSAS_NA_FILA.inc()
+        return True
+
+    def descarregar(self):
+        """Bloqueia até que tudo o que foi enfileirado tenha sido gravado (ou descartado por erro)"""
+        if self._thread is not None:
+            self.fila.join()
+
+    def encerrar(self, timeout=10):
+        """Grava o que restou na fila e para a thread (registrado no atexit)"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self.fila.put(_FIM)
+        thread.join(timeout)
+
+    def _iniciar(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._executar, name='registro-conversas', daemon=True)
+                self._thread.start()
+                atexit.register(self.encerrar)
+
+    def _executar(self):
+        encerrar = False
+        while not encerrar:
+            lote = []
+            for item in self._lote(self.fila.get()):
+                if item is _FIM:
+                    encerrar = True
+                else:
+                    lote.append(item)
+
+            try:
+                if lote:
+                    self._gravar(lote)
+            finally:
+                for _ in range(len(lote) + encerrar):
+                    self.fila.task_done()
+
+    def _lote(self, primeiro):
+        """O primeiro item e o que chegar em até intervalo segundos, até tamanho_lote itens"""
+        yield primeiro
+        if primeiro is _FIM:
+            return
+        limite = time.monotonic() + self.intervalo
+        for _ in range(self.tamanho_lote - 1):
+            restante = limite - time.monotonic()
+            try:
+                item = self.fila.get(timeout=restante) if restante > 0 else self.fila.get_nowait()
+            except queue.Empty:
+                return
+            yield item
+            if item is _FIM:
+                return
+
+    def _gravar(self, lote):
+        from app import db
+        from app.models import ConversaChatbot
+        CONVERSAS_NA_FILA.dec(len(lote))
+        with self.app.app_context():
+            try:
+                db.session.execute(insert(ConversaChatbot), lote)
+                db.session.commit()
+                CONVERSAS_GRAVADAS.inc(len(lote))
+            except Exception:
+                db.session.rollback()
+                logger.warning('Erro ao gravar o lote de %d conversas do chatbot; gravando uma a uma', len(lote), exc_info=True)
+                self._gravar_uma_a_uma(lote)
+
+    def _gravar_uma_a_uma(self, lote):
+        from app import db
+        from app.models import ConversaChatbot
+        for conversa in lote:
+            try:
+                db.session.execute(insert(ConversaChatbot), [conversa])
+                db.session.commit()
+                CONVERSAS_GRAVADAS.inc()
+            except Exception:
+                db.session.rollback()
+                CONVERSAS_FALHAS.inc()
+                logger.exception('Erro ao gravar a conversa do chatbot (aluno %s)', conversa.get('id_aluno'))
@@ -1,36 +1,170 @@
-from flask import Blueprint, request, jsonify
-from app.models import Aluno
+from flask import Blueprint, request, jsonify, url_for
+from app.models import Aluno, FrequenciaMensal
 from app import db
+from app.exportacao import formato_exportacao, exportar
+from app.serializacao import serializar_aluno
 from datetime import datetime
+from sqlalchemy import func
+import re
+from app.cache import em_cache, invalidar_cache
+from app.versoes import condicional, registrar_alteracao
+from app.tokens import GESTAO, restringir
 
 alunos_bp = Blueprint('alunos', __name__)
+restringir(alunos_bp, escrita=GESTAO)
+
+LIMITE_PADRAO = 100
+LIMITE_MAXIMO = 1000
+
+def _tags_alunos():
+    """Listagens filtradas por turma também são invalidadas pelas gravações na turma"""
+    id_turma = request.args.get('id_turma')
+    return [f'alunos:turma:{id_turma}'] if id_turma else []
 
 @alunos_bp.route('/', methods=['GET'])
+@condicional('alunos')
+@em_cache('alunos', tags=_tags_alunos)
 def get_alunos():
     """
-    Listar todos os alunos
+    Listar alunos (paginação por cursor)
     ---
     tags:
       - Alunos
+    parameters:
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Quantidade máxima de alunos por página (padrão 100, máximo 1000)
+        example: 100
+      - name: after
+        in: query
+        type: integer
+        required: false
+        description: Cursor (id_aluno do último registro da página anterior)
+        example: 100
+      - name: id_turma
+        in: query
+        type: integer
+        required: false
+        description: Filtrar por turma
+        example: 1
+      - name: nome
+        in: query
+        type: string
+        required: false
+        description: Prefixo do nome do aluno (sem diferenciar maiúsculas)
+        example: "Luc"
+      - name: nascimento_inicio
+        in: query
+        type: string
+        required: false
+        description: Data de nascimento mínima (YYYY-MM-DD)
+        example: "2020-01-01"
+      - name: nascimento_fim
+        in: query
+        type: string
+        required: false
+        description: Data de nascimento máxima (YYYY-MM-DD)
+        example: "2021-12-31"
+      - name: count
+        in: query
+        type: boolean
+        required: false
+        description: Se verdadeiro, retorna o total de registros no cabeçalho X-Total-Count
+        example: true
+      - name: format
+        in: query
+        type: string
+        required: false
+        enum: [ndjson, csv]
+        description: Exporta todos os alunos filtrados em streaming (também pelo cabeçalho Accept)
     responses:
       200:
-        description: Lista de alunos
+        description: Página de alunos. O cursor da próxima página vem nos cabeçalhos X-Next-Cursor e Link
         schema:
           type: array
           items:
             $ref: '#/definitions/Aluno'
+      400:
+        description: Parâmetros inválidos
     """
-    alunos = Aluno.query.all()
-    return jsonify([{
-        'id_aluno': aluno.id_aluno,
-        'nome_completo': aluno.nome_completo,
-        'data_nascimento': aluno.data_nascimento.isoformat(),
-        'id_turma': aluno.id_turma,
-        'nome_responsavel': aluno.nome_responsavel,
-        'telefone_responsavel': aluno.telefone_responsavel,
-        'email_responsavel': aluno.email_responsavel,
-        'informacoes_adicionais': aluno.informacoes_adicionais
-    } for aluno in alunos])
+    formato = formato_exportacao()
+    if formato:
+        # Exportação: todos os alunos que atendem aos filtros, sem paginação
+        try:
+            query = _filtrar_alunos(Aluno.query, request.args)
+        except ValueError:
+            return jsonify({'error': 'Filtro inválido'}), 400
+        return exportar(query.with_entities(
+            Aluno.id_aluno,
+            Aluno.nome_completo,
+            Aluno.data_nascimento,
+            Aluno.id_turma,
+            Aluno.nome_responsavel,
+            Aluno.telefone_responsavel,
+            Aluno.email_responsavel,
+            Aluno.informacoes_adicionais
+        ).order_by(Aluno.id_aluno).statement, 'alunos', formato)
+    
+    try:
+        limite = int(request.args.get('limit', LIMITE_PADRAO))
+        after = int(request.args['after']) if request.args.get('after') else None
+    except ValueError:
+        return jsonify({'error': 'Parâmetros limit e after devem ser inteiros'}), 400
+
+    if limite < 1:
+        return jsonify({'error': 'Parâmetro limit deve ser maior que zero'}), 400
+    limite = min(limite, LIMITE_MAXIMO)
+
+    try:
+        query = _filtrar_alunos(Aluno.query, request.args)
+    except ValueError:
+        return jsonify({'error': 'Filtro inválido'}), 400
+
+    # Keyset: busca um registro a mais para saber se existe próxima página
+    pagina = query
+    if after is not None:
+        pagina = pagina.filter(Aluno.id_aluno > after)
+    alunos = pagina.order_by(Aluno.id_aluno).limit(limite + 1).all()
+
+    tem_proxima = len(alunos) > limite
+    alunos = alunos[:limite]
+
+    response = jsonify([serializar_aluno(aluno) for aluno in alunos])
+
+    if tem_proxima:
+        cursor = alunos[-1].id_aluno
+        args = request.args.to_dict()
+        args.update({'after': cursor, 'limit': limite})
+        args.pop('count', None)
+        response.headers['X-Next-Cursor'] = str(cursor)
+        response.headers['Link'] = f'<{url_for("alunos.get_alunos", **args)}>; rel="next"'
+
+    # O total é opcional e calculado em consulta separada, sem cursor nem limite
+    if request.args.get('count', '').lower() in ('1', 'true', 'sim'):
+        response.headers['X-Total-Count'] = str(query.order_by(None).count())
+
+    return response
+
+def _filtrar_alunos(query, args):
+    """Aplica os filtros de listagem de alunos na consulta"""
+    if args.get('id_turma'):
+        query = query.filter(Aluno.id_turma == int(args['id_turma']))
+
+    if args.get('nome'):
+        prefixo = re.sub(r'([\\%_])', r'\\\1', args['nome'].strip().lower())
+        query = query.filter(func.lower(Aluno.nome_completo).like(prefixo + '%', escape='\\'))
+
+    if args.get('nascimento_inicio'):
+        inicio = datetime.strptime(args['nascimento_inicio'], '%Y-%m-%d').date()
+        query = query.filter(Aluno.data_nascimento >= inicio)
+
+    if args.get('nascimento_fim'):
+        fim = datetime.strptime(args['nascimento_fim'], '%Y-%m-%d').date()
+        query = query.filter(Aluno.data_nascimento <= fim)
+
+    return query
 
 @alunos_bp.route('/', methods=['POST'])
 def create_aluno():
@@ -73,7 +207,9 @@ def create_aluno():
         )
         
         db.session.add(aluno)
+        registrar_alteracao('alunos')
         db.session.commit()
+        invalidar_cache('alunos')
         
         return jsonify({'message': 'Aluno criado com sucesso', 'id': aluno.id_aluno}), 201
         
@@ -84,6 +220,8 @@ def create_aluno():
         return jsonify({'error': 'Erro ao criar aluno'}), 500
 
 @alunos_bp.route('/<int:id_aluno>', methods=['GET'])
+@condicional('alunos')
+@em_cache('alunos')
 def get_aluno(id_aluno):
     """
     Buscar aluno específico
@@ -105,16 +243,7 @@ def get_aluno(id_aluno):
         description: Aluno não encontrado
     """
     aluno = Aluno.query.get_or_404(id_aluno)
-    return jsonify({
-        'id_aluno': aluno.id_aluno,
-        'nome_completo': aluno.nome_completo,
-        'data_nascimento': aluno.data_nascimento.isoformat(),
-        'id_turma': aluno.id_turma,
-        'nome_responsavel': aluno.nome_responsavel,
-        'telefone_responsavel': aluno.telefone_responsavel,
-        'email_responsavel': aluno.email_responsavel,
-        'informacoes_adicionais': aluno.informacoes_adicionais
-    })
+    return jsonify(serializar_aluno(aluno))
 
 @alunos_bp.route('/<int:id_aluno>', methods=['PUT'])
 def update_aluno(id_aluno):
@@ -150,8 +279,10 @@ def update_aluno(id_aluno):
             aluno.nome_completo = data['nome_completo']
         if 'data_nascimento' in data:
             aluno.data_nascimento = datetime.strptime(data['data_nascimento'], '%Y-%m-%d').date()
-        if 'id_turma' in data:
+        if 'id_turma' in data and data['id_turma'] != aluno.id_turma:
             aluno.id_turma = data['id_turma']
+            # Mantém a turma do resumo de frequência em dia com a turma atual do aluno
+            FrequenciaMensal.query.filter_by(id_aluno=id_aluno).update({'id_turma': data['id_turma']})
         if 'nome_responsavel' in data:
             aluno.nome_responsavel = data['nome_responsavel']
         if 'telefone_responsavel' in data:
@@ -161,7 +292,9 @@ def update_aluno(id_aluno):
         if 'informacoes_adicionais' in data:
             aluno.informacoes_adicionais = data['informacoes_adicionais']
         
+        registrar_alteracao('alunos')
         db.session.commit()
+        invalidar_cache('alunos', f'chatbot:aluno:{id_aluno}')
         return jsonify({'message': 'Aluno atualizado com sucesso'})
         
     except ValueError:
@@ -192,7 +325,9 @@ def delete_aluno(id_aluno):
     
     try:
         db.session.delete(aluno)
+        registrar_alteracao('alunos')
         db.session.commit()
+        invalidar_cache('alunos', f'chatbot:aluno:{id_aluno}')
         return jsonify({'message': 'Aluno excluído com sucesso'})
     except Exception as e:
         db.session.rollback()
@@ -1,18 +1,55 @@
 from flask import Blueprint, request, jsonify
 from app.models import Atividade, AtividadeAluno, Aluno, Turma
 from app import db
+from app.dialeto import insert_ignorando_conflitos
+from app.exportacao import formato_exportacao, exportar
+from app.serializacao import serializar_atividade
 from datetime import datetime
-from sqlalchemy import and_
+from sqlalchemy import and_, literal, select
+from collections import defaultdict
+from itertools import chain, groupby
+from app.cache import invalidar_cache
+from app.versoes import condicional, registrar_alteracao
+from app.tokens import restringir
+from app.limites import limitar, por_usuario
 
 atividades_bp = Blueprint('atividades', __name__)
+restringir(atividades_bp)
+limitar(atividades_bp, 'relatorios', por_usuario, endpoints={'relatorio_atividades_periodo'})
 
 @atividades_bp.route('/', methods=['GET'])
+@condicional('atividades', 'alunos', 'turmas')
 def get_atividades():
     """
-    Listar todas as atividades
+    Listar atividades (com filtro opcional de período e turma)
     ---
     tags:
       - Atividades
+    parameters:
+      - name: data_inicio
+        in: query
+        type: string
+        required: false
+        description: Data de início (YYYY-MM-DD)
+        example: "2024-06-01"
+      - name: data_fim
+        in: query
+        type: string
+        required: false
+        description: Data de fim (YYYY-MM-DD)
+        example: "2024-06-30"
+      - name: id_turma
+        in: query
+        type: integer
+        required: false
+        description: Apenas atividades (e participantes) da turma
+        example: 1
+      - name: format
+        in: query
+        type: string
+        required: false
+        enum: [ndjson, csv]
+        description: Exportação em streaming (também pode ser escolhida pelo cabeçalho Accept). No CSV há uma linha por participante
     responses:
       200:
         description: Lista de atividades cadastradas
@@ -29,26 +66,115 @@ def get_atividades():
             }
           ]
     """
-    atividades = Atividade.query.all()
-    result = []
+    id_turma = request.args.get('id_turma', type=int)
     
-    for atividade in atividades:
-        # Buscar alunos associados à atividade
-        alunos_atividade = db.session.query(AtividadeAluno, Aluno).join(
-            Aluno, AtividadeAluno.id_aluno == Aluno.id_aluno
-        ).filter(AtividadeAluno.id_atividade == atividade.id_atividade).all()
-        
-        result.append({
-            'id_atividade': atividade.id_atividade,
-            'descricao': atividade.descricao,
-            'data_realizacao': atividade.data_realizacao.isoformat(),
-            'alunos': [{
-                'id_aluno': aluno.id_aluno,
-                'nome_completo': aluno.nome_completo
-            } for _, aluno in alunos_atividade]
-        })
+    try:
+        query = _filtrar_atividades(request.args.get('data_inicio'), request.args.get('data_fim'), id_turma)
+    except ValueError:
+        return jsonify({'error': 'Formato de data inválido'}), 400
+    
+    formato = formato_exportacao()
+    if formato:
+        return _exportar_atividades(query, id_turma, formato)
+    
+    atividades = query.order_by(Atividade.data_realizacao, Atividade.id_atividade).all()
+    participantes = _participantes_por_atividade(query, id_turma)
+    
+    return jsonify([{
+        **serializar_atividade(atividade),
+        'alunos': [{
+            'id_aluno': p['id_aluno'],
+            'nome_completo': p['nome_completo']
+        } for p in participantes.get(atividade.id_atividade, [])]
+    } for atividade in atividades])
+
+def _exportar_atividades(query, id_turma, formato):
+    """Exporta atividades e participantes lendo um único join ordenado por atividade"""
+    condicao = AtividadeAluno.id_atividade == Atividade.id_atividade
+    if id_turma is not None:
+        condicao = and_(condicao, AtividadeAluno.id_aluno.in_(
+            select(Aluno.id_aluno).where(Aluno.id_turma == id_turma)
+        ))
+    
+    consulta = query.with_entities(
+        Atividade.id_atividade,
+        Atividade.descricao,
+        Atividade.data_realizacao,
+        Aluno.id_aluno,
+        Aluno.nome_completo
+    ).outerjoin(
+        AtividadeAluno, condicao
+    ).outerjoin(
+        Aluno, AtividadeAluno.id_aluno == Aluno.id_aluno
+    ).order_by(Atividade.data_realizacao, Atividade.id_atividade, Aluno.id_aluno).statement
+    
+    def agrupar(linhas):
+        # As linhas chegam ordenadas, então cada atividade é um bloco contíguo
+        for id_atividade, bloco in groupby(linhas, key=lambda linha: linha['id_atividade']):
+            primeira = next(bloco)
+            yield {
+                'id_atividade': id_atividade,
+                'descricao': primeira['descricao'],
+                'data_realizacao': primeira['data_realizacao'],
+                'alunos': [{
+                    'id_aluno': linha['id_aluno'],
+                    'nome_completo': linha['nome_completo']
+                } for linha in chain([primeira], bloco) if linha['id_aluno'] is not None]
+            }
+    
+    return exportar(consulta, 'atividades', formato, agrupar)
+
+def _filtrar_atividades(data_inicio=None, data_fim=None, id_turma=None):
+    """Monta a consulta de atividades com filtro de período e de turma aplicados no SQL"""
+    query = Atividade.query
+    
+    if data_inicio:
+        query = query.filter(Atividade.data_realizacao >= datetime.strptime(data_inicio, '%Y-%m-%d').date())
+    if data_fim:
+        query = query.filter(Atividade.data_realizacao <= datetime.strptime(data_fim, '%Y-%m-%d').date())
+    
+    if id_turma is not None:
+        # Apenas atividades com pelo menos um participante da turma
+        query = query.filter(
+            db.session.query(AtividadeAluno.id_atividade).join(
+                Aluno, AtividadeAluno.id_aluno == Aluno.id_aluno
+            ).filter(
+                AtividadeAluno.id_atividade == Atividade.id_atividade,
+                Aluno.id_turma == id_turma
+            ).exists()
+        )
     
-    return jsonify(result)
+    return query
+
+def _participantes_por_atividade(atividades_query, id_turma=None):
+    """
+    Busca em uma única consulta os participantes (com o nome da turma) de todas as
+    atividades selecionadas por atividades_query e agrupa por id_atividade
+    """
+    ids_atividades = atividades_query.with_entities(Atividade.id_atividade).order_by(None).statement
+    
+    query = db.session.query(
+        AtividadeAluno.id_atividade,
+        Aluno.id_aluno,
+        Aluno.nome_completo,
+        Turma.nome_turma
+    ).join(
+        Aluno, AtividadeAluno.id_aluno == Aluno.id_aluno
+    ).outerjoin(
+        Turma, Aluno.id_turma == Turma.id_turma
+    ).filter(AtividadeAluno.id_atividade.in_(ids_atividades))
+    
+    if id_turma is not None:
+        query = query.filter(Aluno.id_turma == id_turma)
+    
+    participantes = defaultdict(list)
+    for linha in query.order_by(AtividadeAluno.id_atividade, Aluno.id_aluno):
+        participantes[linha.id_atividade].append({
+            'id_aluno': linha.id_aluno,
+            'nome_completo': linha.nome_completo,
+            'turma': linha.nome_turma
+        })
+    return participantes
 
 @atividades_bp.route('/', methods=['POST'])
 def create_atividade():
@@ -81,6 +207,11 @@ def create_atividade():
             id_turma:
               type: integer
               example: 1
+            turmas:
+              type: array
+              items:
+                type: integer
+              example: [1, 2]
     responses:
       201:
         description: Atividade criada com sucesso
@@ -114,33 +245,18 @@ def create_atividade():
         db.session.add(atividade)
         db.session.flush()  # Para obter o ID da atividade
         
-        # Associar alunos à atividade
-        if 'alunos' in data and isinstance(data['alunos'], list):
-            for id_aluno in data['alunos']:
-                atividade_aluno = AtividadeAluno(
-                    id_atividade=atividade.id_atividade,
-                    id_aluno=id_aluno
-                )
-                db.session.add(atividade_aluno)
+        # Associar alunos e turmas inteiras à atividade (se especificado)
+        ids_alunos = data['alunos'] if isinstance(data.get('alunos'), list) else []
+        ids_turmas = data['turmas'] if isinstance(data.get('turmas'), list) else []
+        if data.get('id_turma') is not None:
+            ids_turmas = ids_turmas + [data['id_turma']]
         
-        # Associar turma inteira à atividade (se especificado)
-        if 'id_turma' in data:
-            alunos_turma = Aluno.query.filter_by(id_turma=data['id_turma']).all()
-            for aluno in alunos_turma:
-                # Verificar se o aluno já não foi adicionado individualmente
-                existe = AtividadeAluno.query.filter_by(
-                    id_atividade=atividade.id_atividade,
-                    id_aluno=aluno.id_aluno
-                ).first()
-                
-                if not existe:
-                    atividade_aluno = AtividadeAluno(
-                        id_atividade=atividade.id_atividade,
-                        id_aluno=aluno.id_aluno
-                    )
-                    db.session.add(atividade_aluno)
+        _associar_alunos(atividade.id_atividade, ids_alunos, ids_turmas)
         
+        registrar_alteracao('atividades')
         db.session.commit()
+        # Turmas inteiras podem ter sido associadas: invalida as respostas de todos os alunos
+        invalidar_cache('chatbot:atividade')
         
         return jsonify({'message': 'Atividade criada com sucesso', 'id': atividade.id_atividade}), 201
         
@@ -150,7 +266,42 @@ def create_atividade():
         db.session.rollback()
         return jsonify({'error': 'Erro ao criar atividade'}), 500
 
+def _associar_alunos(id_atividade, ids_alunos=(), ids_turmas=()):
+    """
+    Inscreve alunos (individualmente e por turma) na atividade com comandos em lote,
+    ignorando os que já estão associados
+    """
+    tabela = AtividadeAluno.__table__
+    ids_alunos = list(dict.fromkeys(ids_alunos))
+    insert = insert_ignorando_conflitos(tabela)
+    
+    if insert is not None:
+        if ids_alunos:
+            db.session.execute(insert, [
+                {'id_atividade': id_atividade, 'id_aluno': id_aluno} for id_aluno in ids_alunos
+            ])
+        if ids_turmas:
+            # INSERT ... SELECT: todos os alunos das turmas em um único comando
+            alunos_turmas = select(literal(id_atividade, db.Integer), Aluno.id_aluno).where(
+                Aluno.id_turma.in_(ids_turmas)
+            )
+            db.session.execute(insert.from_select(['id_atividade', 'id_aluno'], alunos_turmas))
+        return
+    
+    # Bancos sem ON CONFLICT: calcula os novos em memória e insere com executemany
+    if ids_turmas:
+        ids_alunos += [id_aluno for (id_aluno,) in
+                       db.session.query(Aluno.id_aluno).filter(Aluno.id_turma.in_(ids_turmas))]
+    existentes = {id_aluno for (id_aluno,) in
+                  db.session.query(AtividadeAluno.id_aluno).filter_by(id_atividade=id_atividade)}
+    novos = [id_aluno for id_aluno in dict.fromkeys(ids_alunos) if id_aluno not in existentes]
+    if novos:
+        db.session.execute(tabela.insert(), [
+            {'id_atividade': id_atividade, 'id_aluno': id_aluno} for id_aluno in novos
+        ])
+
 @atividades_bp.route('/<int:id_atividade>', methods=['GET'])
+@condicional('atividades', 'alunos', 'turmas')
 def get_atividade(id_atividade):
     """
     Buscar uma atividade pelo ID
@@ -181,23 +332,16 @@ def get_atividade(id_atividade):
     """
     atividade = Atividade.query.get_or_404(id_atividade)
     
-    # Buscar alunos associados à atividade
-    alunos_atividade = db.session.query(AtividadeAluno, Aluno).join(
-        Aluno, AtividadeAluno.id_aluno == Aluno.id_aluno
-    ).filter(AtividadeAluno.id_atividade == id_atividade).all()
+    # Buscar alunos associados à atividade (com o nome da turma na mesma consulta)
+    participantes = _participantes_por_atividade(Atividade.query.filter_by(id_atividade=id_atividade))
     
     return jsonify({
-        'id_atividade': atividade.id_atividade,
-        'descricao': atividade.descricao,
-        'data_realizacao': atividade.data_realizacao.isoformat(),
-        'alunos': [{
-            'id_aluno': aluno.id_aluno,
-            'nome_completo': aluno.nome_completo,
-            'turma': aluno.turma.nome_turma if aluno.turma else None
-        } for _, aluno in alunos_atividade]
+        **serializar_atividade(atividade),
+        'alunos': participantes.get(id_atividade, [])
     })
 
 @atividades_bp.route('/aluno/<int:id_aluno>', methods=['GET'])
+@condicional('atividades', 'alunos', 'turmas')
 def get_atividades_aluno(id_aluno):
     """
     Listar atividades de um aluno (com filtro de período)
@@ -263,14 +407,11 @@ def get_atividades_aluno(id_aluno):
     return jsonify({
         'id_aluno': id_aluno,
         'total_atividades': len(atividades_aluno),
-        'atividades': [{
-            'id_atividade': atividade.id_atividade,
-            'descricao': atividade.descricao,
-            'data_realizacao': atividade.data_realizacao.isoformat()
-        } for _, atividade in atividades_aluno]
+        'atividades': [serializar_atividade(atividade) for _, atividade in atividades_aluno]
     })
 
 @atividades_bp.route('/turma/<int:id_turma>', methods=['GET'])
+@condicional('atividades', 'alunos', 'turmas')
 def get_atividades_turma(id_turma):
     """
     Listar atividades de uma turma (com filtro de período)
@@ -347,14 +488,11 @@ def get_atividades_turma(id_turma):
     return jsonify({
         'id_turma': id_turma,
         'total_atividades': len(atividades),
-        'atividades': [{
-            'id_atividade': atividade.id_atividade,
-            'descricao': atividade.descricao,
-            'data_realizacao': atividade.data_realizacao.isoformat()
-        } for atividade in atividades]
+        'atividades': [serializar_atividade(atividade) for atividade in atividades]
     })
 
 @atividades_bp.route('/relatorio/periodo', methods=['GET'])
+@condicional('atividades', 'alunos', 'turmas')
 def relatorio_atividades_periodo():
     """
     Relatório de atividades por período (e por turma)
@@ -408,56 +546,36 @@ def relatorio_atividades_periodo():
     """
     data_inicio = request.args.get('data_inicio')
     data_fim = request.args.get('data_fim')
-    id_turma = request.args.get('id_turma')
+    id_turma = request.args.get('id_turma', type=int)
     
     if not data_inicio or not data_fim:
         return jsonify({'error': 'Datas de início e fim são obrigatórias'}), 400
     
     try:
-        data_inicio = datetime.strptime(data_inicio, '%Y-%m-%d').date()
-        data_fim = datetime.strptime(data_fim, '%Y-%m-%d').date()
-        
-        query = Atividade.query.filter(
-            and_(Atividade.data_realizacao >= data_inicio,
-                 Atividade.data_realizacao <= data_fim)
-        )
-        
-        atividades = query.all()
-        
-        relatorio = []
-        for atividade in atividades:
-            # Buscar alunos participantes
-            alunos_atividade = db.session.query(AtividadeAluno, Aluno).join(
-                Aluno, AtividadeAluno.id_aluno == Aluno.id_aluno
-            ).filter(AtividadeAluno.id_atividade == atividade.id_atividade).all()
-            
-            # Filtrar por turma se especificado
-            if id_turma:
-                alunos_atividade = [(aa, aluno) for aa, aluno in alunos_atividade 
-                                   if aluno.id_turma == int(id_turma)]
-            
-            if not id_turma or alunos_atividade:  # Incluir se não há filtro de turma ou se há alunos da turma
-                relatorio.append({
-                    'id_atividade': atividade.id_atividade,
-                    'descricao': atividade.descricao,
-                    'data_realizacao': atividade.data_realizacao.isoformat(),
-                    'total_participantes': len(alunos_atividade),
-                    'participantes': [{
-                        'id_aluno': aluno.id_aluno,
-                        'nome_completo': aluno.nome_completo,
-                        'turma': aluno.turma.nome_turma if aluno.turma else None
-                    } for _, aluno in alunos_atividade]
-                })
-        
-        return jsonify({
-            'periodo': f'{data_inicio} a {data_fim}',
-            'id_turma': id_turma,
-            'total_atividades': len(relatorio),
-            'atividades': relatorio
-        })
-        
+        query = _filtrar_atividades(data_inicio, data_fim, id_turma)
     except ValueError:
         return jsonify({'error': 'Formato de data inválido'}), 400
+    
+    atividades = query.order_by(Atividade.data_realizacao, Atividade.id_atividade).all()
+    
+    # Participantes de todas as atividades do período em uma única consulta
+    participantes = _participantes_por_atividade(query, id_turma)
+    
+    relatorio = []
+    for atividade in atividades:
+        participantes_atividade = participantes.get(atividade.id_atividade, [])
+        relatorio.append({
+            **serializar_atividade(atividade),
+            'total_participantes': len(participantes_atividade),
+            'participantes': participantes_atividade
+        })
+    
+    return jsonify({
+        'periodo': f'{data_inicio} a {data_fim}',
+        'id_turma': id_turma,
+        'total_atividades': len(relatorio),
+        'atividades': relatorio
+    })
 
 @atividades_bp.route('/<int:id_atividade>', methods=['PUT'])
 def update_atividade(id_atividade):
@@ -525,14 +643,12 @@ def update_atividade(id_atividade):
             AtividadeAluno.query.filter_by(id_atividade=id_atividade).delete()
             
             # Adicionar novas associações
-            for id_aluno in data['alunos']:
-                atividade_aluno = AtividadeAluno(
-                    id_atividade=id_atividade,
-                    id_aluno=id_aluno
-                )
-                db.session.add(atividade_aluno)
+            _associar_alunos(id_atividade, data['alunos'])
         
+        registrar_alteracao('atividades')
         db.session.commit()
+        # Turmas inteiras podem ter sido associadas: invalida as respostas de todos os alunos
+        invalidar_cache('chatbot:atividade')
         return jsonify({'message': 'Atividade atualizada com sucesso'})
         
     except ValueError:
@@ -575,7 +691,10 @@ def delete_atividade(id_atividade):
         
         # Remover a atividade
         db.session.delete(atividade)
+        registrar_alteracao('atividades')
         db.session.commit()
+        # Turmas inteiras podem ter sido associadas: invalida as respostas de todos os alunos
+        invalidar_cache('chatbot:atividade')
         
         return jsonify({'message': 'Atividade excluída com sucesso'})
     except Exception as e:
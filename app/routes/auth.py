@@ -1,8 +1,14 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, g
 from app.models import Usuario
 from app import db
+from app.senhas import SobrecargaSenhas
+from app.tokens import exige_nivel
+from app.limites import limitar, por_ip, por_login
 
 auth_bp = Blueprint('auth', __name__)
+# Antes de consultar o usuário: por IP contra rajadas e por login contra tentativas em uma conta
+limitar(auth_bp, 'login_ip', por_ip, endpoints={'login'})
+limitar(auth_bp, 'login_usuario', por_login, endpoints={'login'})
 
 @auth_bp.route('/login', methods=['POST'])
 def login():
@@ -33,6 +39,8 @@ def login():
         examples:
           application/json: {
             "message": "Login realizado com sucesso",
+            "token": "eyJpZF91c3VhcmlvIjoxLC4uLn0.Zx1c9A.3q2-...",
+            "expira_em": 1735718400,
             "usuario": {
               "id": 1,
               "login": "admin",
@@ -48,17 +56,41 @@ def login():
         description: Credenciais inválidas
         examples:
           application/json: {"error": "Credenciais inválidas"}
+      429:
+        description: Muitas tentativas por IP (LIMITE_LOGIN_IP) ou para o login (LIMITE_LOGIN_USUARIO)
+        examples:
+          application/json: {"error": "Muitas requisições, tente novamente em instantes"}
+      503:
+        description: Muitos logins simultâneos
+        examples:
+          application/json: {"error": "Muitos logins simultâneos, tente novamente em instantes"}
     """
     data = request.get_json()
     
     if not data or not data.get('login') or not data.get('senha'):
         return jsonify({'error': 'Login e senha são obrigatórios'}), 400
+    if not isinstance(data['login'], str) or not isinstance(data['senha'], str):
+        return jsonify({'error': 'Login e senha devem ser texto'}), 400
     
+    senhas = current_app.extensions['senhas']
     usuario = Usuario.query.filter_by(login=data['login']).first()
     
-    if usuario and usuario.senha == data['senha']:  # Em produção, usar hash
+    try:
+        correta, precisa_rehash = senhas.verificar(usuario.senha if usuario else None, data['senha'])
+        if correta and precisa_rehash:
+            # Senha antiga em texto puro ou com outro custo: regrava com SENHA_METODO
+            usuario.senha = senhas.gerar(data['senha'])
+            db.session.commit()
+    except SobrecargaSenhas:
+        db.session.rollback()
+        return jsonify({'error': 'Muitos logins simultâneos, tente novamente em instantes'}), 503, {'Retry-After': '1'}
+    
+    if correta:
+        token, expira_em = current_app.extensions['tokens'].emitir(usuario)
         return jsonify({
             'message': 'Login realizado com sucesso',
+            'token': token,
+            'expira_em': expira_em,
             'usuario': {
                 'id': usuario.id_usuario,
                 'login': usuario.login,
@@ -69,14 +101,47 @@ def login():
     
     return jsonify({'error': 'Credenciais inválidas'}), 401
 
+@auth_bp.route('/logout', methods=['POST'])
+def logout():
+    """
+    Encerrar a sessão revogando o token de acesso enviado
+    ---
+    tags:
+      - Autenticação
+    parameters:
+      - in: header
+        name: Authorization
+        type: string
+        required: true
+        description: "Bearer <token>"
+    responses:
+      200:
+        description: Token revogado
+        examples:
+          application/json: {"message": "Logout realizado com sucesso"}
+      401:
+        description: Token ausente, inválido ou expirado
+        examples:
+          application/json: {"error": "Token revogado"}
+    """
+    current_app.extensions['tokens'].revogar(g.usuario)
+    return jsonify({'message': 'Logout realizado com sucesso'}), 200
+
 @auth_bp.route('/register', methods=['POST'])
+@exige_nivel('administrador')
 def register():
     """
-    Registrar novo usuário
+    Registrar novo usuário (somente administradores)
     ---
     tags:
       - Autenticação
     parameters:
+      - in: header
+        name: Authorization
+        type: string
+        required: true
+        description: "Bearer <token>"
+
       - in: body
         name: body
         required: true
@@ -108,6 +173,10 @@ def register():
         description: Dados incompletos
         examples:
           application/json: {"error": "Dados incompletos"}
+      403:
+        description: Usuário logado não é administrador
+        examples:
+          application/json: {"error": "Acesso não permitido para este nível de usuário"}
       409:
         description: Login já existe
         examples:
@@ -121,6 +190,8 @@ def register():
     
     if not data or not all(k in data for k in ('login', 'senha', 'nivel_acesso')):
         return jsonify({'error': 'Dados incompletos'}), 400
+    if not all(isinstance(data[k], str) and data[k] for k in ('login', 'senha', 'nivel_acesso')):
+        return jsonify({'error': 'login, senha e nivel_acesso devem ser texto'}), 400
 
     # Mapeamento para aceitar valores do frontend
     mapa_nivel_acesso = {
@@ -137,17 +208,20 @@ def register():
     if Usuario.query.filter_by(login=data['login']).first():
         return jsonify({'error': 'Login já existe'}), 409
     
-    usuario = Usuario(
-        login=data['login'],
-        senha=data['senha'],  # Em produção, usar hash
-        nivel_acesso=nivel_convertido,
-        id_professor=data.get('id_professor')
-    )
-    
     try:
+        usuario = Usuario(
+            login=data['login'],
+            senha=current_app.extensions['senhas'].gerar(data['senha']),
+            nivel_acesso=nivel_convertido,
+            id_professor=data.get('id_professor')
+        )
+        
         db.session.add(usuario)
         db.session.commit()
         return jsonify({'message': 'Usuário criado com sucesso'}), 201
+    except SobrecargaSenhas:
+        db.session.rollback()
+        return jsonify({'error': 'Muitos logins simultâneos, tente novamente em instantes'}), 503, {'Retry-After': '1'}
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Erro ao criar usuário'}), 500
\ No newline at end of file
@@ -1,10 +1,49 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, g
 from app.models import Aluno, Pagamento, Presenca, Atividade, AtividadeAluno
 from app import db
-from datetime import datetime, date
-import re
+from app.cache import CACHE_ACERTOS, CACHE_FALHAS
+from app.serializacao import dumps_bytes
+from app.intencoes import ClassificadorIntencoes, normalizar
+from app.versoes import versao_recursos
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+import json
+from app.tokens import restringir
+from app.limites import limitar, por_usuario
 
 chatbot_bp = Blueprint('chatbot', __name__)
+restringir(chatbot_bp)
+limitar(chatbot_bp, 'chatbot', por_usuario)
+
+ERROS_CONSULTA = {
+    'pagamento': 'Erro ao consultar informações de pagamento. Tente novamente mais tarde.',
+    'presenca': 'Erro ao consultar informações de presença. Tente novamente mais tarde.',
+    'atividade': 'Erro ao consultar atividades. Tente novamente mais tarde.'
+}
+# Recursos de que cada resposta com dados do aluno depende
+RECURSOS_CONSULTA = {
+    'pagamento': ('alunos', 'pagamentos'),
+    'presenca': ('alunos', 'presencas'),
+    'atividade': ('alunos', 'atividades')
+}
+
+def _aluno_do_turno(id_aluno):
+    """Aluno da mensagem atual, buscado uma única vez por requisição e compartilhado entre as intenções"""
+    alunos = g.setdefault('chatbot_alunos', {})
+    if id_aluno not in alunos:
+        alunos[id_aluno] = db.session.get(Aluno, id_aluno)
+    return alunos[id_aluno]
+
+def _id_aluno_registrado(id_aluno):
+    """
+    id_aluno gravado com a conversa: só um inteiro de aluno que existe (ou que veio do cache),
+    senão None, para que um id inválido não quebre a chave estrangeira do lote inteiro
+    """
+    if not isinstance(id_aluno, int) or isinstance(id_aluno, bool):
+        return None
+    if g.get('chatbot_alunos', {}).get(id_aluno, True) is None:
+        return None
+    return id_aluno
 
 class ChatBot:
     def __init__(self):
@@ -28,46 +67,41 @@ class ChatBot:
                 'contato', 'telefone', 'email', 'falar', 'conversar', 'whatsapp', 'zap', 'mensagem', 'atendimento', 'secretaria', 'direção', 'diretor', 'coordenador', 'coordenação', 'ajuda', 'suporte', 'informação', 'informações', 'endereço', 'localização', 'onde fica', 'visita', 'agendar', 'reunião', 'marcar', 'encontro'
             ]
         }
-    
-    def processar_mensagem(self, mensagem, id_aluno=None):
-        mensagem = mensagem.lower().strip()
-        # Mapeamento direto das opções sugeridas para funções
-        opcoes_map = {
-            'consultar pagamentos': lambda: self._resposta_pagamento(mensagem, id_aluno),
-            'verificar presenças': lambda: self._resposta_presenca(mensagem, id_aluno),
-            'ver atividades': lambda: self._resposta_atividade(mensagem, id_aluno),
-            'horário de funcionamento': self._resposta_horario,
-            'informações de contato': self._resposta_contato,
-            'falar com atendente': self._resposta_contato,
-            'agendar reunião': self._resposta_contato,
-            'falar com a direção': self._resposta_contato,
-            'secretaria': self._resposta_contato
+        self.classificador = ClassificadorIntencoes(self.responses)
+        
+        # Mapeamento direto das opções sugeridas para as intenções
+        self.opcoes = {
+            normalizar(opcao): intencao for opcao, intencao in {
+                'consultar pagamentos': 'pagamento',
+                'verificar presenças': 'presenca',
+                'ver atividades': 'atividade',
+                'horário de funcionamento': 'horario',
+                'informações de contato': 'contato',
+                'falar com atendente': 'contato',
+                'agendar reunião': 'contato',
+                'falar com a direção': 'contato',
+                'secretaria': 'contato'
+            }.items()
         }
-        if mensagem in opcoes_map:
-            return opcoes_map[mensagem]()
+    
+    def identificar_intencao(self, mensagem):
+        return self.opcoes.get(normalizar(mensagem)) or self.classificador.classificar(mensagem)
+    
+    def processar_mensagem(self, mensagem, id_aluno=None, intencao=None):
+        if intencao is None:
+            intencao = self.identificar_intencao(mensagem)
         
-        # Saudação
-        if any(palavra in mensagem for palavra in self.responses['saudacao']):
+        if intencao == 'saudacao':
             return self._resposta_saudacao()
-        
-        # Perguntas sobre pagamento
-        if any(palavra in mensagem for palavra in self.responses['pagamento']):
+        if intencao == 'pagamento':
             return self._resposta_pagamento(mensagem, id_aluno)
-        
-        # Perguntas sobre presença
-        if any(palavra in mensagem for palavra in self.responses['presenca']):
+        if intencao == 'presenca':
             return self._resposta_presenca(mensagem, id_aluno)
-        
-        # Perguntas sobre atividades
-        if any(palavra in mensagem for palavra in self.responses['atividade']):
+        if intencao == 'atividade':
             return self._resposta_atividade(mensagem, id_aluno)
-        
-        # Perguntas sobre horário
-        if any(palavra in mensagem for palavra in self.responses['horario']):
+        if intencao == 'horario':
             return self._resposta_horario()
-        
-        # Perguntas sobre contato
-        if any(palavra in mensagem for palavra in self.responses['contato']):
+        if intencao == 'contato':
             return self._resposta_contato()
         
         # Se nenhuma regra for satisfeita, retorna resposta padrão
@@ -87,38 +121,7 @@ class ChatBot:
     
     def _resposta_pagamento(self, mensagem, id_aluno):
         if id_aluno:
-            try:
-                aluno = Aluno.query.get(id_aluno)
-                if not aluno:
-                    return {'resposta': 'Aluno não encontrado.'}
-                
-                # Buscar pagamentos pendentes
-                pagamentos_pendentes = Pagamento.query.filter_by(
-                    id_aluno=id_aluno, 
-                    status='Pendente'
-                ).all()
-                
-                if pagamentos_pendentes:
-                    total_devido = sum(float(p.valor_pago) for p in pagamentos_pendentes)
-                    resposta = f"Olá! Encontrei {len(pagamentos_pendentes)} pagamento(s) pendente(s) para {aluno.nome_completo}:\n\n"
-                    
-                    for pagamento in pagamentos_pendentes:
-                        resposta += f"• {pagamento.referencia}: R$ {pagamento.valor_pago:.2f} (Vencimento: {pagamento.data_pagamento})\n"
-                    
-                    resposta += f"\nTotal devido: R$ {total_devido:.2f}"
-                    
-                    return {
-                        'resposta': resposta,
-                        'dados': {
-                            'total_pendente': total_devido,
-                            'quantidade': len(pagamentos_pendentes)
-                        }
-                    }
-                else:
-                    return {'resposta': f'Ótimas notícias! Não há pagamentos pendentes para {aluno.nome_completo}.'}
-                    
-            except Exception as e:
-                return {'resposta': 'Erro ao consultar informações de pagamento. Tente novamente mais tarde.'}
+            return self._consultar_aluno('pagamento', id_aluno, self._pagamentos_pendentes)
         else:
             return {
                 'resposta': 'Para consultar informações específicas de pagamento, preciso saber qual aluno. Os pagamentos podem ser realizados até o dia 10 de cada mês via PIX, cartão ou dinheiro na secretaria.',
@@ -127,45 +130,7 @@ class ChatBot:
     
     def _resposta_presenca(self, mensagem, id_aluno):
         if id_aluno:
-            try:
-                aluno = Aluno.query.get(id_aluno)
-                if not aluno:
-                    return {'resposta': 'Aluno não encontrado.'}
-                
-                # Buscar presenças do mês atual
-                hoje = date.today()
-                inicio_mes = hoje.replace(day=1)
-                
-                presencas_mes = Presenca.query.filter(
-                    Presenca.id_aluno == id_aluno,
-                    Presenca.data_presenca >= inicio_mes,
-                    Presenca.data_presenca <= hoje
-                ).all()
-                
-                if presencas_mes:
-                    total_dias = len(presencas_mes)
-                    dias_presentes = sum(1 for p in presencas_mes if p.presente)
-                    percentual = (dias_presentes / total_dias * 100) if total_dias > 0 else 0
-                    
-                    resposta = f"Frequência de {aluno.nome_completo} neste mês:\n\n"
-                    resposta += f"• Total de dias letivos: {total_dias}\n"
-                    resposta += f"• Dias presentes: {dias_presentes}\n"
-                    resposta += f"• Dias ausentes: {total_dias - dias_presentes}\n"
-                    resposta += f"• Percentual de frequência: {percentual:.1f}%"
-                    
-                    return {
-                        'resposta': resposta,
-                        'dados': {
-                            'percentual_frequencia': percentual,
-                            'dias_presentes': dias_presentes,
-                            'total_dias': total_dias
-                        }
-                    }
-                else:
-                    return {'resposta': f'Ainda não há registros de presença para {aluno.nome_completo} neste mês.'}
-                    
-            except Exception as e:
-                return {'resposta': 'Erro ao consultar informações de presença. Tente novamente mais tarde.'}
+            return self._consultar_aluno('presenca', id_aluno, self._frequencia_mes)
         else:
             return {
                 'resposta': 'Para consultar a frequência específica, preciso saber qual aluno. Em caso de faltas, é importante justificar na secretaria.',
@@ -174,44 +139,127 @@ class ChatBot:
     
     def _resposta_atividade(self, mensagem, id_aluno):
         if id_aluno:
-            try:
-                aluno = Aluno.query.get(id_aluno)
-                if not aluno:
-                    return {'resposta': 'Aluno não encontrado.'}
-                
-                # Buscar atividades recentes (últimos 7 dias)
-                data_limite = date.today() - datetime.timedelta(days=7)
-                
-                atividades_recentes = db.session.query(Atividade).join(
-                    AtividadeAluno, Atividade.id_atividade == AtividadeAluno.id_atividade
-                ).filter(
-                    AtividadeAluno.id_aluno == id_aluno,
-                    Atividade.data_realizacao >= data_limite
-                ).all()
-                
-                if atividades_recentes:
-                    resposta = f"Atividades recentes de {aluno.nome_completo}:\n\n"
-                    
-                    for atividade in atividades_recentes:
-                        resposta += f"• {atividade.data_realizacao.strftime('%d/%m/%Y')}: {atividade.descricao[:100]}...\n"
-                    
-                    return {
-                        'resposta': resposta,
-                        'dados': {
-                            'quantidade_atividades': len(atividades_recentes)
-                        }
-                    }
-                else:
-                    return {'resposta': f'Não há atividades registradas para {aluno.nome_completo} nos últimos 7 dias.'}
-                    
-            except Exception as e:
-                return {'resposta': 'Erro ao consultar atividades. Tente novamente mais tarde.'}
+            return self._consultar_aluno('atividade', id_aluno, self._atividades_recentes)
         else:
             return {
                 'resposta': 'Para consultar atividades específicas, preciso saber qual aluno. As atividades são planejadas de acordo com a faixa etária e desenvolvimento pedagógico.',
                 'opcoes': ['Tipos de atividades realizadas', 'Cronograma de atividades']
             }
     
+    def _consultar_aluno(self, intencao, id_aluno, consultar):
+        """
+        Resposta com dados do aluno, guardada no cache por (intenção, aluno, dia).
+        As rotas de gravação invalidam as tags chatbot:<intenção>:<id_aluno> e chatbot:aluno:<id_aluno>.
+        Com o cache local de cada worker a invalidação não chega aos outros workers, então a
+        chave também leva as versões dos recursos (app.versoes), como as rotas com @condicional.
+        """
+        cache = current_app.extensions['cache']
+        chave = f'chatbot:{intencao}:{id_aluno}:{date.today().isoformat()}'
+        if not cache.compartilhado:
+            chave += ':' + versao_recursos(*RECURSOS_CONSULTA[intencao])
+        valor = cache.get(chave)
+        if valor is not None:
+            CACHE_ACERTOS.labels(cache.nome).inc()
+            return json.loads(valor, parse_float=Decimal)
+        CACHE_FALHAS.labels(cache.nome).inc()
+        
+        try:
+            aluno = _aluno_do_turno(id_aluno)
+            if not aluno:
+                return {'resposta': 'Aluno não encontrado.'}
+            resposta = consultar(aluno)
+        except Exception as e:
+            return {'resposta': ERROS_CONSULTA[intencao]}
+        
+        cache.set(chave, dumps_bytes(resposta), [
+            'chatbot', f'chatbot:{intencao}', f'chatbot:{intencao}:{id_aluno}', f'chatbot:aluno:{id_aluno}'
+        ])
+        return resposta
+    
+    def _pagamentos_pendentes(self, aluno):
+        pagamentos_pendentes = Pagamento.query.filter_by(
+            id_aluno=aluno.id_aluno, 
+            status='Pendente'
+        ).all()
+        
+        if pagamentos_pendentes:
+            total_devido = sum((p.valor_pago for p in pagamentos_pendentes), Decimal('0.00'))
+            resposta = f"Olá! Encontrei {len(pagamentos_pendentes)} pagamento(s) pendente(s) para {aluno.nome_completo}:\n\n"
+            
+            for pagamento in pagamentos_pendentes:
+                resposta += f"• {pagamento.referencia}: R$ {pagamento.valor_pago:.2f} (Vencimento: {pagamento.data_pagamento})\n"
+            
+            resposta += f"\nTotal devido: R$ {total_devido:.2f}"
+            
+            return {
+                'resposta': resposta,
+                'dados': {
+                    'total_pendente': total_devido,
+                    'quantidade': len(pagamentos_pendentes)
+                }
+            }
+        else:
+            return {'resposta': f'Ótimas notícias! Não há pagamentos pendentes para {aluno.nome_completo}.'}
+    
+    def _frequencia_mes(self, aluno):
+        # Presenças do mês atual
+        hoje = date.today()
+        inicio_mes = hoje.replace(day=1)
+        
+        presencas_mes = Presenca.query.filter(
+            Presenca.id_aluno == aluno.id_aluno,
+            Presenca.data_presenca >= inicio_mes,
+            Presenca.data_presenca <= hoje
+        ).all()
+        
+        if presencas_mes:
+            total_dias = len(presencas_mes)
+            dias_presentes = sum(1 for p in presencas_mes if p.presente)
+            percentual = (dias_presentes / total_dias * 100) if total_dias > 0 else 0
+            
+            resposta = f"Frequência de {aluno.nome_completo} neste mês:\n\n"
+            resposta += f"• Total de dias letivos: {total_dias}\n"
+            resposta += f"• Dias presentes: {dias_presentes}\n"
+            resposta += f"• Dias ausentes: {total_dias - dias_presentes}\n"
+            resposta += f"• Percentual de frequência: {percentual:.1f}%"
+            
+            return {
+                'resposta': resposta,
+                'dados': {
+                    'percentual_frequencia': percentual,
+                    'dias_presentes': dias_presentes,
+                    'total_dias': total_dias
+                }
+            }
+        else:
+            return {'resposta': f'Ainda não há registros de presença para {aluno.nome_completo} neste mês.'}
+    
+    def _atividades_recentes(self, aluno):
+        # Atividades dos últimos 7 dias
+        data_limite = date.today() - timedelta(days=7)
+        
+        atividades_recentes = db.session.query(Atividade).join(
+            AtividadeAluno, Atividade.id_atividade == AtividadeAluno.id_atividade
+        ).filter(
+            AtividadeAluno.id_aluno == aluno.id_aluno,
+            Atividade.data_realizacao >= data_limite
+        ).all()
+        
+        if atividades_recentes:
+            resposta = f"Atividades recentes de {aluno.nome_completo}:\n\n"
+            
+            for atividade in atividades_recentes:
+                resposta += f"• {atividade.data_realizacao.strftime('%d/%m/%Y')}: {atividade.descricao[:100]}...\n"
+            
+            return {
+                'resposta': resposta,
+                'dados': {
+                    'quantidade_atividades': len(atividades_recentes)
+                }
+            }
+        else:
+            return {'resposta': f'Não há atividades registradas para {aluno.nome_completo} nos últimos 7 dias.'}
+    
     def _resposta_horario(self):
         return {
             'resposta': 'A Escola Infantil UniFAAT-ADS funciona de segunda a sexta-feira, das 7h às 19h. Estamos fechados aos sábados, domingos e feriados.',
@@ -292,17 +340,25 @@ def processar_mensagem():
     id_aluno = data.get('id_aluno')
     
     try:
-        resposta = chatbot.processar_mensagem(mensagem, id_aluno)
+        intencao = chatbot.identificar_intencao(mensagem)
+        resposta = chatbot.processar_mensagem(mensagem, id_aluno, intencao)
+        agora = datetime.now()
         
-        # Log da conversa (opcional - para análise e melhoria)
-        # Aqui você poderia salvar a conversa no banco de dados
+        # Log da conversa para análise: só enfileira, a gravação é feita em lote por outra thread
+        current_app.extensions['registro_conversas'].registrar(
+            id_aluno=_id_aluno_registrado(id_aluno),
+            mensagem=mensagem,
+            intencao=intencao,
+            resposta=resposta['resposta'],
+            criado_em=agora
+        )
         
         return jsonify({
             'mensagem_usuario': mensagem,
             'resposta_bot': resposta['resposta'],
             'opcoes': resposta.get('opcoes', []),
             'dados_adicionais': resposta.get('dados', {}),
-            'timestamp': datetime.now().isoformat()
+            'timestamp': agora.isoformat()
         })
         
     except Exception as e:
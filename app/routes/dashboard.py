@@ -0,0 +1,89 @@
+from flask import Blueprint, jsonify, current_app, g
+from app.models import Aluno, Professor, Turma, Pagamento
+from app import db
+from sqlalchemy import func, select
+from datetime import datetime
+from decimal import Decimal
+import threading
+import time
+from app.tokens import GESTAO, restringir
+
+dashboard_bp = Blueprint('dashboard', __name__)
+restringir(dashboard_bp)
+
+_lock = threading.Lock()
+
+# Só para administrador e secretaria, como as rotas de pagamentos
+CAMPOS_FINANCEIROS = ('pagamentos_pendentes', 'pagamentos_pagos', 'total_recebido', 'total_pendente')
+
+@dashboard_bp.route('/resumo', methods=['GET'])
+def get_resumo():
+    """
+    Resumo do sistema para o Dashboard
+    ---
+    tags:
+      - Dashboard
+    responses:
+      200:
+        description: >
+          Totais calculados no servidor (com cache de alguns segundos). Os campos de pagamentos
+          só vêm para administrador e secretaria.
+        examples:
+          application/json: {
+            "total_alunos": 120,
+            "total_professores": 8,
+            "total_turmas": 6,
+            "pagamentos_pendentes": 14,
+            "pagamentos_pagos": 310,
+            "total_recebido": 248000.00,
+            "total_pendente": 11200.00,
+            "gerado_em": "2024-06-21T10:00:00"
+          }
+    """
+    ttl = current_app.config.get('DASHBOARD_CACHE_TTL', 30)
+    cache = current_app.extensions.setdefault('dashboard_resumo', {})
+
+    with _lock:
+        resumo = cache['resumo'] if cache and cache['expira_em'] > time.monotonic() else None
+
+    if resumo is None:
+        resumo = _calcular_resumo()
+        with _lock:
+            cache.update(resumo=resumo, expira_em=time.monotonic() + ttl)
+
+    if g.usuario['nivel_acesso'] not in GESTAO:
+        resumo = {campo: valor for campo, valor in resumo.items() if campo not in CAMPOS_FINANCEIROS}
+    return jsonify(resumo)
+
+def _calcular_resumo():
+    """Calcula todos os totais em uma única consulta ao banco"""
+    total_alunos = select(func.count()).select_from(Aluno).scalar_subquery()
+    total_professores = select(func.count()).select_from(Professor).scalar_subquery()
+    total_turmas = select(func.count()).select_from(Turma).scalar_subquery()
+    pagamentos = select(
+        func.count().filter(Pagamento.status == 'Pendente').label('pendentes'),
+        func.count().filter(Pagamento.status == 'Pago').label('pagos'),
+        func.sum(Pagamento.valor_pago).filter(Pagamento.status == 'Pago').label('recebido'),
+        func.sum(Pagamento.valor_pago).filter(Pagamento.status == 'Pendente').label('pendente')
+    ).subquery()
+
+    linha = db.session.execute(select(
+        total_alunos.label('alunos'),
+        total_professores.label('professores'),
+        total_turmas.label('turmas'),
+        pagamentos.c.pendentes,
+        pagamentos.c.pagos,
+        pagamentos.c.recebido,
+        pagamentos.c.pendente
+    ).select_from(pagamentos)).one()
+
+    return {
+        'total_alunos': linha.alunos,
+        'total_professores': linha.professores,
+        'total_turmas': linha.turmas,
+        'pagamentos_pendentes': linha.pendentes,
+        'pagamentos_pagos': linha.pagos,
+        'total_recebido': linha.recebido or Decimal('0.00'),
+        'total_pendente': linha.pendente or Decimal('0.00'),
+        'gerado_em': datetime.now()
+    }
@@ -0,0 +1,114 @@
+from flask import Blueprint, request, jsonify, current_app, send_from_directory
+from app.lentidao import resumir_lentas
+from app.perfil import EXTENSOES
+from pathlib import Path
+from app.tokens import restringir
+
+diagnostico_bp = Blueprint('diagnostico', __name__)
+restringir(diagnostico_bp, leitura=('administrador',), escrita=('administrador',))
+
+@diagnostico_bp.route('/lentas', methods=['GET'])
+def get_lentas():
+    """
+    Endpoints com mais tempo gasto em requisições lentas (somente administrador)
+    ---
+    tags:
+      - Diagnóstico
+    parameters:
+      - name: horas
+        in: query
+        type: number
+        required: false
+        default: 24
+        description: Considera as requisições das últimas horas
+      - name: limite
+        in: query
+        type: integer
+        required: false
+        default: 10
+        description: Quantidade de endpoints no ranking
+    responses:
+      200:
+        description: Ranking lido do registro de todos os workers, com a pior requisição de cada endpoint
+        examples:
+          application/json: {
+            "limiar_ms": 1000,
+            "endpoints": [
+              {
+                "endpoint": "pagamentos.relatorio_periodo",
+                "ocorrencias": 12,
+                "duracao_total_ms": 18650.4,
+                "duracao_media_ms": 1554.2,
+                "duracao_max_ms": 2310.0,
+                "comandos_sql_media": 2.0,
+                "pior": {
+                  "em": "2024-06-21T10:00:00+00:00",
+                  "caminho": "/api/pagamentos/relatorio/periodo",
+                  "argumentos": ["data_fim", "data_inicio"],
+                  "status": 200,
+                  "duracao_ms": 2310.0,
+                  "sql": {"comandos": 2, "tempo_ms": 2250.3, "mais_lentos": []},
+                  "amostras": 114,
+                  "pilhas": [{"pilha": "app/main.py:...;sqlalchemy/default.py:do_execute:920", "amostras": 109}]
+                }
+              }
+            ]
+          }
+      400:
+        description: Parâmetros inválidos
+    """
+    try:
+        horas = float(request.args.get('horas', 24))
+        limite = int(request.args.get('limite', 10))
+    except ValueError:
+        return jsonify({'error': 'horas e limite devem ser números'}), 400
+
+    return jsonify({
+        'limiar_ms': current_app.config['LENTAS_LIMIAR_MS'],
+        'endpoints': resumir_lentas(current_app.config['LENTAS_DIRETORIO'], horas=horas, limite=limite)
+    })
+
+@diagnostico_bp.route('/perfis', methods=['GET'])
+def get_perfis():
+    """
+    Perfis gravados com os cabeçalhos X-Perfil e X-Perfil-Destino: arquivo (somente administrador)
+    ---
+    tags:
+      - Diagnóstico
+    responses:
+      200:
+        description: Arquivos de perfil, do mais recente para o mais antigo
+        examples:
+          application/json: [
+            {"nome": "20240621T100000123456-pagamentos.relatorio_periodo-41.speedscope.json", "bytes": 48213}
+          ]
+    """
+    diretorio = Path(current_app.config['PERFIL_DIRETORIO'])
+    if not diretorio.is_dir():
+        return jsonify([])
+    arquivos = [
+        caminho for caminho in diretorio.iterdir()
+        if caminho.is_file() and caminho.name.endswith(tuple(EXTENSOES.values()))
+    ]
+    arquivos.sort(key=lambda caminho: caminho.name, reverse=True)
+    return jsonify([{'nome': caminho.name, 'bytes': caminho.stat().st_size} for caminho in arquivos])
+
+@diagnostico_bp.route('/perfis/<path:nome>', methods=['GET'])
+def get_perfil(nome):
+    """
+    Baixar um perfil gravado (somente administrador)
+    ---
+    tags:
+      - Diagnóstico
+    parameters:
+      - name: nome
+        in: path
+        type: string
+        required: true
+    responses:
+      200:
+        description: Arquivo .prof (pstats), .txt ou .speedscope.json
+      404:
+        description: Perfil não encontrado
+    """
+    return send_from_directory(Path(current_app.config['PERFIL_DIRETORIO']).resolve(), nome, as_attachment=True)
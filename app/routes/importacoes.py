@@ -0,0 +1,229 @@
+from flask import Blueprint, request, jsonify, g
+from app.models import Importacao, ImportacaoErro
+from app import db
+from app.importacao import ArquivoInvalido, RetomadaInvalida, importar
+from app.tokens import GESTAO, restringir
+
+importacoes_bp = Blueprint('importacoes', __name__)
+restringir(importacoes_bp, leitura=GESTAO, escrita=GESTAO)
+
+def _resumo(importacao):
+    return {
+        'id_importacao': importacao.id_importacao,
+        'tipo': importacao.tipo,
+        'nome_arquivo': importacao.nome_arquivo,
+        'status': importacao.status,
+        'ultima_linha': importacao.ultima_linha,
+        'linhas_lidas': importacao.linhas_lidas,
+        'importadas': importacao.importadas,
+        'atualizadas': importacao.atualizadas,
+        'ignoradas': importacao.ignoradas,
+        'com_erro': importacao.com_erro,
+        'mensagem': importacao.mensagem,
+        'criado_em': importacao.criado_em.isoformat(),
+        'atualizado_em': importacao.atualizado_em.isoformat(),
+    }
+
+@importacoes_bp.route('/<tipo>', methods=['POST'])
+def create_importacao(tipo):
+    """
+    Importar alunos ou pagamentos de um arquivo CSV ou XLSX
+    ---
+    tags:
+      - Importações
+    consumes:
+      - multipart/form-data
+    parameters:
+      - name: tipo
+        in: path
+        type: string
+        required: true
+        enum: [alunos, pagamentos]
+      - name: arquivo
+        in: formData
+        type: file
+        required: true
+        description: >
+          CSV (vírgula ou ponto e vírgula) ou XLSX com cabeçalho. alunos: nome_completo,
+          data_nascimento, id_turma, nome_responsavel, telefone_responsavel, email_responsavel
+          e, opcional, informacoes_adicionais. pagamentos: id_aluno, data_pagamento,
+          valor_pago, forma_pagamento, referencia e status (Pago ou Pendente).
+      - name: retomar
+        in: formData
+        type: integer
+        required: false
+        description: id de uma importação interrompida do mesmo arquivo; continua depois da última linha gravada
+      - name: encoding
+        in: formData
+        type: string
+        required: false
+        default: utf-8-sig
+        description: Codificação do CSV (ex. latin-1)
+    responses:
+      200:
+        description: >
+          Importação concluída. Alunos já cadastrados (mesmo nome, nascimento e turma) são
+          ignorados; pagamentos de uma referência já existente do aluno são atualizados.
+        examples:
+          application/json: {
+            "id_importacao": 3,
+            "tipo": "pagamentos",
+            "nome_arquivo": "extrato-maio.csv",
+            "status": "concluida",
+            "ultima_linha": 1201,
+            "linhas_lidas": 1200,
+            "importadas": 1150,
+            "atualizadas": 40,
+            "ignoradas": 0,
+            "com_erro": 10,
+            "mensagem": null,
+            "criado_em": "2024-06-01T12:00:00",
+            "atualizado_em": "2024-06-01T12:00:03"
+          }
+      400:
+        description: Arquivo ausente, nome longo demais, formato, codificação ou cabeçalho inválido
+        examples:
+          application/json: {"error": "Colunas obrigatórias ausentes: id_turma"}
+      404:
+        description: Importação a retomar não encontrada
+      409:
+        description: Importação a retomar é de outro arquivo, já foi concluída ou está em andamento em outra requisição
+      500:
+        description: >
+          Importação interrompida; os lotes anteriores ficaram gravados e o mesmo arquivo pode
+          ser reenviado com retomar
+        examples:
+          application/json: {"error": "Erro ao gravar o lote depois da linha 5001", "id_importacao": 3, "status": "interrompida"}
+    """
+    arquivo = request.files.get('arquivo')
+    if arquivo is None or not arquivo.filename:
+        return jsonify({'error': 'Envie o arquivo no campo "arquivo"'}), 400
+
+    retomar = None
+    if request.form.get('retomar'):
+        try:
+            retomar = db.session.get(Importacao, int(request.form['retomar']))
+        except ValueError:
+            return jsonify({'error': 'retomar deve ser o id de uma importação'}), 400
+        if retomar is None:
+            return jsonify({'error': 'Importação não encontrada'}), 404
+
+    try:
+        importacao = importar(
+            tipo, arquivo.stream, arquivo.filename, retomar=retomar,
+            encoding=request.form.get('encoding') or 'utf-8-sig', id_usuario=g.usuario['id_usuario']
+        )
+    except ArquivoInvalido as e:
+        return jsonify({'error': str(e)}), 400
+    except RetomadaInvalida as e:
+        return jsonify({'error': str(e)}), 409
+
+    if importacao.status != 'concluida':
+        return jsonify({'error': importacao.mensagem, **_resumo(importacao)}), 500
+    return jsonify(_resumo(importacao))
+
+@importacoes_bp.route('/', methods=['GET'])
+def get_importacoes():
+    """
+    Listar as importações, da mais recente para a mais antiga
+    ---
+    tags:
+      - Importações
+    parameters:
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        default: 50
+    responses:
+      200:
+        description: Resumo de cada importação
+    """
+    limite = min(request.args.get('limit', 50, type=int), 500)
+    importacoes = Importacao.query.order_by(Importacao.id_importacao.desc()).limit(limite).all()
+    return jsonify([_resumo(importacao) for importacao in importacoes])
+
+@importacoes_bp.route('/<int:id_importacao>', methods=['GET'])
+def get_importacao(id_importacao):
+    """
+    Situação de uma importação
+    ---
+    tags:
+      - Importações
+    parameters:
+      - name: id_importacao
+        in: path
+        type: integer
+        required: true
+    responses:
+      200:
+        description: Contadores e última linha gravada (para retomar)
+      404:
+        description: Importação não encontrada
+    """
+    importacao = db.session.get(Importacao, id_importacao)
+    if importacao is None:
+        return jsonify({'error': 'Importação não encontrada'}), 404
+    return jsonify(_resumo(importacao))
+
+@importacoes_bp.route('/<int:id_importacao>/erros', methods=['GET'])
+def get_erros_importacao(id_importacao):
+    """
+    Linhas rejeitadas de uma importação, na ordem do arquivo
+    ---
+    tags:
+      - Importações
+    parameters:
+      - name: id_importacao
+        in: path
+        type: integer
+        required: true
+      - name: after
+        in: query
+        type: integer
+        required: false
+        description: Cursor (linha) retornado em X-Next-Cursor pela página anterior
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        default: 100
+    responses:
+      200:
+        description: Erros por linha e coluna; X-Next-Cursor indica que há próxima página
+        examples:
+          application/json: [
+            {"linha": 14, "coluna": "data_nascimento", "mensagem": "Data inválida (use AAAA-MM-DD ou DD/MM/AAAA)"},
+            {"linha": 15, "coluna": "id_turma", "mensagem": "Turma não encontrada"}
+          ]
+      400:
+        description: Parâmetros inválidos
+      404:
+        description: Importação não encontrada
+    """
+    try:
+        limite = int(request.args.get('limit', 100))
+        after = int(request.args.get('after', 0))
+    except ValueError:
+        return jsonify({'error': 'Parâmetros limit e after devem ser inteiros'}), 400
+    if limite < 1:
+        return jsonify({'error': 'Parâmetro limit deve ser maior que zero'}), 400
+    limite = min(limite, 1000)
+    if db.session.get(Importacao, id_importacao) is None:
+        return jsonify({'error': 'Importação não encontrada'}), 404
+
+    # Keyset por linha, com um registro a mais para saber se existe próxima página
+    erros = (
+        ImportacaoErro.query
+        .filter(ImportacaoErro.id_importacao == id_importacao, ImportacaoErro.linha > after)
+        .order_by(ImportacaoErro.linha)
+        .limit(limite + 1)
+        .all()
+    )
+    tem_proxima = len(erros) > limite
+    erros = erros[:limite]
+
+    response = jsonify([{'linha': erro.linha, 'coluna': erro.coluna, 'mensagem': erro.mensagem} for erro in erros])
+    if tem_proxima:
+        response.headers['X-Next-Cursor'] = str(erros[-1].linha)
+    return response
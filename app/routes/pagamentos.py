@@ -1,18 +1,36 @@
 from flask import Blueprint, request, jsonify
 from app.models import Pagamento, Aluno
 from app import db
+from app.dialeto import agregar_json, ler_json
+from app.exportacao import formato_exportacao, exportar
+from app.serializacao import serializar_pagamento
 from datetime import datetime
-from sqlalchemy import func, and_
+from decimal import Decimal
+from sqlalchemy import func, and_, select
+from app.cache import invalidar_cache
+from app.versoes import condicional, registrar_alteracao
+from app.tokens import GESTAO, restringir
+from app.limites import limitar, por_usuario
 
 pagamentos_bp = Blueprint('pagamentos', __name__)
+restringir(pagamentos_bp, leitura=GESTAO, escrita=GESTAO)
+limitar(pagamentos_bp, 'relatorios', por_usuario, endpoints={'relatorio_periodo', 'relatorio_inadimplencia'})
 
 @pagamentos_bp.route('/', methods=['GET'])
+@condicional('pagamentos', 'alunos')
 def get_pagamentos():
     """
     Listar todos os pagamentos
     ---
     tags:
       - Pagamentos
+    parameters:
+      - name: format
+        in: query
+        type: string
+        required: false
+        enum: [ndjson, csv]
+        description: Exportação em streaming (também pode ser escolhida pelo cabeçalho Accept)
     responses:
       200:
         description: Lista de pagamentos cadastrados
@@ -38,16 +56,20 @@ def get_pagamentos():
             }
           ]
     """
+    formato = formato_exportacao()
+    if formato:
+        return exportar(select(
+            Pagamento.id_pagamento,
+            Pagamento.id_aluno,
+            Pagamento.data_pagamento,
+            Pagamento.valor_pago,
+            Pagamento.forma_pagamento,
+            Pagamento.referencia,
+            Pagamento.status
+        ).order_by(Pagamento.id_pagamento), 'pagamentos', formato)
+    
     pagamentos = Pagamento.query.all()
-    return jsonify([{
-        'id_pagamento': pagamento.id_pagamento,
-        'id_aluno': pagamento.id_aluno,
-        'data_pagamento': pagamento.data_pagamento.isoformat(),
-        'valor_pago': float(pagamento.valor_pago),
-        'forma_pagamento': pagamento.forma_pagamento,
-        'referencia': pagamento.referencia,
-        'status': pagamento.status
-    } for pagamento in pagamentos])
+    return jsonify([serializar_pagamento(pagamento) for pagamento in pagamentos])
 
 @pagamentos_bp.route('/', methods=['POST'])
 def create_pagamento():
@@ -124,7 +146,9 @@ def create_pagamento():
         )
         
         db.session.add(pagamento)
+        registrar_alteracao('pagamentos')
         db.session.commit()
+        invalidar_cache(f'chatbot:pagamento:{pagamento.id_aluno}')
         
         return jsonify({'message': 'Pagamento registrado com sucesso', 'id': pagamento.id_pagamento}), 201
         
@@ -135,6 +159,7 @@ def create_pagamento():
         return jsonify({'error': 'Erro ao registrar pagamento'}), 500
 
 @pagamentos_bp.route('/aluno/<int:id_aluno>', methods=['GET'])
+@condicional('pagamentos', 'alunos')
 def get_pagamentos_aluno(id_aluno):
     """
     Listar pagamentos de um aluno
@@ -164,16 +189,10 @@ def get_pagamentos_aluno(id_aluno):
           ]
     """
     pagamentos = Pagamento.query.filter_by(id_aluno=id_aluno).all()
-    return jsonify([{
-        'id_pagamento': pagamento.id_pagamento,
-        'data_pagamento': pagamento.data_pagamento.isoformat(),
-        'valor_pago': float(pagamento.valor_pago),
-        'forma_pagamento': pagamento.forma_pagamento,
-        'referencia': pagamento.referencia,
-        'status': pagamento.status
-    } for pagamento in pagamentos])
+    return jsonify([serializar_pagamento(pagamento, incluir_aluno=False) for pagamento in pagamentos])
 
 @pagamentos_bp.route('/relatorio/periodo', methods=['GET'])
+@condicional('pagamentos', 'alunos')
 def relatorio_periodo():
     """
     Relatório de pagamentos por período
@@ -234,29 +253,22 @@ def relatorio_periodo():
                  Pagamento.data_pagamento <= data_fim)
         ).all()
         
-        total_recebido = sum(float(p.valor_pago) for p in pagamentos if p.status == 'Pago')
-        total_pendente = sum(float(p.valor_pago) for p in pagamentos if p.status == 'Pendente')
+        total_recebido = sum((p.valor_pago for p in pagamentos if p.status == 'Pago'), Decimal('0.00'))
+        total_pendente = sum((p.valor_pago for p in pagamentos if p.status == 'Pendente'), Decimal('0.00'))
         
         return jsonify({
             'periodo': f'{data_inicio} a {data_fim}',
             'total_recebido': total_recebido,
             'total_pendente': total_pendente,
             'quantidade_pagamentos': len(pagamentos),
-            'pagamentos': [{
-                'id_pagamento': p.id_pagamento,
-                'id_aluno': p.id_aluno,
-                'data_pagamento': p.data_pagamento.isoformat(),
-                'valor_pago': float(p.valor_pago),
-                'forma_pagamento': p.forma_pagamento,
-                'referencia': p.referencia,
-                'status': p.status
-            } for p in pagamentos]
+            'pagamentos': [serializar_pagamento(p) for p in pagamentos]
         })
         
     except ValueError:
         return jsonify({'error': 'Formato de data inválido'}), 400
 
 @pagamentos_bp.route('/relatorio/inadimplencia', methods=['GET'])
+@condicional('pagamentos', 'alunos')
 def relatorio_inadimplencia():
     """
     Relatório de inadimplência
@@ -289,34 +301,53 @@ def relatorio_inadimplencia():
             ]
           }
     """
-    pagamentos_pendentes = Pagamento.query.filter_by(status='Pendente').all()
+    # Uma única consulta: total e lista de pendências agregados por aluno
+    pendencias = db.session.query(
+        Aluno.id_aluno,
+        Aluno.nome_completo,
+        Aluno.nome_responsavel,
+        Aluno.telefone_responsavel,
+        Aluno.email_responsavel,
+        func.sum(Pagamento.valor_pago).label('total_devido'),
+        agregar_json(
+            id_pagamento=Pagamento.id_pagamento,
+            data_pagamento=Pagamento.data_pagamento,
+            valor_pago=Pagamento.valor_pago,
+            referencia=Pagamento.referencia
+        ).label('pagamentos_pendentes')
+    ).join(
+        Pagamento, Pagamento.id_aluno == Aluno.id_aluno
+    ).filter(
+        Pagamento.status == 'Pendente'
+    ).group_by(
+        Aluno.id_aluno,
+        Aluno.nome_completo,
+        Aluno.nome_responsavel,
+        Aluno.telefone_responsavel,
+        Aluno.email_responsavel
+    ).order_by(Aluno.id_aluno)
     
-    inadimplentes = {}
-    for pagamento in pagamentos_pendentes:
-        aluno = Aluno.query.get(pagamento.id_aluno)
-        if aluno:
-            if aluno.id_aluno not in inadimplentes:
-                inadimplentes[aluno.id_aluno] = {
-                    'aluno': aluno.nome_completo,
-                    'responsavel': aluno.nome_responsavel,
-                    'telefone': aluno.telefone_responsavel,
-                    'email': aluno.email_responsavel,
-                    'total_devido': 0,
-                    'pagamentos_pendentes': []
-                }
-            
-            inadimplentes[aluno.id_aluno]['total_devido'] += float(pagamento.valor_pago)
-            inadimplentes[aluno.id_aluno]['pagamentos_pendentes'].append({
-                'id_pagamento': pagamento.id_pagamento,
-                'data_pagamento': pagamento.data_pagamento.isoformat(),
-                'valor_pago': float(pagamento.valor_pago),
-                'referencia': pagamento.referencia
-            })
+    inadimplentes = []
+    for linha in pendencias:
+        pagamentos = sorted(ler_json(linha.pagamentos_pendentes), key=lambda p: p['id_pagamento'])
+        inadimplentes.append({
+            'aluno': linha.nome_completo,
+            'responsavel': linha.nome_responsavel,
+            'telefone': linha.telefone_responsavel,
+            'email': linha.email_responsavel,
+            'total_devido': linha.total_devido,
+            'pagamentos_pendentes': [{
+                'id_pagamento': p['id_pagamento'],
+                'data_pagamento': p['data_pagamento'],
+                'valor_pago': p['valor_pago'],
+                'referencia': p['referencia']
+            } for p in pagamentos]
+        })
     
     return jsonify({
         'total_inadimplentes': len(inadimplentes),
-        'valor_total_devido': sum(i['total_devido'] for i in inadimplentes.values()),
-        'inadimplentes': list(inadimplentes.values())
+        'valor_total_devido': sum((i['total_devido'] for i in inadimplentes), Decimal('0.00')),
+        'inadimplentes': inadimplentes
     })
 
 @pagamentos_bp.route('/<int:id_pagamento>', methods=['PUT'])
@@ -389,7 +420,10 @@ def update_pagamento(id_pagamento):
         if 'status' in data:
             pagamento.status = data['status']
         
+        id_aluno = pagamento.id_aluno
+        registrar_alteracao('pagamentos')
         db.session.commit()
+        invalidar_cache(f'chatbot:pagamento:{id_aluno}')
         return jsonify({'message': 'Pagamento atualizado com sucesso'})
         
     except ValueError:
@@ -425,9 +459,12 @@ def delete_pagamento(id_pagamento):
           application/json: {"error": "Erro ao excluir pagamento"}
     """
     pagamento = Pagamento.query.get_or_404(id_pagamento)
+    id_aluno = pagamento.id_aluno
     try:
         db.session.delete(pagamento)
+        registrar_alteracao('pagamentos')
         db.session.commit()
+        invalidar_cache(f'chatbot:pagamento:{id_aluno}')
         return jsonify({'message': 'Pagamento excluído com sucesso'})
     except Exception as e:
         db.session.rollback()
@@ -1,18 +1,46 @@
 from flask import Blueprint, request, jsonify
 from app.models import Presenca, Aluno
 from app import db
+from app.dialeto import upsert
+from app.frequencia import atualizar_frequencia, consultar_frequencia
+from app.particoes import primeiro_ano_ativo
+from app.exportacao import formato_exportacao, exportar
+from app.serializacao import serializar_presenca
 from datetime import datetime
-from sqlalchemy import and_, func
+from sqlalchemy import and_, select
+from sqlalchemy.exc import IntegrityError
+from app.cache import invalidar_cache
+from app.versoes import condicional, registrar_alteracao
+from app.tokens import restringir
+from app.limites import limitar, por_usuario
 
 presencas_bp = Blueprint('presencas', __name__)
+restringir(presencas_bp)
+limitar(presencas_bp, 'relatorios', por_usuario, endpoints={'relatorio_diario', 'relatorio_frequencia'})
+
+def _ano_arquivado(*datas):
+    """Erro se alguma data cai em um ano arquivado (partição desanexada de presencas)"""
+    primeiro_ano = primeiro_ano_ativo(db.session.connection())
+    anos = sorted({dia.year for dia in datas if primeiro_ano is not None and dia.year < primeiro_ano})
+    if anos:
+        return jsonify({'error': f'O ano {anos[0]} está arquivado; suas presenças não podem ser alteradas'}), 400
+    return None
 
 @presencas_bp.route('/', methods=['GET'])
+@condicional('presencas', 'alunos')
 def get_presencas():
     """
     Listar todas as presenças
     ---
     tags:
       - Presenças
+    parameters:
+      - name: format
+        in: query
+        type: string
+        required: false
+        enum: [ndjson, csv]
+        description: Exportação em streaming (também pode ser escolhida pelo cabeçalho Accept)
     responses:
       200:
         description: Lista de presenças cadastradas
@@ -32,13 +60,17 @@ def get_presencas():
             }
           ]
     """
+    formato = formato_exportacao()
+    if formato:
+        return exportar(select(
+            Presenca.id_presenca,
+            Presenca.id_aluno,
+            Presenca.data_presenca,
+            Presenca.presente
+        ).order_by(Presenca.id_presenca), 'presencas', formato)
+    
     presencas = Presenca.query.all()
-    return jsonify([{
-        'id_presenca': presenca.id_presenca,
-        'id_aluno': presenca.id_aluno,
-        'data_presenca': presenca.data_presenca.isoformat(),
-        'presente': presenca.presente
-    } for presenca in presencas])
+    return jsonify([serializar_presenca(presenca) for presenca in presencas])
 
 @presencas_bp.route('/', methods=['POST'])
 def create_presenca():
@@ -73,10 +105,11 @@ def create_presenca():
         examples:
           application/json: {"message": "Presença registrada com sucesso", "id": 3}
       400:
-        description: Dados incompletos ou data inválida
+        description: Dados incompletos, data inválida ou em ano arquivado
         examples:
           application/json: {"error": "Dados incompletos"}
           application/json: {"error": "Data de presença inválida"}
+          application/json: {"error": "O ano 2022 está arquivado; suas presenças não podem ser alteradas"}
       409:
         description: Presença já registrada
         examples:
@@ -95,16 +128,11 @@ def create_presenca():
     
     try:
         data_presenca = datetime.strptime(data['data_presenca'], '%Y-%m-%d').date()
+        arquivado = _ano_arquivado(data_presenca)
+        if arquivado:
+            return arquivado
         
-        # Verificar se já existe presença para este aluno nesta data
-        presenca_existente = Presenca.query.filter_by(
-            id_aluno=data['id_aluno'],
-            data_presenca=data_presenca
-        ).first()
-        
-        if presenca_existente:
-            return jsonify({'error': 'Presença já registrada para este aluno nesta data'}), 409
-        
+        # A duplicidade é garantida pela constraint UNIQUE(id_aluno, data_presenca)
         presenca = Presenca(
             id_aluno=data['id_aluno'],
             data_presenca=data_presenca,
@@ -112,17 +140,198 @@ def create_presenca():
         )
         
         db.session.add(presenca)
+        db.session.flush()
+        atualizar_frequencia([presenca.id_aluno], [data_presenca])
+        registrar_alteracao('presencas')
         db.session.commit()
+        invalidar_cache(f'chatbot:presenca:{presenca.id_aluno}')
         
         return jsonify({'message': 'Presença registrada com sucesso', 'id': presenca.id_presenca}), 201
         
     except ValueError:
         return jsonify({'error': 'Data de presença inválida'}), 400
+    except IntegrityError:
+        db.session.rollback()
+        if Presenca.query.filter_by(id_aluno=data['id_aluno'], data_presenca=data_presenca).first():
+            return jsonify({'error': 'Presença já registrada para este aluno nesta data'}), 409
+        return jsonify({'error': 'Erro ao registrar presença'}), 500
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Erro ao registrar presença'}), 500
 
+@presencas_bp.route('/chamada', methods=['POST'])
+def registrar_chamada():
+    """
+    Registrar a chamada de uma turma (várias presenças em lote)
+    ---
+    tags:
+      - Presenças
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          required:
+            - data_presenca
+            - presencas
+          properties:
+            data_presenca:
+              type: string
+              example: "2024-06-10"
+            id_turma:
+              type: integer
+              example: 1
+              description: Se informado, rejeita alunos de outras turmas
+            presencas:
+              type: array
+              items:
+                type: object
+                properties:
+                  id_aluno:
+                    type: integer
+                    example: 1
+                  presente:
+                    type: boolean
+                    example: true
+    responses:
+      200:
+        description: Chamada registrada. Cada linha informa se a presença foi criada, atualizada ou rejeitada
+        examples:
+          application/json: {
+            "data_presenca": "2024-06-10",
+            "criadas": 1,
+            "atualizadas": 1,
+            "erros": 1,
+            "resultados": [
+              {"id_aluno": 1, "status": "criada", "id_presenca": 10},
+              {"id_aluno": 2, "status": "atualizada", "id_presenca": 4},
+              {"id_aluno": 99, "status": "erro", "erro": "Aluno não encontrado"}
+            ]
+          }
+      400:
+        description: Dados incompletos, data inválida ou em ano arquivado
+        examples:
+          application/json: {"error": "Dados incompletos"}
+          application/json: {"error": "Data de presença inválida"}
+          application/json: {"error": "O ano 2022 está arquivado; suas presenças não podem ser alteradas"}
+      500:
+        description: Erro ao registrar chamada
+        examples:
+          application/json: {"error": "Erro ao registrar chamada"}
+    """
+    data = request.get_json()
+    
+    if not data or 'data_presenca' not in data or not isinstance(data.get('presencas'), list):
+        return jsonify({'error': 'Dados incompletos'}), 400
+    
+    try:
+        data_presenca = datetime.strptime(data['data_presenca'], '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': 'Data de presença inválida'}), 400
+    arquivado = _ano_arquivado(data_presenca)
+    if arquivado:
+        return arquivado
+    
+    id_turma = data.get('id_turma')
+    resultados = []
+    linhas = {}
+    for item in data['presencas']:
+        if not isinstance(item, dict) or not isinstance(item.get('id_aluno'), int) \
+                or not isinstance(item.get('presente'), bool):
+            resultados.append({'id_aluno': item.get('id_aluno') if isinstance(item, dict) else None,
+                               'status': 'erro', 'erro': 'Dados incompletos'})
+            continue
+        resultado = {'id_aluno': item['id_aluno']}
+        resultados.append(resultado)
+        # Se o aluno vier repetido, vale o último valor
+        if item['id_aluno'] in linhas:
+            linhas[item['id_aluno']][1].update(status='erro', erro='Aluno repetido na chamada')
+        linhas[item['id_aluno']] = (item['presente'], resultado)
+    
+    try:
+        # Uma consulta valida os alunos e descobre quem já tem presença na data
+        existentes = {}
+        if linhas:
+            consulta = db.session.query(
+                Aluno.id_aluno, Aluno.id_turma, Presenca.id_presenca
+            ).outerjoin(
+                Presenca, and_(Presenca.id_aluno == Aluno.id_aluno,
+                               Presenca.data_presenca == data_presenca)
+            ).filter(Aluno.id_aluno.in_(list(linhas)))
+            existentes = {linha.id_aluno: linha for linha in consulta}
+        
+        validas = []
+        for id_aluno, (presente, resultado) in linhas.items():
+            aluno = existentes.get(id_aluno)
+            if aluno is None:
+                resultado.update(status='erro', erro='Aluno não encontrado')
+            elif id_turma is not None and aluno.id_turma != id_turma:
+                resultado.update(status='erro', erro='Aluno não pertence à turma')
+            else:
+                resultado['status'] = 'atualizada' if aluno.id_presenca else 'criada'
+                validas.append({'id_aluno': id_aluno, 'data_presenca': data_presenca, 'presente': presente})
+        
+        if validas:
+            ids_presenca = _gravar_presencas(validas)
+            for id_aluno, id_presenca in ids_presenca.items():
+                linhas[id_aluno][1]['id_presenca'] = id_presenca
+            atualizar_frequencia(ids_presenca.keys(), [data_presenca])
+        
+        registrar_alteracao('presencas')
+        db.session.commit()
+        invalidar_cache(*(f"chatbot:presenca:{linha['id_aluno']}" for linha in validas))
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Erro ao registrar chamada'}), 500
+    
+    return jsonify({
+        'data_presenca': data_presenca,
+        'criadas': sum(1 for r in resultados if r['status'] == 'criada'),
+        'atualizadas': sum(1 for r in resultados if r['status'] == 'atualizada'),
+        'erros': sum(1 for r in resultados if r['status'] == 'erro'),
+        'resultados': resultados
+    })
+
+def _gravar_presencas(linhas):
+    """
+    Grava as presenças com um único upsert na constraint UNIQUE(id_aluno, data_presenca).
+    Retorna {id_aluno: id_presenca}.
+    """
+    stmt = upsert(Presenca.__table__, ['id_aluno', 'data_presenca'], ['presente'])
+    
+    if stmt is not None:
+        gravadas = db.session.execute(
+            stmt.returning(Presenca.id_aluno, Presenca.id_presenca), linhas
+        )
+        return {linha.id_aluno: linha.id_presenca for linha in gravadas}
+    
+    # Bancos sem ON CONFLICT: atualiza ou insere linha a linha
+    ids = {}
+    for linha in linhas:
+        presenca = Presenca.query.filter_by(
+            id_aluno=linha['id_aluno'], data_presenca=linha['data_presenca']
+        ).first()
+        if presenca:
+            presenca.presente = linha['presente']
+        else:
+            presenca = Presenca(**linha)
+            db.session.add(presenca)
+        db.session.flush()
+        ids[presenca.id_aluno] = presenca.id_presenca
+    return ids
+
+def _presencas_com_nome(data_presenca):
+    """Presenças do dia com o nome do aluno na mesma consulta (sem carregar p.aluno um a um)"""
+    return db.session.query(
+        Presenca.id_presenca, Presenca.id_aluno, Presenca.presente, Aluno.nome_completo
+    ).outerjoin(
+        Aluno, Aluno.id_aluno == Presenca.id_aluno
+    ).filter(Presenca.data_presenca == data_presenca).all()
+
 @presencas_bp.route('/data/<string:data>', methods=['GET'])
+@condicional('presencas', 'alunos')
 def get_presencas_data(data):
     """
     Listar presenças por data
@@ -155,19 +364,20 @@ def get_presencas_data(data):
     """
     try:
         data_presenca = datetime.strptime(data, '%Y-%m-%d').date()
-        presencas = Presenca.query.filter_by(data_presenca=data_presenca).all()
+        presencas = _presencas_com_nome(data_presenca)
         
         return jsonify([{
             'id_presenca': presenca.id_presenca,
             'id_aluno': presenca.id_aluno,
             'presente': presenca.presente,
-            'aluno_nome': presenca.aluno.nome_completo if presenca.aluno else None
+            'aluno_nome': presenca.nome_completo
         } for presenca in presencas])
         
     except ValueError:
         return jsonify({'error': 'Formato de data inválido'}), 400
 
 @presencas_bp.route('/aluno/<int:id_aluno>', methods=['GET'])
+@condicional('presencas', 'alunos')
 def get_presencas_aluno(id_aluno):
     """
     Listar presenças de um aluno (com filtro de período)
@@ -244,14 +454,11 @@ def get_presencas_aluno(id_aluno):
         'dias_presentes': dias_presentes,
         'dias_ausentes': total_dias - dias_presentes,
         'percentual_frequencia': round(percentual_frequencia, 2),
-        'presencas': [{
-            'id_presenca': p.id_presenca,
-            'data_presenca': p.data_presenca.isoformat(),
-            'presente': p.presente
-        } for p in presencas]
+        'presencas': [serializar_presenca(p, incluir_aluno=False) for p in presencas]
     })
 
 @presencas_bp.route('/relatorio/diario/<string:data>', methods=['GET'])
+@condicional('presencas', 'alunos')
 def relatorio_diario(data):
     """
     Relatório diário de presenças
@@ -292,7 +499,7 @@ def relatorio_diario(data):
         data_presenca = datetime.strptime(data, '%Y-%m-%d').date()
         
         # Buscar todas as presenças do dia
-        presencas = Presenca.query.filter_by(data_presenca=data_presenca).all()
+        presencas = _presencas_com_nome(data_presenca)
         
         total_alunos = len(presencas)
         presentes = sum(1 for p in presencas if p.presente)
@@ -306,7 +513,7 @@ def relatorio_diario(data):
             'percentual_presenca': round((presentes / total_alunos * 100) if total_alunos > 0 else 0, 2),
             'detalhes': [{
                 'id_aluno': p.id_aluno,
-                'aluno_nome': p.aluno.nome_completo if p.aluno else None,
+                'aluno_nome': p.nome_completo,
                 'presente': p.presente
             } for p in presencas]
         })
@@ -315,6 +522,7 @@ def relatorio_diario(data):
         return jsonify({'error': 'Formato de data inválido'}), 400
 
 @presencas_bp.route('/relatorio/frequencia', methods=['GET'])
+@condicional('presencas', 'alunos')
 def relatorio_frequencia():
     """
     Relatório de frequência por período
@@ -334,6 +542,12 @@ def relatorio_frequencia():
         required: true
         description: Data de fim (YYYY-MM-DD)
         example: "2024-06-30"
+      - name: id_turma
+        in: query
+        type: integer
+        required: false
+        description: Apenas alunos da turma
+        example: 1
     responses:
       200:
         description: Frequência de todos os alunos no período
@@ -368,31 +582,20 @@ def relatorio_frequencia():
         data_inicio = datetime.strptime(data_inicio, '%Y-%m-%d').date()
         data_fim = datetime.strptime(data_fim, '%Y-%m-%d').date()
         
-        # Buscar frequência por aluno no período
-        frequencia_query = db.session.query(
-            Presenca.id_aluno,
-            func.count(Presenca.id_presenca).label('total_dias'),
-            func.sum(func.cast(Presenca.presente, db.Integer)).label('dias_presentes')
-        ).filter(
-            and_(Presenca.data_presenca >= data_inicio,
-                 Presenca.data_presenca <= data_fim)
-        ).group_by(Presenca.id_aluno).all()
-        
+        # Meses completos vêm do resumo frequencia_mensal, já com o nome do aluno
         relatorio = []
-        for freq in frequencia_query:
-            aluno = Aluno.query.get(freq.id_aluno)
-            if aluno:
-                dias_ausentes = freq.total_dias - freq.dias_presentes
-                percentual = (freq.dias_presentes / freq.total_dias * 100) if freq.total_dias > 0 else 0
-                
-                relatorio.append({
-                    'id_aluno': freq.id_aluno,
-                    'aluno_nome': aluno.nome_completo,
-                    'total_dias': freq.total_dias,
-                    'dias_presentes': freq.dias_presentes,
-                    'dias_ausentes': dias_ausentes,
-                    'percentual_frequencia': round(percentual, 2)
-                })
+        for freq in consultar_frequencia(data_inicio, data_fim, request.args.get('id_turma', type=int)):
+            dias_presentes = int(freq.dias_presentes or 0)
+            percentual = (dias_presentes / freq.total_dias * 100) if freq.total_dias > 0 else 0
+            
+            relatorio.append({
+                'id_aluno': freq.id_aluno,
+                'aluno_nome': freq.nome_completo,
+                'total_dias': int(freq.total_dias),
+                'dias_presentes': dias_presentes,
+                'dias_ausentes': int(freq.total_dias) - dias_presentes,
+                'percentual_frequencia': round(percentual, 2)
+            })
         
         return jsonify({
             'periodo': f'{data_inicio} a {data_fim}',
@@ -435,10 +638,11 @@ def update_presenca(id_presenca):
         examples:
           application/json: {"message": "Presença atualizada com sucesso"}
       400:
-        description: Dados não fornecidos ou data inválida
+        description: Dados não fornecidos, data inválida ou em ano arquivado
         examples:
           application/json: {"error": "Dados não fornecidos"}
           application/json: {"error": "Data de presença inválida"}
+          application/json: {"error": "O ano 2022 está arquivado; suas presenças não podem ser alteradas"}
       404:
         description: Presença não encontrada
       500:
@@ -453,12 +657,21 @@ def update_presenca(id_presenca):
         return jsonify({'error': 'Dados não fornecidos'}), 400
     
     try:
+        data_anterior = presenca.data_presenca
         if 'data_presenca' in data:
-            presenca.data_presenca = datetime.strptime(data['data_presenca'], '%Y-%m-%d').date()
+            nova_data = datetime.strptime(data['data_presenca'], '%Y-%m-%d').date()
+            arquivado = _ano_arquivado(nova_data)
+            if arquivado:
+                return arquivado
+            presenca.data_presenca = nova_data
         if 'presente' in data:
             presenca.presente = data['presente']
         
+        id_aluno = presenca.id_aluno
+        atualizar_frequencia([id_aluno], [data_anterior, presenca.data_presenca])
+        registrar_alteracao('presencas')
         db.session.commit()
+        invalidar_cache(f'chatbot:presenca:{id_aluno}')
         return jsonify({'message': 'Presença atualizada com sucesso'})
         
     except ValueError:
@@ -494,9 +707,13 @@ def delete_presenca(id_presenca):
           application/json: {"error": "Erro ao excluir presença"}
     """
     presenca = Presenca.query.get_or_404(id_presenca)
+    id_aluno = presenca.id_aluno
     try:
         db.session.delete(presenca)
+        atualizar_frequencia([id_aluno], [presenca.data_presenca])
+        registrar_alteracao('presencas')
         db.session.commit()
+        invalidar_cache(f'chatbot:presenca:{id_aluno}')
         return jsonify({'message': 'Presença excluída com sucesso'})
     except Exception as e:
         db.session.rollback()
@@ -1,10 +1,17 @@
 from flask import Blueprint, request, jsonify
 from app.models import Professor
 from app import db
+from app.serializacao import serializar_professor
+from app.cache import em_cache, invalidar_cache
+from app.versoes import condicional, registrar_alteracao
+from app.tokens import GESTAO, restringir
 
 professores_bp = Blueprint('professores', __name__)
+restringir(professores_bp, escrita=GESTAO)
 
 @professores_bp.route('/', methods=['GET'])
+@condicional('professores')
+@em_cache('professores')
 def get_professores():
     """
     Listar todos os professores
@@ -31,12 +38,7 @@ def get_professores():
           ]
     """
     professores = Professor.query.all()
-    return jsonify([{
-        'id_professor': professor.id_professor,
-        'nome_completo': professor.nome_completo,
-        'email': professor.email,
-        'telefone': professor.telefone
-    } for professor in professores])
+    return jsonify([serializar_professor(professor) for professor in professores])
 
 @professores_bp.route('/', methods=['POST'])
 def create_professor():
@@ -94,7 +96,9 @@ def create_professor():
         )
         
         db.session.add(professor)
+        registrar_alteracao('professores')
         db.session.commit()
+        invalidar_cache('professores')
         
         return jsonify({'message': 'Professor criado com sucesso', 'id': professor.id_professor}), 201
         
@@ -103,6 +107,8 @@ def create_professor():
         return jsonify({'error': 'Erro ao criar professor'}), 500
 
 @professores_bp.route('/<int:id_professor>', methods=['GET'])
+@condicional('professores')
+@em_cache('professores')
 def get_professor(id_professor):
     """
     Buscar um professor pelo ID
@@ -130,12 +136,7 @@ def get_professor(id_professor):
         description: Professor não encontrado
     """
     professor = Professor.query.get_or_404(id_professor)
-    return jsonify({
-        'id_professor': professor.id_professor,
-        'nome_completo': professor.nome_completo,
-        'email': professor.email,
-        'telefone': professor.telefone
-    })
+    return jsonify(serializar_professor(professor))
 
 @professores_bp.route('/<int:id_professor>', methods=['PUT'])
 def update_professor(id_professor):
@@ -196,7 +197,9 @@ def update_professor(id_professor):
         if 'telefone' in data:
             professor.telefone = data['telefone']
         
+        registrar_alteracao('professores')
         db.session.commit()
+        invalidar_cache('professores')
         return jsonify({'message': 'Professor atualizado com sucesso'})
         
     except Exception as e:
@@ -233,7 +236,9 @@ def delete_professor(id_professor):
     
     try:
         db.session.delete(professor)
+        registrar_alteracao('professores', 'turmas', 'alunos')
         db.session.commit()
+        invalidar_cache('professores', 'turmas', 'alunos', 'chatbot')
         return jsonify({'message': 'Professor excluído com sucesso'})
     except Exception as e:
         db.session.rollback()
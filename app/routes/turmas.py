@@ -1,10 +1,17 @@
 from flask import Blueprint, request, jsonify
 from app.models import Turma
 from app import db
+from app.serializacao import serializar_turma
+from app.cache import em_cache, invalidar_cache
+from app.versoes import condicional, registrar_alteracao
+from app.tokens import GESTAO, restringir
 
 turmas_bp = Blueprint('turmas', __name__)
+restringir(turmas_bp, escrita=GESTAO)
 
 @turmas_bp.route('/', methods=['GET'])
+@condicional('turmas')
+@em_cache('turmas')
 def get_turmas():
     """
     Listar todas as turmas
@@ -31,12 +38,7 @@ def get_turmas():
           ]
     """
     turmas = Turma.query.all()
-    return jsonify([{
-        'id_turma': turma.id_turma,
-        'nome_turma': turma.nome_turma,
-        'id_professor': turma.id_professor,
-        'horario': turma.horario
-    } for turma in turmas])
+    return jsonify([serializar_turma(turma) for turma in turmas])
 
 @turmas_bp.route('/', methods=['POST'])
 def create_turma():
@@ -94,7 +96,9 @@ def create_turma():
         )
         
         db.session.add(turma)
+        registrar_alteracao('turmas')
         db.session.commit()
+        invalidar_cache('turmas')
         
         return jsonify({'message': 'Turma criada com sucesso', 'id': turma.id_turma}), 201
         
@@ -103,6 +107,8 @@ def create_turma():
         return jsonify({'error': 'Erro ao criar turma'}), 500
 
 @turmas_bp.route('/<int:id_turma>', methods=['GET'])
+@condicional('turmas')
+@em_cache('turmas')
 def get_turma(id_turma):
     """
     Buscar uma turma pelo ID
@@ -130,12 +136,7 @@ def get_turma(id_turma):
         description: Turma não encontrada
     """
     turma = Turma.query.get_or_404(id_turma)
-    return jsonify({
-        'id_turma': turma.id_turma,
-        'nome_turma': turma.nome_turma,
-        'id_professor': turma.id_professor,
-        'horario': turma.horario
-    })
+    return jsonify(serializar_turma(turma))
 
 @turmas_bp.route('/<int:id_turma>', methods=['PUT'])
 def update_turma(id_turma):
@@ -196,7 +197,9 @@ def update_turma(id_turma):
         if 'horario' in data:
             turma.horario = data['horario']
         
+        registrar_alteracao('turmas')
         db.session.commit()
+        invalidar_cache('turmas', f'alunos:turma:{id_turma}')
         return jsonify({'message': 'Turma atualizada com sucesso'})
         
     except Exception as e:
@@ -233,7 +236,9 @@ def delete_turma(id_turma):
     
     try:
         db.session.delete(turma)
+        registrar_alteracao('turmas', 'alunos')
         db.session.commit()
+        invalidar_cache('turmas', 'alunos', 'chatbot')
         return jsonify({'message': 'Turma excluída com sucesso'})
     except Exception as e:
         db.session.rollback()
@@ -0,0 +1,63 @@
+"""
+Hash de senhas com custo configurável (SENHA_METODO, formato do werkzeug.security).
+
+Exemplos: "scrypt:32768:8:1" (n, r, p) ou "pbkdf2:sha256:600000" (iterações).
+O cálculo roda em um pool de threads limitado (SENHA_THREADS) com uma fila também limitada
+(SENHA_FILA): o hashlib libera o GIL durante o hash, então uma rajada de logins ocupa no
+máximo SENHA_THREADS núcleos e as demais requisições do worker continuam sendo atendidas.
+Quando o pool e a fila estão cheios, SobrecargaSenhas é levantada e o login responde 503.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from werkzeug.security import check_password_hash, generate_password_hash
+import hmac
+import threading
+
+METODOS_HASH = ('scrypt:', 'pbkdf2:')
+
+class SobrecargaSenhas(Exception):
+    """Pool de hash de senhas ocupado além do limite da fila"""
+
+def eh_hash(valor):
+    """Diferencia um hash do werkzeug de uma senha ainda em texto puro (linhas antigas)"""
+    return valor.startswith(METODOS_HASH) and valor.count('$') == 2
+
+class HasherSenhas:
+    def __init__(self, metodo='scrypt:32768:8:1', threads=2, fila=32, espera=2.0):
+        self.metodo = metodo
+        self.espera = espera
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='senhas')
+        self._vagas = threading.BoundedSemaphore(threads + fila)
+
+    @cached_property
+    def _hash_ficticio(self):
+        # Hash de referência para que login inexistente custe o mesmo que senha errada
+        return generate_password_hash('senha-ficticia', method=self.metodo)
+
+    def gerar(self, senha):
+        return self._executar(generate_password_hash, senha, method=self.metodo)
+
+    def verificar(self, armazenado, senha):
+        """
+        Retorna (senha_correta, precisa_rehash). precisa_rehash indica que o valor armazenado
+        está em texto puro ou com parâmetros diferentes de SENHA_METODO.
+        """
+        if armazenado is None:
+            self._executar(check_password_hash, self._hash_ficticio, senha)
+            return False, False
+        if not eh_hash(armazenado):
+            return hmac.compare_digest(armazenado.encode('utf-8'), senha.encode('utf-8')), True
+        correta = self._executar(check_password_hash, armazenado, senha)
+        return correta, correta and armazenado.split('$', 1)[0] != self.metodo
+
+    def gerar_varios(self, senhas):
+        """Hash de várias senhas em paralelo no pool (migração)"""
+        return list(self._executor.map(lambda senha: generate_password_hash(senha, method=self.metodo), senhas))
+
+    def _executar(self, funcao, *args, **kwargs):
+        if not self._vagas.acquire(timeout=self.espera):
+            raise SobrecargaSenhas()
+        try:
+            return self._executor.submit(funcao, *args, **kwargs).result()
+        finally:
+            self._vagas.release()
@@ -0,0 +1,89 @@
+"""
+Serialização das respostas da API.
+
+OrjsonProvider substitui o provider JSON padrão do Flask: date/datetime saem em ISO 8601
+direto pelo orjson e Decimal sai como número JSON com os dígitos exatos do banco
+(800.00), sem passar por float. As funções serializar_* montam o dicionário de cada
+modelo e são usadas por todas as rotas, que não precisam mais converter campo a campo.
+"""
+from flask.json.provider import JSONProvider
+from decimal import Decimal
+import orjson
+
+def _padrao(valor):
+    if isinstance(valor, Decimal):
+        return orjson.Fragment(str(valor))
+    raise TypeError(f'Tipo não serializável: {type(valor).__name__}')
+
+def dumps_bytes(obj):
+    """Serializa para bytes JSON (também usado na exportação NDJSON)"""
+    return orjson.dumps(obj, default=_padrao, option=orjson.OPT_NON_STR_KEYS)
+
+class OrjsonProvider(JSONProvider):
+    def dumps(self, obj, **kwargs):
+        return dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype='application/json')
+
+def serializar_aluno(aluno):
+    return {
+        'id_aluno': aluno.id_aluno,
+        'nome_completo': aluno.nome_completo,
+        'data_nascimento': aluno.data_nascimento,
+        'id_turma': aluno.id_turma,
+        'nome_responsavel': aluno.nome_responsavel,
+        'telefone_responsavel': aluno.telefone_responsavel,
+        'email_responsavel': aluno.email_responsavel,
+        'informacoes_adicionais': aluno.informacoes_adicionais
+    }
+
+def serializar_professor(professor):
+    return {
+        'id_professor': professor.id_professor,
+        'nome_completo': professor.nome_completo,
+        'email': professor.email,
+        'telefone': professor.telefone
+    }
+
+def serializar_turma(turma):
+    return {
+        'id_turma': turma.id_turma,
+        'nome_turma': turma.nome_turma,
+        'id_professor': turma.id_professor,
+        'horario': turma.horario
+    }
+
+def serializar_pagamento(pagamento, incluir_aluno=True):
+    dados = {'id_pagamento': pagamento.id_pagamento}
+    if incluir_aluno:
+        dados['id_aluno'] = pagamento.id_aluno
+    dados.update({
+        'data_pagamento': pagamento.data_pagamento,
+        'valor_pago': pagamento.valor_pago,
+        'forma_pagamento': pagamento.forma_pagamento,
+        'referencia': pagamento.referencia,
+        'status': pagamento.status
+    })
+    return dados
+
+def serializar_presenca(presenca, incluir_aluno=True):
+    dados = {'id_presenca': presenca.id_presenca}
+    if incluir_aluno:
+        dados['id_aluno'] = presenca.id_aluno
+    dados.update({
+        'data_presenca': presenca.data_presenca,
+        'presente': presenca.presente
+    })
+    return dados
+
+def serializar_atividade(atividade):
+    return {
+        'id_atividade': atividade.id_atividade,
+        'descricao': atividade.descricao,
+        'data_realizacao': atividade.data_realizacao
+    }
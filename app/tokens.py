@@ -0,0 +1,133 @@
+"""
+Tokens de acesso assinados (HMAC-SHA256 com a SECRET_KEY) e controle de acesso por nível.
+
+O login devolve um token com id_usuario, nivel_acesso, id_professor, um identificador
+único (jti) e o horário de emissão; o cliente o envia em "Authorization: Bearer <token>".
+O hook autenticar (before_request da aplicação) confere a assinatura e a validade
+(TOKEN_VALIDADE segundos) e guarda os dados em g.usuario, sem consultar o banco.
+Cada blueprint declara os níveis que podem ler e gravar com restringir(...).
+
+O logout revoga o token pelo jti em uma lista em memória, mantida só até o token expirar.
+A lista é de cada worker: com vários workers do gunicorn um token revogado ainda pode ser
+aceito pelos outros até expirar, então TOKEN_VALIDADE deve ser curta.
+"""
+from flask import current_app, g, jsonify, request
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from functools import wraps
+import hashlib
+import threading
+import time
+import uuid
+
+NIVEIS = ('administrador', 'secretaria', 'professor')
+GESTAO = ('administrador', 'secretaria')
+
+# Rotas que não exigem token
+ENDPOINTS_PUBLICOS = {'auth.login', 'index', 'static', 'prometheus_metrics'}
+BLUEPRINTS_PUBLICOS = {'flasgger'}
+
+METODOS_LEITURA = {'GET', 'HEAD', 'OPTIONS'}
+
+class TokenInvalido(Exception):
+    """Token ausente, adulterado, expirado ou revogado"""
+
+class ListaRevogacao:
+    """jti -> instante (time.time) em que o token expiraria; entradas vencidas são descartadas"""
+
+    def __init__(self):
+        self._revogados = {}
+        self._lock = threading.Lock()
+
+    def revogar(self, jti, expira_em):
+        with self._lock:
+            self._limpar(time.time())
+            self._revogados[jti] = expira_em
+
+    def revogado(self, jti):
+        expira_em = self._revogados.get(jti)
+        return expira_em is not None and expira_em > time.time()
+
+    def _limpar(self, agora):
+        vencidos = [jti for jti, expira_em in self._revogados.items() if expira_em <= agora]
+        for jti in vencidos:
+            del self._revogados[jti]
+
+class GerenciadorTokens:
+    def __init__(self, segredo, validade=8 * 3600):
+        self.validade = validade
+        self.revogacao = ListaRevogacao()
+        self._serializador = URLSafeTimedSerializer(
+            segredo, salt='token-acesso', signer_kwargs={'digest_method': hashlib.sha256}
+        )
+
+    def emitir(self, usuario):
+        """Token para o usuário e o instante (time.time) em que ele expira"""
+        token = self._serializador.dumps({
+            'id_usuario': usuario.id_usuario,
+            'nivel_acesso': usuario.nivel_acesso,
+            'id_professor': usuario.id_professor,
+            'jti': uuid.uuid4().hex
+        })
+        return token, int(time.time()) + self.validade
+
+    def verificar(self, token):
+        """Dados do token; acrescenta 'expira_em'. Levanta TokenInvalido"""
+        try:
+            dados, emitido_em = self._serializador.loads(token, max_age=self.validade, return_timestamp=True)
+        except SignatureExpired:
+            raise TokenInvalido('Token expirado')
+        except BadSignature:
+            raise TokenInvalido('Token inválido')
+        if self.revogacao.revogado(dados['jti']):
+            raise TokenInvalido('Token revogado')
+        dados['expira_em'] = int(emitido_em.timestamp()) + self.validade
+        return dados
+
+    def revogar(self, dados):
+        self.revogacao.revogar(dados['jti'], dados['expira_em'])
+
+def _nao_autorizado(mensagem):
+    return jsonify({'error': mensagem}), 401, {'WWW-Authenticate': 'Bearer'}
+
+def autenticar():
+    """before_request da aplicação: exige um token válido fora das rotas públicas"""
+    if request.method == 'OPTIONS' or request.endpoint is None:
+        return None
+    if request.endpoint in ENDPOINTS_PUBLICOS or request.blueprint in BLUEPRINTS_PUBLICOS:
+        return None
+
+    tipo, _, token = request.headers.get('Authorization', '').partition(' ')
+    if tipo.lower() != 'bearer' or not token:
+        return _nao_autorizado('Token de acesso não informado')
+    try:
+        g.usuario = current_app.extensions['tokens'].verificar(token.strip())
+    except TokenInvalido as e:
+        return _nao_autorizado(str(e))
+    return None
+
+def _proibido():
+    return jsonify({'error': 'Acesso não permitido para este nível de usuário'}), 403
+
+def restringir(blueprint, leitura=NIVEIS, escrita=NIVEIS):
+    """Níveis que podem fazer leituras (GET) e gravações (POST/PUT/DELETE) no blueprint"""
+    @blueprint.before_request
+    def verificar_nivel():
+        usuario = g.get('usuario')
+        if usuario is None:
+            return None  # Rota pública
+        niveis = leitura if request.method in METODOS_LEITURA else escrita
+        if usuario['nivel_acesso'] not in niveis:
+            return _proibido()
+        return None
+
+def exige_nivel(*niveis):
+    """Decorador para rotas com níveis mais restritos que os do blueprint"""
+    def decorador(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            usuario = g.get('usuario')
+            if usuario is None or usuario['nivel_acesso'] not in niveis:
+                return _proibido()
+            return view(*args, **kwargs)
+        return wrapper
+    return decorador
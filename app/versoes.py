@@ -0,0 +1,109 @@
+"""
+Respostas condicionais (ETag / Last-Modified) nas rotas de leitura.
+
+Cada gravação nas rotas chama registrar_alteracao com os recursos alterados, na mesma
+transação e logo antes do commit. As rotas GET usam @condicional com os recursos de que a
+resposta depende: a ETag é derivada da URL e das versões desses recursos, então um
+If-None-Match (ou If-Modified-Since) válido recebe 304 lendo apenas versoes_recursos,
+sem consultar as linhas do recurso.
+"""
+from flask import g, make_response, request
+from app import db
+from app.dialeto import upsert
+from app.models import VersaoRecurso
+from sqlalchemy import select, update
+from datetime import datetime, timezone
+from functools import wraps
+import hashlib
+
+def _agora():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def registrar_alteracao(*recursos):
+    """Incrementa a versão dos recursos informados (deve ser chamada antes do commit)"""
+    agora = _agora()
+    tabela = VersaoRecurso.__table__
+    stmt = upsert(tabela, ['recurso'], ['atualizado_em'], versao=tabela.c.versao + 1)
+    if stmt is not None:
+        db.session.execute(stmt, [
+            {'recurso': recurso, 'versao': 1, 'atualizado_em': agora} for recurso in set(recursos)
+        ])
+        return
+
+    for recurso in set(recursos):
+        resultado = db.session.execute(
+            update(tabela)
+            .where(tabela.c.recurso == recurso)
+            .values(versao=tabela.c.versao + 1, atualizado_em=agora)
+        )
+        if not resultado.rowcount:
+            db.session.add(VersaoRecurso(recurso=recurso, versao=1, atualizado_em=agora))
+
+def _versoes(recursos):
+    """Versões atuais e data da última alteração entre os recursos"""
+    linhas = db.session.execute(
+        select(VersaoRecurso.recurso, VersaoRecurso.versao, VersaoRecurso.atualizado_em)
+        .where(VersaoRecurso.recurso.in_(recursos))
+    ).all()
+    versoes = {linha.recurso: linha.versao for linha in linhas}
+    modificado_em = max((linha.atualizado_em for linha in linhas), default=None)
+    return [versoes.get(recurso, 0) for recurso in recursos], modificado_em
+
+def versao_recursos(*recursos):
+    """Versões atuais dos recursos em texto ('3.7'), para chaves de cache fora das rotas com @condicional"""
+    versoes, _ = _versoes(recursos)
+    return '.'.join(map(str, versoes))
+
+def _etag(versoes):
+    # A representação depende da URL (filtros, cursor, format) e do Accept (modo exportação)
+    chave = '|'.join([request.full_path, request.headers.get('Accept', ''), *map(str, versoes)])
+    return hashlib.sha1(chave.encode('utf-8')).hexdigest()
+
+def _ultima_modificacao(modificado_em):
+    """
+    Last-Modified tem precisão de segundos: só é enviado depois que o segundo da última
+    alteração terminou, para que outra gravação no mesmo segundo não passe despercebida.
+    """
+    if modificado_em is None:
+        return None
+    modificado_em = modificado_em.replace(microsecond=0, tzinfo=timezone.utc)
+    if modificado_em >= datetime.now(timezone.utc).replace(microsecond=0):
+        return None
+    return modificado_em
+
+def _nao_modificado(etag, ultima_modificacao):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and ultima_modificacao:
+        return ultima_modificacao <= request.if_modified_since
+    return False
+
+def condicional(*recursos):
+    """
+    Decorador das rotas GET: envia ETag/Last-Modified e responde 304 quando o cliente
+    já tem a versão atual. As versões são lidas antes dos dados, então a ETag nunca é
+    mais nova que o corpo (no pior caso o cliente baixa de novo na próxima requisição).
+    """
+    def decorador(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            versoes, modificado_em = _versoes(recursos)
+            etag = _etag(versoes)
+            g.etag_recursos = etag  # Usada como chave pelo cache de leitura (app.cache)
+            ultima_modificacao = _ultima_modificacao(modificado_em)
+
+            if _nao_modificado(etag, ultima_modificacao):
+                resposta = make_response('', 304)
+            else:
+                resposta = make_response(view(*args, **kwargs))
+                if resposta.status_code != 200:
+                    return resposta
+
+            resposta.set_etag(etag)
+            if ultima_modificacao:
+                resposta.last_modified = ultima_modificacao
+            resposta.headers['Cache-Control'] = 'no-cache'
+            resposta.vary.add('Accept')
+            return resposta
+        return wrapper
+    return decorador
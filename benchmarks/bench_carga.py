@@ -0,0 +1,239 @@
+"""
+Driver de carga concorrente com uma mistura de cenários realistas.
+
+Vários clientes simultâneos repetem, durante --duracao segundos, cenários sorteados com os
+pesos de --mistura:
+
+- chamada_matinal: o professor abre a lista da turma, registra a chamada do dia em lote e
+  consulta as atividades da turma;
+- inicio_do_mes: a secretaria confere o Dashboard, a inadimplência, o relatório do mês e os
+  pagamentos de alguns alunos;
+- chatbot: uma rajada de mensagens de pais (benchmarks/mensagens_pais.txt) sem pausa.
+
+Sem --url a carga roda na própria aplicação, com o cliente de testes e dados gerados em um
+SQLite temporário (ou no banco de DATABASE_URL): serve para comparar mudanças no código,
+não para medir o servidor. Com --url a carga vai por HTTP a uma API já rodando (gunicorn),
+cujo banco deve ter sido populado com `python -m benchmarks.dados` e a mesma escala; os
+limites de requisição do servidor contam como erro 429, então desligue-os (LIMITE_*="")
+para medir vazão. O resultado, por operação e no total, vai para benchmarks/resultados.
+
+    python -m benchmarks.bench_carga [--clientes 8] [--duracao 15] [--mistura chatbot=1]
+    python -m benchmarks.bench_carga --url http://localhost:5000 --clientes 32 --anos 2
+"""
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from benchmarks.dados import adicionar_argumentos_escala, descrever, escala_dos_argumentos
+from benchmarks.resultados import estatisticas, salvar
+
+MISTURA_PADRAO = 'chamada_matinal=3,inicio_do_mes=1,chatbot=4'
+MENSAGENS = [
+    linha for linha in Path(__file__).with_name('mensagens_pais.txt').read_text(encoding='utf-8').splitlines()
+    if linha.strip()
+]
+
+class AlvoLocal:
+    """A aplicação no próprio processo, pelo cliente de testes do Flask"""
+
+    def __init__(self, app):
+        self.app = app
+        self.banco = None
+        self.temporario = None
+
+    def requisitar(self, metodo, caminho, token, corpo=None):
+        inicio = time.perf_counter()
+        resposta = self.app.test_client().open(
+            caminho, method=metodo, json=corpo, headers={'Authorization': f'Bearer {token}'}
+        )
+        resposta.get_data()
+        return resposta.status_code, time.perf_counter() - inicio
+
+    def tokens(self, descricao):
+        from app.models import Usuario
+        with self.app.app_context():
+            usuarios = Usuario.query.filter(Usuario.login.like('bench.%')).all()
+            return {usuario.login: self.app.extensions['tokens'].emitir(usuario)[0] for usuario in usuarios}
+
+class AlvoHTTP:
+    """API já rodando em url; uma sessão HTTP (conexões reaproveitadas) por thread"""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.banco = 'remoto'
+        self._local = threading.local()
+
+    def _sessao(self):
+        import requests
+        if not hasattr(self._local, 'sessao'):
+            self._local.sessao = requests.Session()
+        return self._local.sessao
+
+    def requisitar(self, metodo, caminho, token, corpo=None):
+        inicio = time.perf_counter()
+        resposta = self._sessao().request(
+            metodo, self.url + caminho, json=corpo, headers={'Authorization': f'Bearer {token}'}, timeout=60
+        )
+        return resposta.status_code, time.perf_counter() - inicio
+
+    def tokens(self, descricao):
+        logins = [descricao['administrador'], descricao['secretaria']]
+        logins += [turma['login_professor'] for turma in descricao['turmas']]
+        tokens = {}
+        for login in logins:
+            resposta = self._sessao().post(f'{self.url}/api/auth/login', json={'login': login, 'senha': descricao['senha']}, timeout=60)
+            resposta.raise_for_status()
+            tokens[login] = resposta.json()['token']
+        return tokens
+
+def chamada_matinal(alvo, contexto, aleatorio, registrar):
+    turma = aleatorio.choice(contexto['turmas'])
+    token = contexto['tokens'][turma['login_professor']]
+    dia = aleatorio.choice(contexto['dias_carga'])
+    registrar('alunos_da_turma', *alvo.requisitar('GET', f"/api/alunos/?id_turma={turma['id_turma']}&limit=100", token))
+    registrar('registrar_chamada', *alvo.requisitar('POST', '/api/presencas/chamada', token, {
+        'data_presenca': str(dia), 'id_turma': turma['id_turma'],
+        'presencas': [{'id_aluno': id_aluno, 'presente': aleatorio.random() < 0.92} for id_aluno in turma['alunos']],
+    }))
+    registrar('atividades_da_turma', *alvo.requisitar('GET', f"/api/atividades/turma/{turma['id_turma']}", token))
+
+def inicio_do_mes(alvo, contexto, aleatorio, registrar):
+    token = contexto['tokens'][contexto['secretaria']]
+    mes = contexto['ultimo_dia'].replace(day=1)
+    registrar('dashboard', *alvo.requisitar('GET', '/api/dashboard/resumo', token))
+    registrar('inadimplencia', *alvo.requisitar('GET', '/api/pagamentos/relatorio/inadimplencia', token))
+    registrar('relatorio_do_mes', *alvo.requisitar(
+        'GET', f"/api/pagamentos/relatorio/periodo?data_inicio={mes}&data_fim={contexto['ultimo_dia']}", token))
+    for _ in range(3):
+        id_aluno = aleatorio.randint(1, contexto['alunos'])
+        registrar('pagamentos_do_aluno', *alvo.requisitar('GET', f'/api/pagamentos/aluno/{id_aluno}', token))
+
+def chatbot(alvo, contexto, aleatorio, registrar):
+    turma = aleatorio.choice(contexto['turmas'])
+    token = contexto['tokens'][turma['login_professor']]
+    id_aluno = aleatorio.choice(turma['alunos'])
+    for _ in range(aleatorio.randint(3, 8)):
+        registrar('mensagem', *alvo.requisitar(
+            'POST', '/api/chatbot/mensagem', token, {'mensagem': aleatorio.choice(MENSAGENS), 'id_aluno': id_aluno}))
+
+CENARIOS = {'chamada_matinal': chamada_matinal, 'inicio_do_mes': inicio_do_mes, 'chatbot': chatbot}
+
+def ler_mistura(valor):
+    """'chamada_matinal=3,chatbot=4' -> {cenario: peso}"""
+    mistura = {}
+    for item in filter(None, (parte.strip() for parte in valor.split(','))):
+        nome, _, peso = item.partition('=')
+        if nome not in CENARIOS:
+            raise ValueError(f"Cenário desconhecido: {nome} (use {', '.join(CENARIOS)})")
+        mistura[nome] = float(peso or 1)
+    return mistura
+
+def executar(alvo, contexto, mistura, clientes, duracao, semente):
+    """Roda os clientes até o fim da duração; retorna as medidas, as iterações por cenário e a duração real"""
+    medidas = defaultdict(list)  # (cenario, operacao) -> [(status, segundos)]
+    iteracoes = Counter()
+    lock = threading.Lock()
+    fim = time.monotonic() + duracao
+    nomes, pesos = list(mistura), list(mistura.values())
+
+    def cliente(numero):
+        aleatorio = random.Random(semente * 1000 + numero)
+        while time.monotonic() < fim:
+            cenario = aleatorio.choices(nomes, pesos)[0]
+            locais = []
+            CENARIOS[cenario](alvo, contexto, aleatorio, lambda operacao, status, segundos: locais.append((operacao, status, segundos)))
+            with lock:
+                iteracoes[cenario] += 1
+                for operacao, status, segundos in locais:
+                    medidas[(cenario, operacao)].append((status, segundos))
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clientes) as executor:
+        list(executor.map(cliente, range(clientes)))
+    return medidas, iteracoes, time.perf_counter() - inicio
+
+def resumir(medidas, iteracoes, decorrido):
+    resultados = {}
+    todas = []
+    for (cenario, operacao), lista in sorted(medidas.items()):
+        todas.extend(lista)
+        resultados[f'{cenario}.{operacao}'] = {
+            **estatisticas([segundos for _, segundos in lista]),
+            'erros': sum(1 for status, _ in lista if status >= 400),
+            'status': dict(Counter(str(status) for status, _ in lista)),
+        }
+    resultados['total'] = {
+        **estatisticas([segundos for _, segundos in todas]),
+        'erros': sum(1 for status, _ in todas if status >= 400),
+        'vazao_rps': round(len(todas) / decorrido, 1),
+        'iteracoes': dict(iteracoes),
+    }
+    return resultados
+
+def _preparar_local(escala):
+    """Aplicação com os dados gerados; SQLite em arquivo temporário se não houver DATABASE_URL"""
+    temporario = None
+    if 'DATABASE_URL' not in os.environ:
+        # Em memória há uma única conexão compartilhada, o que não aguenta clientes simultâneos
+        temporario = tempfile.mkdtemp(prefix='bench-carga-')
+        os.environ['DATABASE_URL'] = f"sqlite:///{Path(temporario) / 'escola.db'}"
+    from benchmarks.dados import criar_aplicacao, gerar
+    from app import db
+    app = criar_aplicacao()
+    with app.app_context():
+        gerar(**escala)
+        banco = db.engine.dialect.name
+    alvo = AlvoLocal(app)
+    alvo.banco = banco
+    alvo.temporario = temporario
+    return alvo
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Carga concorrente com a mistura de cenários')
+    parser.add_argument('--url', help='API já rodando (sem ela, carga na aplicação local)')
+    parser.add_argument('--clientes', type=int, default=8)
+    parser.add_argument('--duracao', type=float, default=15, help='Segundos de carga')
+    parser.add_argument('--mistura', default=MISTURA_PADRAO)
+    parser.add_argument('--saida', help='Arquivo JSON do resultado (padrão: benchmarks/resultados/)')
+    adicionar_argumentos_escala(parser)
+    argumentos = parser.parse_args(argv)
+    escala = escala_dos_argumentos(argumentos)
+    mistura = ler_mistura(argumentos.mistura)
+
+    descricao = descrever(**escala)
+    alvo = AlvoHTTP(argumentos.url) if argumentos.url else _preparar_local(escala)
+    proximo = descricao['ultimo_dia'] + timedelta(days=1)
+    contexto = {
+        **descricao,
+        'tokens': alvo.tokens(descricao),
+        # Dias após os dados gerados: a primeira chamada de cada turma cria, as seguintes atualizam
+        'dias_carga': [proximo + timedelta(days=dias) for dias in range(5)],
+    }
+
+    print(f"{argumentos.clientes} clientes por {argumentos.duracao:.0f}s, mistura {mistura}, alvo {argumentos.url or alvo.banco}")
+    medidas, iteracoes, decorrido = executar(alvo, contexto, mistura, argumentos.clientes, argumentos.duracao, escala['semente'])
+    resultados = resumir(medidas, iteracoes, decorrido)
+    if not argumentos.url:
+        alvo.app.extensions['registro_conversas'].encerrar()
+        if alvo.temporario:
+            shutil.rmtree(alvo.temporario, ignore_errors=True)
+
+    print(f"{'operação':<40}{'n':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'erros':>7}")
+    for nome, medida in resultados.items():
+        print(f"{nome:<40}{medida['n']:>7}{medida['p50_ms']:>9.2f}{medida['p95_ms']:>9.2f}{medida['p99_ms']:>9.2f}{medida['erros']:>7}")
+    print(f"vazão: {resultados['total']['vazao_rps']} req/s, iterações: {dict(iteracoes)}")
+
+    parametros = {**escala, 'clientes': argumentos.clientes, 'duracao': argumentos.duracao,
+                  'mistura': mistura, 'url': argumentos.url}
+    print(f"\nresultado: {salvar('carga', parametros, resultados, alvo.banco, argumentos.saida)}")
+
+if __name__ == '__main__':
+    main()
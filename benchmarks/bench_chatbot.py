@@ -0,0 +1,60 @@
+"""
+Micro-benchmark da classificação de intenções do ChatBot.
+
+Compara a varredura linear antiga (any(palavra in mensagem) por intenção) com o
+classificador compilado de app.intencoes sobre as mensagens de mensagens_pais.txt.
+
+    python -m benchmarks.bench_chatbot [repeticoes]
+"""
+from pathlib import Path
+import sys
+import time
+
+from app.intencoes import ClassificadorIntencoes
+from app.routes.chatbot import ChatBot
+
+CORPUS = Path(__file__).with_name('mensagens_pais.txt')
+
+def classificar_linear(palavras_por_intencao, mensagem):
+    """Implementação anterior: primeira intenção com alguma palavra contida na mensagem"""
+    mensagem = mensagem.lower().strip()
+    for intencao, palavras in palavras_por_intencao.items():
+        if any(palavra in mensagem for palavra in palavras):
+            return intencao
+    return None
+
+def medir(funcao, mensagens, repeticoes):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        for mensagem in mensagens:
+            funcao(mensagem)
+    duracao = time.perf_counter() - inicio
+    return repeticoes * len(mensagens) / duracao
+
+def main(repeticoes=2000):
+    mensagens = [linha for linha in CORPUS.read_text(encoding='utf-8').splitlines() if linha.strip()]
+    palavras = ChatBot().responses
+
+    inicio = time.perf_counter()
+    classificador = ClassificadorIntencoes(palavras)
+    construcao = time.perf_counter() - inicio
+
+    linear = medir(lambda m: classificar_linear(palavras, m), mensagens, repeticoes)
+    compilado = medir(classificador.classificar, mensagens, repeticoes)
+
+    divergencias = [
+        (m, classificar_linear(palavras, m), classificador.classificar(m))
+        for m in mensagens
+        if classificar_linear(palavras, m) != classificador.classificar(m)
+    ]
+
+    print(f'{len(mensagens)} mensagens x {repeticoes} repetições')
+    print(f'construção do classificador: {construcao * 1000:.2f} ms')
+    print(f'varredura linear: {linear:,.0f} mensagens/s')
+    print(f'classificador:    {compilado:,.0f} mensagens/s ({compilado / linear:.2f}x)')
+    print(f'\n{len(divergencias)} mensagens classificadas de forma diferente (linear -> compilado):')
+    for mensagem, antes, depois in divergencias:
+        print(f'  {mensagem!r}: {antes} -> {depois}')
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
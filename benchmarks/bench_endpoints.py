@@ -0,0 +1,116 @@
+"""
+Micro-benchmark das rotas da API com o cliente de testes do Flask.
+
+Gera os dados sintéticos (benchmarks.dados) no banco de DATABASE_URL (SQLite em memória por
+padrão) e chama cada rota de ENDPOINTS algumas vezes em sequência, como administrador,
+registrando latência, comandos SQL e tempo no banco (cabeçalhos X-SQL-* de
+app.instrumentacao). O cache de leitura e o do Dashboard ficam desligados, a não ser com
+--cache, para medir o trabalho da rota e não o acerto do cache. O resultado vai para
+benchmarks/resultados e pode ser comparado com python -m benchmarks.resultados.
+
+    python -m benchmarks.bench_endpoints [--repeticoes 30] [--filtro pagamentos] [--anos 2 ...]
+"""
+from datetime import timedelta
+import argparse
+import time
+
+from benchmarks.dados import adicionar_argumentos_escala, criar_aplicacao, escala_dos_argumentos, gerar
+from benchmarks.resultados import estatisticas, salvar
+
+def endpoints(descricao):
+    """(nome, método, url, corpo) das rotas medidas, com ids e datas que existem na escala"""
+    turma = descricao['turmas'][0]
+    aluno = turma['alunos'][0]
+    ultimo_dia = descricao['ultimo_dia']
+    mes = ultimo_dia.replace(day=1)
+    ano = ultimo_dia.year
+    return [
+        ('alunos.lista', 'GET', '/api/alunos/?limit=50', None),
+        ('alunos.turma', 'GET', f"/api/alunos/?id_turma={turma['id_turma']}&limit=100", None),
+        ('alunos.nome', 'GET', '/api/alunos/?nome=ana', None),
+        ('alunos.um', 'GET', f'/api/alunos/{aluno}', None),
+        ('turmas.lista', 'GET', '/api/turmas/', None),
+        ('turmas.uma', 'GET', f"/api/turmas/{turma['id_turma']}", None),
+        ('professores.lista', 'GET', '/api/professores/', None),
+        ('pagamentos.aluno', 'GET', f'/api/pagamentos/aluno/{aluno}', None),
+        ('pagamentos.relatorio_periodo', 'GET', f'/api/pagamentos/relatorio/periodo?data_inicio={mes}&data_fim={ultimo_dia}', None),
+        ('pagamentos.relatorio_ano', 'GET', f'/api/pagamentos/relatorio/periodo?data_inicio={ano}-01-01&data_fim={ano}-12-31', None),
+        ('pagamentos.inadimplencia', 'GET', '/api/pagamentos/relatorio/inadimplencia', None),
+        ('presencas.data', 'GET', f'/api/presencas/data/{ultimo_dia}', None),
+        ('presencas.aluno', 'GET', f'/api/presencas/aluno/{aluno}?data_inicio={ano}-02-01&data_fim={ultimo_dia}', None),
+        ('presencas.relatorio_diario', 'GET', f'/api/presencas/relatorio/diario/{ultimo_dia}', None),
+        ('presencas.relatorio_frequencia', 'GET',
+         f"/api/presencas/relatorio/frequencia?data_inicio={ano}-02-01&data_fim={ultimo_dia}&id_turma={turma['id_turma']}", None),
+        ('presencas.chamada', 'POST', '/api/presencas/chamada', {
+            'data_presenca': str(ultimo_dia + timedelta(days=3)), 'id_turma': turma['id_turma'],
+            'presencas': [{'id_aluno': id_aluno, 'presente': True} for id_aluno in turma['alunos']],
+        }),
+        ('atividades.periodo', 'GET', f'/api/atividades/?data_inicio={mes}&data_fim={ultimo_dia}', None),
+        ('atividades.aluno', 'GET', f'/api/atividades/aluno/{aluno}?data_inicio={ano}-02-01&data_fim={ultimo_dia}', None),
+        ('atividades.turma', 'GET', f"/api/atividades/turma/{turma['id_turma']}", None),
+        ('atividades.relatorio_periodo', 'GET', f'/api/atividades/relatorio/periodo?data_inicio={mes}&data_fim={ultimo_dia}', None),
+        ('dashboard.resumo', 'GET', '/api/dashboard/resumo', None),
+        ('chatbot.pagamentos', 'POST', '/api/chatbot/mensagem', {'mensagem': 'tenho pagamentos pendentes?', 'id_aluno': aluno}),
+        ('chatbot.frequencia', 'POST', '/api/chatbot/mensagem', {'mensagem': 'como está a frequência do mês?', 'id_aluno': aluno}),
+        ('chatbot.geral', 'POST', '/api/chatbot/mensagem', {'mensagem': 'qual o horário de funcionamento?'}),
+    ]
+
+def medir(client, metodo, url, corpo, repeticoes, aquecimento=3):
+    for _ in range(aquecimento):
+        client.open(url, method=metodo, json=corpo)
+    duracoes, comandos, tempo_sql, erros = [], 0, 0.0, 0
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resposta = client.open(url, method=metodo, json=corpo)
+        resposta.get_data()
+        duracoes.append(time.perf_counter() - inicio)
+        erros += resposta.status_code >= 400
+        comandos += int(resposta.headers.get('X-SQL-Comandos', 0))
+        tempo_sql += float(resposta.headers.get('X-SQL-Tempo-Ms', 0))
+    return {
+        **estatisticas(duracoes),
+        'erros': erros,
+        'comandos_sql': round(comandos / repeticoes, 1),
+        'tempo_sql_ms': round(tempo_sql / repeticoes, 3),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Micro-benchmark das rotas da API')
+    parser.add_argument('--repeticoes', type=int, default=30)
+    parser.add_argument('--filtro', default='', help='Só as rotas cujo nome contém o texto')
+    parser.add_argument('--cache', action='store_true', help='Mantém o cache de leitura ligado')
+    parser.add_argument('--saida', help='Arquivo JSON do resultado (padrão: benchmarks/resultados/)')
+    adicionar_argumentos_escala(parser)
+    argumentos = parser.parse_args(argv)
+    escala = escala_dos_argumentos(argumentos)
+
+    app = criar_aplicacao()
+    if not argumentos.cache:
+        app.extensions['cache'].ttl = 0
+        app.config['DASHBOARD_CACHE_TTL'] = 0
+    from app import db
+    from app.models import Usuario
+    with app.app_context():
+        inicio = time.perf_counter()
+        descricao = gerar(**escala)
+        print(f"dados: {descricao['alunos']} alunos, anos {descricao['anos']} ({time.perf_counter() - inicio:.1f}s)")
+        banco = db.engine.dialect.name
+        token, _ = app.extensions['tokens'].emitir(Usuario.query.filter_by(login=descricao['administrador']).one())
+
+    client = app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    resultados = {}
+    print(f"{'rota':<34}{'p50 ms':>9}{'p95 ms':>9}{'máx ms':>9}{'SQL':>6}{'SQL ms':>9}{'erros':>7}")
+    for nome, metodo, url, corpo in endpoints(descricao):
+        if argumentos.filtro not in nome:
+            continue
+        medida = resultados[nome] = medir(client, metodo, url, corpo, argumentos.repeticoes)
+        print(f"{nome:<34}{medida['p50_ms']:>9.2f}{medida['p95_ms']:>9.2f}{medida['max_ms']:>9.2f}"
+              f"{medida['comandos_sql']:>6.0f}{medida['tempo_sql_ms']:>9.2f}{medida['erros']:>7}")
+
+    app.extensions['registro_conversas'].encerrar()
+    parametros = {**escala, 'repeticoes': argumentos.repeticoes, 'cache': argumentos.cache}
+    print(f"\nresultado: {salvar('endpoints', parametros, resultados, banco, argumentos.saida)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark de vazão do login com diferentes custos de hash de senha (SENHA_METODO).
+
+Cria a aplicação com SQLite em memória e um usuário já com hash, e mede quantos logins
+por segundo o POST /api/auth/login sustenta com várias requisições simultâneas.
+
+    python -m benchmarks.bench_login [logins_por_metodo] [clientes_simultaneos]
+"""
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+import io
+import os
+import sys
+import time
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+from app import create_app, db
+from app.models import Usuario
+
+METODOS = (
+    'pbkdf2:sha256:260000',
+    'pbkdf2:sha256:600000',
+    'scrypt:16384:8:1',
+    'scrypt:32768:8:1',
+    'scrypt:65536:8:1',
+)
+
+def medir(metodo, logins, clientes):
+    with redirect_stdout(io.StringIO()):  # create_app imprime o mapa de rotas
+        app = create_app()
+    senhas = app.extensions['senhas']
+    senhas.metodo = metodo
+    with app.app_context():
+        db.create_all()
+        db.session.add(Usuario(login='bench', senha=senhas.gerar('senha-bench'), nivel_acesso='administrador'))
+        db.session.commit()
+
+    def logar(_):
+        with app.test_client() as client:
+            return client.post('/api/auth/login', json={'login': 'bench', 'senha': 'senha-bench'}).status_code
+
+    with ThreadPoolExecutor(max_workers=clientes) as executor:
+        inicio = time.perf_counter()
+        status = list(executor.map(logar, range(logins)))
+        duracao = time.perf_counter() - inicio
+
+    with app.app_context():
+        db.drop_all()
+    return logins / duracao, duracao / logins, status.count(503)
+
+def main(logins=40, clientes=8):
+    print(f'{logins} logins por método, {clientes} clientes simultâneos')
+    print(f'{"método":<24}{"logins/s":>10}{"ms/login":>10}{"503":>6}')
+    for metodo in METODOS:
+        vazao, por_login, recusados = medir(metodo, logins, clientes)
+        print(f'{metodo:<24}{vazao:>10.1f}{por_login * 1000:>10.1f}{recusados:>6}')
+
+if __name__ == '__main__':
+    argumentos = [int(a) for a in sys.argv[1:3]]
+    main(*argumentos)
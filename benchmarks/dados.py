@@ -0,0 +1,227 @@
+"""
+Gerador determinístico de dados de escola para os benchmarks.
+
+Cada "escola" é um bloco de turmas com um professor por turma, alunos, os anos letivos
+pedidos de presenças (dias úteis de fevereiro a meados de dezembro, sem julho), uma
+mensalidade por mês letivo e atividades por mês ligadas aos alunos de uma turma. O esquema
+não tem a entidade escola: ela só agrupa os nomes e as atividades. A mesma escala e semente
+geram sempre os mesmos ids e valores, então descrever() diz ao driver de carga quais turmas,
+alunos e logins existem sem precisar consultar o banco que está sob carga.
+
+Também cria os usuários bench.admin, bench.secretaria e bench.professor<N> (senha "bench123").
+
+    python -m benchmarks.dados --escolas 2 --anos 3   # popula o banco vazio de DATABASE_URL
+"""
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+from decimal import Decimal
+import argparse
+import io
+import os
+import random
+import time
+
+ESCALA_PADRAO = {
+    'escolas': 1,
+    'turmas_por_escola': 8,
+    'alunos_por_turma': 25,
+    'anos': 1,
+    'atividades_por_mes': 6,
+    'ano_final': 2024,
+    'semente': 2024,
+}
+SENHA = 'bench123'
+LOTE = 5000
+
+NOMES = ['Ana', 'Bruno', 'Carla', 'Davi', 'Elisa', 'Felipe', 'Gabriela', 'Heitor', 'Isabela', 'João',
+         'Laura', 'Lucas', 'Manuela', 'Miguel', 'Nina', 'Otávio', 'Pedro', 'Rafaela', 'Sofia', 'Theo']
+SOBRENOMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Lima', 'Pereira', 'Costa', 'Rodrigues',
+              'Almeida', 'Nascimento', 'Carvalho', 'Araújo', 'Ribeiro', 'Gomes', 'Martins']
+FORMAS_PAGAMENTO = ['Pix', 'Boleto', 'Cartão de Crédito', 'Transferência']
+MESES_LETIVOS = [2, 3, 4, 5, 6, 8, 9, 10, 11, 12]  # Uma mensalidade por mês com aulas
+
+def dias_letivos(ano):
+    """Dias úteis de 1º de fevereiro a 15 de dezembro, sem as férias de julho"""
+    dia = date(ano, 2, 1)
+    while dia <= date(ano, 12, 15):
+        if dia.weekday() < 5 and dia.month != 7:
+            yield dia
+        dia += timedelta(days=1)
+
+def descrever(**escala):
+    """Ids, turmas, logins e período do que gerar() cria para a escala, sem acessar o banco"""
+    escala = {**ESCALA_PADRAO, **escala}
+    turmas = []
+    id_aluno = 0
+    for escola in range(1, escala['escolas'] + 1):
+        for numero in range(1, escala['turmas_por_escola'] + 1):
+            id_turma = len(turmas) + 1
+            alunos = list(range(id_aluno + 1, id_aluno + escala['alunos_por_turma'] + 1))
+            id_aluno += escala['alunos_por_turma']
+            turmas.append({
+                'id_turma': id_turma, 'id_professor': id_turma, 'escola': escola, 'numero': numero,
+                'alunos': alunos, 'login_professor': f'bench.professor{id_turma}',
+            })
+    anos = list(range(escala['ano_final'] - escala['anos'] + 1, escala['ano_final'] + 1))
+    return {
+        'escala': escala,
+        'turmas': turmas,
+        'alunos': id_aluno,
+        'anos': anos,
+        'ultimo_dia': list(dias_letivos(anos[-1]))[-1],
+        'administrador': 'bench.admin',
+        'secretaria': 'bench.secretaria',
+        'senha': SENHA,
+    }
+
+def gerar(**escala):
+    """Insere os dados da escala no banco vazio do contexto atual; retorna descrever(**escala)"""
+    from flask import current_app
+    from app import db
+    from app.frequencia import recalcular_frequencia
+    from app.models import Aluno, Atividade, AtividadeAluno, Pagamento, Presenca, Professor, Turma, Usuario
+    from app.particoes import criar_particoes, particionada
+
+    descricao = descrever(**escala)
+    escala = descricao['escala']
+    if db.session.query(Aluno.id_aluno).first() is not None:
+        raise RuntimeError('O banco já tem alunos: o gerador precisa de um banco vazio')
+    aleatorio = random.Random(escala['semente'])
+
+    _inserir(Professor, [
+        {'id_professor': turma['id_professor'], 'nome_completo': f"Professor {turma['id_professor']} (Escola {turma['escola']})",
+         'email': f"professor{turma['id_professor']}@escola{turma['escola']}.bench", 'telefone': '(11) 3000-0000'}
+        for turma in descricao['turmas']
+    ])
+    _inserir(Turma, [
+        {'id_turma': turma['id_turma'], 'nome_turma': f"E{turma['escola']} Turma {turma['numero']}",
+         'id_professor': turma['id_professor'],
+         'horario': '08:00 - 12:00' if turma['numero'] % 2 else '13:00 - 17:00'}
+        for turma in descricao['turmas']
+    ])
+    _inserir(Aluno, [
+        {'id_aluno': id_aluno, 'nome_completo': _nome(aleatorio), 'id_turma': turma['id_turma'],
+         'data_nascimento': date(escala['ano_final'] - aleatorio.randint(2, 5), aleatorio.randint(1, 12), aleatorio.randint(1, 28)),
+         'nome_responsavel': _nome(aleatorio), 'telefone_responsavel': f'(11) 9{id_aluno:04d}-0000',
+         'email_responsavel': f'responsavel{id_aluno}@bench.escola'}
+        for turma in descricao['turmas'] for id_aluno in turma['alunos']
+    ])
+
+    alunos = [id_aluno for turma in descricao['turmas'] for id_aluno in turma['alunos']]
+    ultimo_mes = (descricao['anos'][-1], MESES_LETIVOS[-1])
+    _inserir(Pagamento, (
+        {'id_aluno': id_aluno, 'data_pagamento': date(ano, mes, 10), 'valor_pago': Decimal('850.00'),
+         'forma_pagamento': aleatorio.choice(FORMAS_PAGAMENTO), 'referencia': f'{mes:02d}/{ano}',
+         # No último mês (início do mês corrente) boa parte ainda não pagou
+         'status': 'Pendente' if aleatorio.random() < (0.4 if (ano, mes) == ultimo_mes else 0.03) else 'Pago'}
+        for ano in descricao['anos'] for mes in MESES_LETIVOS for id_aluno in alunos
+    ))
+
+    if particionada(db.session.connection()):
+        criar_particoes(db.session.connection(), descricao['anos'])
+    _inserir(Presenca, (
+        {'id_aluno': id_aluno, 'data_presenca': dia, 'presente': aleatorio.random() < 0.92}
+        for ano in descricao['anos'] for dia in dias_letivos(ano) for id_aluno in alunos
+    ))
+
+    atividades, participacoes = [], []
+    for ano in descricao['anos']:
+        dias_por_mes = {}
+        for dia in dias_letivos(ano):
+            dias_por_mes.setdefault(dia.month, []).append(dia)
+        for escola in range(1, escala['escolas'] + 1):
+            turmas = [turma for turma in descricao['turmas'] if turma['escola'] == escola]
+            for mes, dias in dias_por_mes.items():
+                for _ in range(escala['atividades_por_mes']):
+                    turma = aleatorio.choice(turmas)
+                    id_atividade = len(atividades) + 1
+                    atividades.append({
+                        'id_atividade': id_atividade, 'data_realizacao': aleatorio.choice(dias),
+                        'descricao': f"Atividade {id_atividade} da E{escola} Turma {turma['numero']}",
+                    })
+                    participacoes.extend({'id_atividade': id_atividade, 'id_aluno': id_aluno} for id_aluno in turma['alunos'])
+    _inserir(Atividade, atividades)
+    _inserir(AtividadeAluno, participacoes)
+
+    senha = current_app.extensions['senhas'].gerar(SENHA)  # Um hash só: todos usam a mesma senha
+    _inserir(Usuario, [
+        {'login': descricao['administrador'], 'senha': senha, 'nivel_acesso': 'administrador', 'id_professor': None},
+        {'login': descricao['secretaria'], 'senha': senha, 'nivel_acesso': 'secretaria', 'id_professor': None},
+    ] + [
+        {'login': turma['login_professor'], 'senha': senha, 'nivel_acesso': 'professor', 'id_professor': turma['id_professor']}
+        for turma in descricao['turmas']
+    ])
+    db.session.commit()
+
+    recalcular_frequencia()
+    if db.engine.dialect.name == 'postgresql':
+        # Os ids foram informados: as sequências precisam continuar depois deles
+        for tabela, coluna in (('professores', 'id_professor'), ('turmas', 'id_turma'),
+                               ('alunos', 'id_aluno'), ('atividades', 'id_atividade')):
+            db.session.execute(db.text(
+                f"SELECT setval(pg_get_serial_sequence('{tabela}', '{coluna}'), (SELECT MAX({coluna}) FROM {tabela}))"
+            ))
+        db.session.commit()
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+    return descricao
+
+def _nome(aleatorio):
+    return f'{aleatorio.choice(NOMES)} {aleatorio.choice(SOBRENOMES)} {aleatorio.choice(SOBRENOMES)}'
+
+def _inserir(modelo, linhas):
+    """INSERT em lotes de LOTE linhas (linhas pode ser um gerador)"""
+    from sqlalchemy import insert
+    from app import db
+    lote = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) == LOTE:
+            db.session.execute(insert(modelo), lote)
+            lote = []
+    if lote:
+        db.session.execute(insert(modelo), lote)
+
+def criar_aplicacao(**config):
+    """
+    Aplicação para benchmark: sem limites de requisição, sem registro de lentas e com os
+    cabeçalhos X-SQL-*; SQLite em memória se DATABASE_URL não estiver definida.
+    """
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+    from app import create_app, db
+    from app.migracoes import aplicar_migracoes
+    with redirect_stdout(io.StringIO()):  # create_app imprime o mapa de rotas
+        app = create_app()
+    app.config.update({
+        'LIMITE_LOGIN_IP': None, 'LIMITE_LOGIN_USUARIO': None, 'LIMITE_CHATBOT': None, 'LIMITE_RELATORIOS': None,
+        'LENTAS_LIMIAR_MS': None, 'SQL_CABECALHOS': True,
+    })
+    app.config.update(config)
+    with app.app_context():
+        db.create_all()
+        if db.engine.dialect.name == 'postgresql':
+            aplicar_migracoes(db.engine)
+    return app
+
+def adicionar_argumentos_escala(parser):
+    for nome, padrao in ESCALA_PADRAO.items():
+        parser.add_argument(f"--{nome.replace('_', '-')}", type=int, default=padrao, dest=nome)
+
+def escala_dos_argumentos(argumentos):
+    return {nome: getattr(argumentos, nome) for nome in ESCALA_PADRAO}
+
+def main():
+    parser = argparse.ArgumentParser(description='Popula o banco de DATABASE_URL com dados sintéticos')
+    adicionar_argumentos_escala(parser)
+    escala = escala_dos_argumentos(parser.parse_args())
+    app = criar_aplicacao()
+    from app import db
+    with app.app_context():
+        inicio = time.perf_counter()
+        descricao = gerar(**escala)
+        print(f"{len(descricao['turmas'])} turmas, {descricao['alunos']} alunos, anos {descricao['anos']} "
+              f"gerados em {time.perf_counter() - inicio:.1f}s no banco {db.engine.url.render_as_string()}")
+    app.extensions['registro_conversas'].encerrar()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Resultados dos benchmarks em JSON e comparação entre duas execuções.
+
+bench_endpoints e bench_carga gravam em benchmarks/resultados/<benchmark>-<data>.json os
+parâmetros, o commit, a versão do Python, o banco e, por item medido (endpoint ou operação),
+as latências em ms. A comparação aponta os itens cuja métrica piorou mais que a tolerância
+(e mais que um mínimo em ms, para não acusar ruído em rotas de 1 ms) e sai com código 1,
+para poder barrar a regressão em um script.
+
+    python -m benchmarks.resultados base.json novo.json [--metrica p95_ms] [--tolerancia 0.15]
+"""
+from datetime import datetime
+from pathlib import Path
+import argparse
+import json
+import platform
+import subprocess
+import sys
+
+DIRETORIO = Path(__file__).resolve().parent / 'resultados'
+
+def estatisticas(duracoes):
+    """Latências (segundos) -> resumo em ms"""
+    if not duracoes:
+        return {'n': 0}
+    ordenadas = sorted(duracoes)
+
+    def percentil(p):
+        return round(ordenadas[min(len(ordenadas) - 1, int(p * len(ordenadas)))] * 1000, 3)
+
+    return {
+        'n': len(ordenadas),
+        'media_ms': round(sum(ordenadas) / len(ordenadas) * 1000, 3),
+        'min_ms': round(ordenadas[0] * 1000, 3),
+        'p50_ms': percentil(0.50),
+        'p95_ms': percentil(0.95),
+        'p99_ms': percentil(0.99),
+        'max_ms': round(ordenadas[-1] * 1000, 3),
+    }
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def salvar(benchmark, parametros, resultados, banco, saida=None):
+    """Grava o JSON da execução; retorna o caminho"""
+    agora = datetime.now()
+    documento = {
+        'benchmark': benchmark,
+        'em': agora.isoformat(timespec='seconds'),
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'banco': banco,
+        'parametros': parametros,
+        'resultados': resultados,
+    }
+    caminho = Path(saida) if saida else DIRETORIO / f"{benchmark}-{agora.strftime('%Y%m%d-%H%M%S')}.json"
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    caminho.write_text(json.dumps(documento, ensure_ascii=False, indent=2, default=str), encoding='utf-8')
+    return caminho
+
+def carregar(caminho):
+    return json.loads(Path(caminho).read_text(encoding='utf-8'))
+
+def comparar(base, novo, metrica='p50_ms', tolerancia=0.10, minimo_ms=1.0):
+    """[(item, valor_base, valor_novo, variacao, regressao)] dos itens presentes nas duas execuções"""
+    linhas = []
+    for item, medidas in novo['resultados'].items():
+        anterior = base['resultados'].get(item)
+        if not anterior or metrica not in anterior or metrica not in medidas:
+            continue
+        valor_base, valor_novo = anterior[metrica], medidas[metrica]
+        variacao = (valor_novo - valor_base) / valor_base if valor_base else 0.0
+        regressao = variacao > tolerancia and valor_novo - valor_base > minimo_ms
+        linhas.append((item, valor_base, valor_novo, variacao, regressao))
+    return linhas
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compara dois resultados de benchmark')
+    parser.add_argument('base')
+    parser.add_argument('novo')
+    parser.add_argument('--metrica', default='p50_ms')
+    parser.add_argument('--tolerancia', type=float, default=0.10, help='Piora relativa aceita (0.10 = 10%%)')
+    parser.add_argument('--minimo-ms', type=float, default=1.0, help='Piora absoluta mínima para contar')
+    argumentos = parser.parse_args(argv)
+
+    base, novo = carregar(argumentos.base), carregar(argumentos.novo)
+    if base['benchmark'] != novo['benchmark']:
+        parser.error(f"benchmarks diferentes: {base['benchmark']} x {novo['benchmark']}")
+    for nome, documento in (('base', base), ('novo', novo)):
+        print(f"{nome}: {documento['em']} commit {documento['commit']} {documento['banco']} {documento['parametros']}")
+
+    linhas = comparar(base, novo, argumentos.metrica, argumentos.tolerancia, argumentos.minimo_ms)
+    largura = max([len(item) for item, *_ in linhas] + [10])
+    print(f"\n{'item':<{largura}}{'base':>12}{'novo':>12}{'variação':>10}")
+    for item, valor_base, valor_novo, variacao, regressao in linhas:
+        marca = '  <- regressão' if regressao else ''
+        print(f'{item:<{largura}}{valor_base:>12.2f}{valor_novo:>12.2f}{variacao:>+10.1%}{marca}')
+
+    regressoes = sum(1 for *_, regressao in linhas if regressao)
+    print(f'\n{regressoes} regressões em {argumentos.metrica} (tolerância {argumentos.tolerancia:.0%})')
+    return 1 if regressoes else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
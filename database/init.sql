@@ -69,6 +69,18 @@ CREATE TABLE IF NOT EXISTS presencas (
     UNIQUE(id_aluno, data_presenca)
 );
 
+-- Resumo mensal de frequência por aluno (mantido pela API a cada gravação em presencas)
+CREATE TABLE IF NOT EXISTS frequencia_mensal (
+    id_aluno INTEGER NOT NULL,
+    mes DATE NOT NULL,
+    id_turma INTEGER NOT NULL,
+    total_dias INTEGER NOT NULL,
+    dias_presentes INTEGER NOT NULL,
+    PRIMARY KEY (id_aluno, mes),
+    FOREIGN KEY (id_aluno) REFERENCES alunos(id_aluno) ON DELETE CASCADE,
+    FOREIGN KEY (id_turma) REFERENCES turmas(id_turma) ON DELETE CASCADE
+);
+
 -- Tabela de Atividades
 CREATE TABLE IF NOT EXISTS atividades (
     id_atividade SERIAL PRIMARY KEY,
@@ -87,14 +99,36 @@ CREATE TABLE IF NOT EXISTS atividade_aluno (
     FOREIGN KEY (id_aluno) REFERENCES alunos(id_aluno) ON DELETE CASCADE
 );
 
+-- Conversas do ChatBot (gravadas em lote pela API, fora do caminho da requisição)
+CREATE TABLE IF NOT EXISTS conversas_chatbot (
+    id_conversa BIGSERIAL PRIMARY KEY,
+    id_aluno INTEGER,
+    mensagem TEXT NOT NULL,
+    intencao VARCHAR(20),
+    resposta TEXT NOT NULL,
+    criado_em TIMESTAMP NOT NULL,
+    FOREIGN KEY (id_aluno) REFERENCES alunos(id_aluno) ON DELETE SET NULL
+);
+
+-- Versão de cada recurso da API, usada nas respostas condicionais (ETag / Last-Modified)
+CREATE TABLE IF NOT EXISTS versoes_recursos (
+    recurso VARCHAR(50) PRIMARY KEY,
+    versao BIGINT NOT NULL DEFAULT 1,
+    atualizado_em TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'utc')
+);
+
 -- Índices para melhor performance
 CREATE INDEX IF NOT EXISTS idx_alunos_turma ON alunos(id_turma);
+CREATE INDEX IF NOT EXISTS idx_alunos_turma_id ON alunos(id_turma, id_aluno);
+CREATE INDEX IF NOT EXISTS idx_alunos_nome_prefixo ON alunos(lower(nome_completo) text_pattern_ops);
 CREATE INDEX IF NOT EXISTS idx_pagamentos_aluno ON pagamentos(id_aluno);
 CREATE INDEX IF NOT EXISTS idx_pagamentos_status ON pagamentos(status);
 CREATE INDEX IF NOT EXISTS idx_pagamentos_data ON pagamentos(data_pagamento);
 CREATE INDEX IF NOT EXISTS idx_presencas_aluno ON presencas(id_aluno);
 CREATE INDEX IF NOT EXISTS idx_presencas_data ON presencas(data_presenca);
 CREATE INDEX IF NOT EXISTS idx_atividades_data ON atividades(data_realizacao);
+CREATE INDEX IF NOT EXISTS idx_frequencia_mensal_mes ON frequencia_mensal(mes, id_aluno);
+CREATE INDEX IF NOT EXISTS idx_conversas_chatbot_criado_em ON conversas_chatbot(criado_em);
 
 -- Dados iniciais de exemplo
 INSERT INTO professores (nome_completo, email, telefone) VALUES
@@ -109,6 +143,7 @@ INSERT INTO turmas (nome_turma, id_professor, horario) VALUES
 ('Jardim I', 3, 'Integral - 07:00 às 19:00')
 ON CONFLICT DO NOTHING;
 
+-- Senhas iniciais em texto puro: viram hash no primeiro login ou com `flask --app main hash-senhas`
 INSERT INTO usuarios (login, senha, nivel_acesso, id_professor) VALUES
 ('admin', 'admin123', 'administrador', NULL),
 ('secretaria', 'sec123', 'secretaria', NULL),
@@ -0,0 +1,36 @@
+-- sem-transacao
+-- Índices compostos, parciais e de cobertura no formato dos filtros das rotas.
+-- CONCURRENTLY não bloqueia as gravações durante a criação, mas não roda dentro de uma
+-- transação: cada comando é executado isoladamente (marcador "sem-transacao" acima).
+
+-- Pendências por aluno (ChatBot) e relatório de inadimplência: só as linhas pendentes,
+-- com as colunas do relatório no próprio índice
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_pagamentos_pendentes
+    ON pagamentos (id_aluno, id_pagamento) INCLUDE (data_pagamento, valor_pago, referencia)
+    WHERE status = 'Pendente';
+
+-- Relatório por período: intervalo de datas com o status e o valor para os totais
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_pagamentos_data_status
+    ON pagamentos (data_pagamento, status) INCLUDE (valor_pago);
+
+-- Chamada e relatório diário (uma data) e frequência por período, sem ler a tabela
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_presencas_data_aluno
+    ON presencas (data_presenca, id_aluno) INCLUDE (presente);
+
+-- Atividades por período na ordem de listagem
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_atividades_data_id ON atividades (data_realizacao, id_atividade);
+
+-- Atividades de um aluno (a chave primária de atividade_aluno começa por id_atividade)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_atividade_aluno_aluno ON atividade_aluno (id_aluno, id_atividade);
+
+-- Chaves estrangeiras sem índice (exclusão de professor e de aluno)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_turmas_professor ON turmas (id_professor);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_conversas_chatbot_aluno ON conversas_chatbot (id_aluno, criado_em);
+
+-- Substituídos pelos índices acima (mesmas colunas iniciais) ou de baixa seletividade
+DROP INDEX CONCURRENTLY IF EXISTS idx_pagamentos_status;
+DROP INDEX CONCURRENTLY IF EXISTS idx_pagamentos_data;
+DROP INDEX CONCURRENTLY IF EXISTS idx_presencas_aluno;
+DROP INDEX CONCURRENTLY IF EXISTS idx_presencas_data;
+DROP INDEX CONCURRENTLY IF EXISTS idx_atividades_data;
+DROP INDEX CONCURRENTLY IF EXISTS idx_alunos_turma;
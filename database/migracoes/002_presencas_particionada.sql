@@ -0,0 +1,65 @@
+-- presencas particionada por ano (RANGE em data_presenca).
+--
+-- As consultas das rotas sempre filtram por data_presenca (um dia, um período ou o mês do
+-- ChatBot), então o planejador lê apenas as partições dos anos pedidos. Anos antigos saem da
+-- tabela com `flask --app main arquivar-presencas` sem DELETE nem VACUUM na tabela principal.
+--
+-- As chaves de uma tabela particionada precisam conter a coluna de partição: a chave primária
+-- passa a ser (id_presenca, data_presenca); id_presenca continua único pela sequência.
+
+ALTER TABLE presencas RENAME TO presencas_antiga;
+
+CREATE TABLE presencas (
+    id_presenca INTEGER NOT NULL DEFAULT nextval('presencas_id_presenca_seq'),
+    id_aluno INTEGER NOT NULL,
+    data_presenca DATE NOT NULL,
+    presente BOOLEAN NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT pk_presencas PRIMARY KEY (id_presenca, data_presenca),
+    CONSTRAINT uq_presencas_aluno_data UNIQUE (id_aluno, data_presenca),
+    FOREIGN KEY (id_aluno) REFERENCES alunos(id_aluno) ON DELETE CASCADE
+) PARTITION BY RANGE (data_presenca);
+
+-- A sequência passa a pertencer à nova tabela (senão seria apagada junto com a antiga)
+ALTER SEQUENCE presencas_id_presenca_seq OWNED BY presencas.id_presenca;
+
+-- Datas sem partição do ano (ex. digitadas errado) não são perdidas; criar_particao_presencas
+-- move essas linhas para a partição certa quando ela é criada
+CREATE TABLE presencas_padrao PARTITION OF presencas DEFAULT;
+
+CREATE OR REPLACE FUNCTION criar_particao_presencas(ano INTEGER) RETURNS BOOLEAN AS $$
+DECLARE
+    nome TEXT := format('presencas_%s', ano);
+    inicio DATE := make_date(ano, 1, 1);
+    fim DATE := make_date(ano + 1, 1, 1);
+BEGIN
+    IF to_regclass(nome) IS NOT NULL THEN
+        RETURN FALSE;
+    END IF;
+    CREATE TEMP TABLE presencas_movidas AS
+        SELECT * FROM presencas_padrao WHERE data_presenca >= inicio AND data_presenca < fim;
+    DELETE FROM presencas_padrao WHERE data_presenca >= inicio AND data_presenca < fim;
+    EXECUTE format('CREATE TABLE %I PARTITION OF presencas FOR VALUES FROM (%L) TO (%L)', nome, inicio, fim);
+    INSERT INTO presencas SELECT * FROM presencas_movidas;
+    DROP TABLE presencas_movidas;
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Partições dos anos com dados e dos anos atual e seguinte
+SELECT criar_particao_presencas(ano::INTEGER)
+FROM generate_series(
+    LEAST(
+        COALESCE((SELECT EXTRACT(YEAR FROM MIN(data_presenca)) FROM presencas_antiga), EXTRACT(YEAR FROM CURRENT_DATE)),
+        EXTRACT(YEAR FROM CURRENT_DATE)
+    ),
+    EXTRACT(YEAR FROM CURRENT_DATE) + 1
+) AS ano;
+
+-- Mesma ordem de colunas da tabela antiga
+INSERT INTO presencas SELECT * FROM presencas_antiga;
+
+DROP TABLE presencas_antiga;
+
+-- Criado na tabela principal, vale para todas as partições (inclusive as futuras)
+CREATE INDEX IF NOT EXISTS idx_presencas_data_aluno ON presencas (data_presenca, id_aluno) INCLUDE (presente);
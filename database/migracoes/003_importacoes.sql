@@ -0,0 +1,29 @@
+-- Importação em lote de alunos e pagamentos (app/importacao.py): andamento de cada arquivo,
+-- para retomar a partir da última linha gravada, e as linhas rejeitadas com o motivo.
+
+CREATE TABLE IF NOT EXISTS importacoes (
+    id_importacao SERIAL PRIMARY KEY,
+    tipo VARCHAR(20) NOT NULL CHECK (tipo IN ('alunos', 'pagamentos')),
+    nome_arquivo VARCHAR(255) NOT NULL,
+    status VARCHAR(20) NOT NULL CHECK (status IN ('em_andamento', 'concluida', 'interrompida')),
+    id_usuario INTEGER REFERENCES usuarios(id_usuario) ON DELETE SET NULL,
+    ultima_linha INTEGER NOT NULL DEFAULT 1,
+    linhas_lidas INTEGER NOT NULL DEFAULT 0,
+    importadas INTEGER NOT NULL DEFAULT 0,
+    atualizadas INTEGER NOT NULL DEFAULT 0,
+    ignoradas INTEGER NOT NULL DEFAULT 0,
+    com_erro INTEGER NOT NULL DEFAULT 0,
+    mensagem TEXT,
+    criado_em TIMESTAMP NOT NULL,
+    atualizado_em TIMESTAMP NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS importacao_erros (
+    id_erro BIGSERIAL PRIMARY KEY,
+    id_importacao INTEGER NOT NULL REFERENCES importacoes(id_importacao) ON DELETE CASCADE,
+    linha INTEGER NOT NULL,
+    coluna VARCHAR(50),
+    mensagem VARCHAR(255) NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_importacao_erros_linha ON importacao_erros (id_importacao, linha);
@@ -1,8 +1,10 @@
 import streamlit as st
 import requests
 import pandas as pd
+from collections import OrderedDict
 from datetime import datetime, date
 import os
+import threading
 
 # Configuração da página
 st.set_page_config(
@@ -15,21 +17,110 @@ st.set_page_config(
 API_URL = os.environ.get('API_URL', 'http://localhost:5000')
 
 # Funções auxiliares
+class ClienteCondicional:
+    """
+    Sessão HTTP que guarda as respostas GET com ETag/Last-Modified e as revalida com
+    If-None-Match/If-Modified-Since. Quando a API responde 304, devolve a resposta guardada
+    sem baixar os dados de novo.
+    """
+
+    def __init__(self, max_respostas=500):
+        self.sessao = requests.Session()
+        self.max_respostas = max_respostas
+        self._respostas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, url, headers=None):
+        with self._lock:
+            guardada = self._respostas.get(url)
+
+        headers = dict(headers or {})
+        if guardada is not None:
+            if 'ETag' in guardada.headers:
+                headers['If-None-Match'] = guardada.headers['ETag']
+            if 'Last-Modified' in guardada.headers:
+                headers['If-Modified-Since'] = guardada.headers['Last-Modified']
+
+        response = self.sessao.get(url, headers=headers)
+
+        with self._lock:
+            if response.status_code == 304 and guardada is not None:
+                self._respostas.move_to_end(url)
+                return guardada
+            if response.status_code == 200 and ('ETag' in response.headers or 'Last-Modified' in response.headers):
+                self._respostas[url] = response
+                self._respostas.move_to_end(url)
+                while len(self._respostas) > self.max_respostas:
+                    self._respostas.popitem(last=False)
+        return response
+
+    def post(self, url, json=None, headers=None):
+        return self.sessao.post(url, json=json, headers=headers)
+
+    def put(self, url, json=None, headers=None):
+        return self.sessao.put(url, json=json, headers=headers)
+
+    def delete(self, url, headers=None):
+        return self.sessao.delete(url, headers=headers)
+
+@st.cache_resource
+def cliente_http():
+    """Cliente compartilhado entre as execuções do script (o cache sobrevive aos reruns)"""
+    return ClienteCondicional()
+
+def ip_cliente():
+    """IP do navegador desta sessão (None se o Streamlit não expuser a conexão)"""
+    if 'ip_cliente' not in st.session_state:
+        ip = None
+        try:
+            from streamlit.runtime import get_instance
+            from streamlit.runtime.scriptrunner import get_script_run_ctx
+            ip = get_instance().get_client(get_script_run_ctx().session_id).request.remote_ip
+        except Exception:
+            pass
+        st.session_state.ip_cliente = ip
+    return st.session_state.ip_cliente
+
+def cabecalhos_autenticacao():
+    """
+    Token e IP do usuário desta sessão (o cliente HTTP é compartilhado entre as sessões). O IP
+    vai em X-Forwarded-For para que o limite de login da API conte cada navegador, e não o
+    frontend, que a API só aceita se estiver em PROXIES_CONFIAVEIS.
+    """
+    headers = {}
+    token = st.session_state.get('token')
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    ip = ip_cliente()
+    if ip:
+        headers['X-Forwarded-For'] = ip
+    return headers
+
+def encerrar_sessao():
+    st.session_state.usuario_logado = False
+    st.session_state.usuario_info = None
+    st.session_state.token = None
+
 def fazer_requisicao(endpoint, method='GET', data=None):
     """Função para fazer requisições à API"""
     try:
         url = f"{API_URL}{endpoint}"
+        headers = cabecalhos_autenticacao()
         if method == 'GET':
-            response = requests.get(url)
+            response = cliente_http().get(url, headers=headers)
         elif method == 'POST':
-            response = requests.post(url, json=data)
+            response = cliente_http().post(url, json=data, headers=headers)
         elif method == 'PUT':
-            response = requests.put(url, json=data)
+            response = cliente_http().put(url, json=data, headers=headers)
         elif method == 'DELETE':
-            response = requests.delete(url)
+            response = cliente_http().delete(url, headers=headers)
         
         if response.status_code in [200, 201]:
             return response.json()
+        elif response.status_code == 401 and st.session_state.get('usuario_logado'):
+            st.warning("Sessão expirada, faça login novamente.")
+            encerrar_sessao()
+            return None
         else:
             st.error(f"Erro na requisição: {response.status_code}")
             return None
@@ -37,6 +128,28 @@ def fazer_requisicao(endpoint, method='GET', data=None):
         st.error(f"Erro de conexão: {str(e)}")
         return None
 
+def listar_paginado(endpoint, limite=1000):
+    """Percorre todas as páginas de um endpoint paginado por cursor (X-Next-Cursor)"""
+    itens = []
+    after = None
+    separador = '&' if '?' in endpoint else '?'
+    try:
+        while True:
+            url = f"{API_URL}{endpoint}{separador}limit={limite}"
+            if after:
+                url += f"&after={after}"
+            response = cliente_http().get(url, headers=cabecalhos_autenticacao())
+            if response.status_code != 200:
+                st.error(f"Erro na requisição: {response.status_code}")
+                return itens or None
+            itens.extend(response.json())
+            after = response.headers.get('X-Next-Cursor')
+            if not after:
+                return itens
+    except Exception as e:
+        st.error(f"Erro de conexão: {str(e)}")
+        return None
+
 # Sidebar para navegação
 st.sidebar.title("🏫 Sistema Escolar")
 st.sidebar.markdown("---")
@@ -61,6 +174,7 @@ if not st.session_state.usuario_logado:
             if resultado:
                 st.session_state.usuario_logado = True
                 st.session_state.usuario_info = resultado['usuario']
+                st.session_state.token = resultado['token']
                 st.success("Login realizado com sucesso!")
                 st.rerun()
             else:
@@ -88,8 +202,8 @@ else:
     
     # Botão de logout
     if st.sidebar.button("Logout"):
-        st.session_state.usuario_logado = False
-        st.session_state.usuario_info = None
+        fazer_requisicao("/api/auth/logout", "POST")
+        encerrar_sessao()
         st.rerun()
     
     # Mostrar informações do usuário
@@ -103,25 +217,20 @@ else:
         
         col1, col2, col3, col4 = st.columns(4)
         
-        # Estatísticas gerais
-        alunos = fazer_requisicao("/api/alunos")
-        professores = fazer_requisicao("/api/professores")
-        turmas = fazer_requisicao("/api/turmas")
+        # Estatísticas gerais (calculadas no servidor)
+        resumo = fazer_requisicao("/api/dashboard/resumo") or {}
         
         with col1:
-            st.metric("Total de Alunos", len(alunos) if alunos else 0)
+            st.metric("Total de Alunos", resumo.get('total_alunos', 0))
         
         with col2:
-            st.metric("Total de Professores", len(professores) if professores else 0)
+            st.metric("Total de Professores", resumo.get('total_professores', 0))
         
         with col3:
-            st.metric("Total de Turmas", len(turmas) if turmas else 0)
+            st.metric("Total de Turmas", resumo.get('total_turmas', 0))
         
         with col4:
-            # Pagamentos pendentes
-            pagamentos = fazer_requisicao("/api/pagamentos")
-            pendentes = len([p for p in pagamentos if p['status'] == 'Pendente']) if pagamentos else 0
-            st.metric("Pagamentos Pendentes", pendentes)
+            st.metric("Pagamentos Pendentes", resumo.get('pagamentos_pendentes', '—'))  # Ausente para professor
     
     # Gerenciamento de Alunos
     elif opcao_selecionada == "Alunos":
@@ -131,7 +240,7 @@ else:
         
         with tab1:
             st.subheader("Lista de Alunos")
-            alunos = fazer_requisicao("/api/alunos")
+            alunos = listar_paginado("/api/alunos/")
             if alunos:
                 for aluno in alunos:
                     col1, col2, col3, col4, col5, col6, col7, col8, col9 = st.columns([1,2,2,2,2,2,2,1,1])
@@ -372,7 +481,7 @@ else:
                 st.info("Nenhum pagamento registrado.")
         
         with tab2:
-            alunos = fazer_requisicao("/api/alunos")
+            alunos = listar_paginado("/api/alunos/")
             
             with st.form("registro_pagamento"):
                 if alunos:
@@ -458,7 +567,7 @@ else:
 
         with tab2:
             st.subheader("Registrar Presença de Aluno")
-            alunos = fazer_requisicao("/api/alunos")
+            alunos = listar_paginado("/api/alunos/")
             if alunos:
                 aluno_opcoes = {a['id_aluno']: a['nome_completo'] for a in alunos}
                 id_aluno = st.selectbox("Aluno", options=list(aluno_opcoes.keys()), format_func=lambda x: aluno_opcoes[x])
@@ -479,7 +588,7 @@ else:
 
         with tab3:
             st.subheader("Relatório de Frequência por Aluno")
-            alunos = fazer_requisicao("/api/alunos")
+            alunos = listar_paginado("/api/alunos/")
             if alunos:
                 aluno_opcoes = {a['id_aluno']: a['nome_completo'] for a in alunos}
                 id_aluno = st.selectbox("Selecione o aluno", options=list(aluno_opcoes.keys()), format_func=lambda x: aluno_opcoes[x], key="aluno_freq")
@@ -620,7 +729,7 @@ else:
                 turma_opcoes = {t['id_turma']: t['nome_turma'] for t in turmas}
                 id_turma = st.selectbox("Selecione a turma", options=list(turma_opcoes.keys()), format_func=lambda x: turma_opcoes[x], key="turma_ativ")
                 if st.button("Gerar Relatório de Atividades"):
-                    relatorio = fazer_requisicao(f"/api/atividades?turma={id_turma}")
+                    relatorio = fazer_requisicao(f"/api/atividades/?id_turma={id_turma}")
                     if relatorio:
                         df = pd.DataFrame(relatorio)
                         st.dataframe(df, use_container_width=True)
@@ -682,7 +791,7 @@ else:
                 turma_opcoes = {t['id_turma']: t['nome_turma'] for t in turmas}
                 id_turma = st.selectbox("Selecione a turma", options=list(turma_opcoes.keys()), format_func=lambda x: turma_opcoes[x], key="turma_relatorio_ativ")
                 if st.button("Gerar Relatório de Atividades", key="btn_ativ_rel"):
-                    relatorio = fazer_requisicao(f"/api/atividades?turma={id_turma}")
+                    relatorio = fazer_requisicao(f"/api/atividades/?id_turma={id_turma}")
                     if relatorio:
                         df = pd.DataFrame(relatorio)
                         st.dataframe(df, use_container_width=True)
@@ -8,6 +8,7 @@ def app():
     """Criar aplicação de teste"""
     app = create_app()
     app.config['TESTING'] = True
+    app.config['SQL_ESTRITO'] = True  # Falha o teste se uma rota tiver N+1 (app.instrumentacao)
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
     
     with app.app_context():
@@ -40,12 +41,18 @@ def app():
         
         yield app
         
+        # Grava as conversas do chatbot ainda na fila antes de apagar as tabelas
+        app.extensions['registro_conversas'].encerrar()
         db.drop_all()
 
 @pytest.fixture
 def client(app):
-    """Cliente de teste"""
-    return app.test_client()
+    """Cliente de teste autenticado como o administrador de teste"""
+    client = app.test_client()
+    with app.app_context():
+        token, _ = app.extensions['tokens'].emitir(Usuario.query.filter_by(login='teste').first())
+    client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    return client
 
 def test_health_check(client):
     """Testar endpoint de health check"""
@@ -67,6 +74,10 @@ def test_login_failure(client):
     response = client.post('/api/auth/login', 
                           json={'login': 'teste', 'senha': 'senha_errada'})
     assert response.status_code == 401
+    for senha in (123456, ['123456'], None):
+        assert client.post('/api/auth/login', json={'login': 'teste', 'senha': senha}).status_code == 400
+    novo = {'login': 'novo', 'senha': 123456, 'nivel_acesso': 'professor'}
+    assert client.post('/api/auth/register', json=novo).status_code == 400
 
 def test_get_professores(client):
     """Testar listagem de professores"""
@@ -98,4 +109,976 @@ def test_chatbot_message(client):
     response = client.post('/api/chatbot/mensagem', json=data)
     assert response.status_code == 200
     data = json.loads(response.data)
-    assert 'resposta_bot' in data
\ No newline at end of file
+    assert 'resposta_bot' in data
+
+def _criar_alunos(app, nomes, id_turma=None):
+    """Cadastrar alunos de teste diretamente no banco"""
+    from datetime import date
+    with app.app_context():
+        turma = Turma.query.first() if id_turma is None else db.session.get(Turma, id_turma)
+        alunos = []
+        for i, nome in enumerate(nomes):
+            aluno = Aluno(
+                nome_completo=nome,
+                data_nascimento=date(2020, 1 + i % 12, 1),
+                id_turma=turma.id_turma,
+                nome_responsavel='Responsável Teste',
+                telefone_responsavel='11999999999',
+                email_responsavel='responsavel@teste.com'
+            )
+            db.session.add(aluno)
+            alunos.append(aluno)
+        db.session.commit()
+        return [aluno.id_aluno for aluno in alunos]
+
+def test_get_alunos_paginacao_cursor(app, client):
+    """Testar paginação por cursor na listagem de alunos"""
+    ids = _criar_alunos(app, ['Ana', 'Bruno', 'Carla', 'Daniel', 'Eva'])
+
+    response = client.get('/api/alunos/?limit=2&count=true')
+    assert response.status_code == 200
+    assert [a['id_aluno'] for a in json.loads(response.data)] == ids[:2]
+    assert response.headers['X-Total-Count'] == '5'
+    assert response.headers['X-Next-Cursor'] == str(ids[1])
+
+    response = client.get(f'/api/alunos/?limit=2&after={ids[3]}')
+    assert [a['id_aluno'] for a in json.loads(response.data)] == ids[4:]
+    assert 'X-Next-Cursor' not in response.headers
+
+def test_get_alunos_filtros(app, client):
+    """Testar filtros de turma, prefixo do nome e data de nascimento"""
+    _criar_alunos(app, ['Lucas Pereira', 'Luana Souza', 'Marcos_Lima'])
+
+    response = client.get('/api/alunos/?nome=lu')
+    assert {a['nome_completo'] for a in json.loads(response.data)} == {'Lucas Pereira', 'Luana Souza'}
+
+    response = client.get('/api/alunos/?nome=marcos_')
+    assert len(json.loads(response.data)) == 1
+
+    response = client.get('/api/alunos/?nascimento_inicio=2020-02-01&nascimento_fim=2020-03-31')
+    assert {a['nome_completo'] for a in json.loads(response.data)} == {'Luana Souza', 'Marcos_Lima'}
+
+    response = client.get('/api/alunos/?id_turma=9999')
+    assert json.loads(response.data) == []
+
+    response = client.get('/api/alunos/?limit=abc')
+    assert response.status_code == 400
+
+def _contar_consultas(app, func):
+    """Executar func e retornar o número de comandos SQL enviados ao banco"""
+    from sqlalchemy import event
+    comandos = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        comandos.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', registrar)
+    try:
+        resultado = func()
+    finally:
+        event.remove(engine, 'before_cursor_execute', registrar)
+    return len(comandos), resultado
+
+def _criar_pagamentos(app, ids_alunos, por_aluno, status='Pendente'):
+    """Cadastrar pagamentos de teste para cada aluno"""
+    from datetime import date
+    from app.models import Pagamento
+    with app.app_context():
+        for id_aluno in ids_alunos:
+            for mes in range(1, por_aluno + 1):
+                db.session.add(Pagamento(
+                    id_aluno=id_aluno,
+                    data_pagamento=date(2024, mes, 10),
+                    valor_pago=800,
+                    forma_pagamento='Pix',
+                    referencia=f'{mes:02d}/2024',
+                    status=status
+                ))
+        db.session.commit()
+
+def test_relatorio_inadimplencia_consultas_constantes(app, client):
+    """Testar que o relatório de inadimplência não faz uma consulta por pagamento"""
+    ids = _criar_alunos(app, ['Ana', 'Bruno'])
+    _criar_pagamentos(app, ids[:1], 1)
+    _criar_pagamentos(app, ids[1:], 1, status='Pago')
+
+    consultas_poucos, response = _contar_consultas(
+        app, lambda: client.get('/api/pagamentos/relatorio/inadimplencia'))
+    data = json.loads(response.data)
+    assert data['total_inadimplentes'] == 1
+    assert data['valor_total_devido'] == 800.0
+
+    _criar_pagamentos(app, ids, 6)
+
+    consultas_muitos, response = _contar_consultas(
+        app, lambda: client.get('/api/pagamentos/relatorio/inadimplencia'))
+    data = json.loads(response.data)
+    assert data['total_inadimplentes'] == 2
+    assert data['valor_total_devido'] == 800.0 * 13
+    pendentes = data['inadimplentes'][0]['pagamentos_pendentes']
+    assert [p['referencia'] for p in pendentes] == ['01/2024'] + [f'{m:02d}/2024' for m in range(1, 7)]
+    assert consultas_muitos == consultas_poucos
+
+def _criar_atividades(app, quantidade, ids_alunos):
+    """Cadastrar atividades de teste com os alunos informados como participantes"""
+    from datetime import date
+    from app.models import Atividade, AtividadeAluno
+    with app.app_context():
+        for i in range(quantidade):
+            atividade = Atividade(descricao=f'Atividade {i}', data_realizacao=date(2024, 6, 1 + i))
+            db.session.add(atividade)
+            db.session.flush()
+            for id_aluno in ids_alunos:
+                db.session.add(AtividadeAluno(id_atividade=atividade.id_atividade, id_aluno=id_aluno))
+        db.session.commit()
+
+def test_relatorio_atividades_consultas_constantes(app, client):
+    """Testar que o relatório de atividades não faz uma consulta por atividade ou participante"""
+    ids = _criar_alunos(app, ['Ana', 'Bruno'])
+    url = '/api/atividades/relatorio/periodo?data_inicio=2024-06-01&data_fim=2024-06-30'
+
+    _criar_atividades(app, 1, ids)
+    consultas_poucas, response = _contar_consultas(app, lambda: client.get(url))
+    atividades = json.loads(response.data)['atividades']
+    assert atividades[0]['total_participantes'] == 2
+    assert atividades[0]['participantes'][0]['turma'] == 'Turma Teste'
+
+    _criar_atividades(app, 5, ids)
+    consultas_muitas, response = _contar_consultas(app, lambda: client.get(url))
+    assert json.loads(response.data)['total_atividades'] == 6
+    assert consultas_muitas == consultas_poucas
+
+    consultas_lista, response = _contar_consultas(app, lambda: client.get('/api/atividades/'))
+    assert len(json.loads(response.data)) == 6
+    assert consultas_lista == consultas_poucas
+
+def test_atividades_filtro_turma(app, client):
+    """Testar filtro de turma aplicado nas atividades e participantes"""
+    with app.app_context():
+        professor = Professor.query.first()
+        outra = Turma(nome_turma='Outra Turma', id_professor=professor.id_professor, horario='13:00 - 17:00')
+        db.session.add(outra)
+        db.session.commit()
+        id_outra = outra.id_turma
+    ids = _criar_alunos(app, ['Ana'])
+    ids_outra = _criar_alunos(app, ['Bruno'], id_turma=id_outra)
+    _criar_atividades(app, 1, ids + ids_outra)
+    _criar_atividades(app, 1, ids)
+
+    response = client.get(f'/api/atividades/?id_turma={id_outra}')
+    atividades = json.loads(response.data)
+    assert len(atividades) == 1
+    assert [a['id_aluno'] for a in atividades[0]['alunos']] == ids_outra
+
+def test_create_atividade_varias_turmas(app, client):
+    """Testar inscrição em lote de várias turmas sem duplicar alunos já informados"""
+    with app.app_context():
+        professor = Professor.query.first()
+        outra = Turma(nome_turma='Outra Turma', id_professor=professor.id_professor, horario='13:00 - 17:00')
+        db.session.add(outra)
+        db.session.commit()
+        id_turma, id_outra = Turma.query.first().id_turma, outra.id_turma
+    ids = _criar_alunos(app, ['Ana', 'Bruno', 'Carla'])
+    ids_outra = _criar_alunos(app, ['Daniel', 'Eva'], id_turma=id_outra)
+
+    def criar():
+        return client.post('/api/atividades/', json={
+            'descricao': 'Festa Junina',
+            'data_realizacao': '2024-06-15',
+            'alunos': [ids[0], ids[0]],
+            'turmas': [id_turma, id_outra]
+        })
+
+    consultas, response = _contar_consultas(app, criar)
+    assert response.status_code == 201
+    id_atividade = json.loads(response.data)['id']
+
+    response = client.get(f'/api/atividades/{id_atividade}')
+    assert sorted(a['id_aluno'] for a in json.loads(response.data)['alunos']) == sorted(ids + ids_outra)
+
+    _criar_alunos(app, ['Fábio', 'Gabi', 'Hugo', 'Iris'])
+    consultas_mais_alunos, response = _contar_consultas(app, criar)
+    assert response.status_code == 201
+    assert consultas_mais_alunos == consultas
+
+def test_registrar_chamada_em_lote(app, client):
+    """Testar chamada em lote com criação, atualização e rejeição por linha"""
+    ids = _criar_alunos(app, ['Ana', 'Bruno', 'Carla'])
+    with app.app_context():
+        id_turma = Turma.query.first().id_turma
+
+    response = client.post('/api/presencas/', json={
+        'id_aluno': ids[1], 'data_presenca': '2024-06-10', 'presente': False})
+    assert response.status_code == 201
+    response = client.post('/api/presencas/', json={
+        'id_aluno': ids[1], 'data_presenca': '2024-06-10', 'presente': False})
+    assert response.status_code == 409
+
+    response = client.post('/api/presencas/chamada', json={
+        'data_presenca': '2024-06-10',
+        'id_turma': id_turma,
+        'presencas': [
+            {'id_aluno': ids[0], 'presente': True},
+            {'id_aluno': ids[1], 'presente': True},
+            {'id_aluno': 9999, 'presente': True},
+            {'id_aluno': ids[2]},
+            {'id_aluno': ids[2], 'presente': False},
+            {'id_aluno': ids[2], 'presente': True}
+        ]
+    })
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert (data['criadas'], data['atualizadas'], data['erros']) == (2, 1, 3)
+    assert [r['status'] for r in data['resultados']] == ['criada', 'atualizada', 'erro', 'erro', 'erro', 'criada']
+    assert all('id_presenca' in r for r in data['resultados'][:2])
+
+    response = client.get('/api/presencas/relatorio/diario/2024-06-10')
+    data = json.loads(response.data)
+    assert (data['total_alunos'], data['presentes']) == (3, 3)
+
+def test_opcoes_pool_conexoes(monkeypatch):
+    """Testar opções do pool lidas do ambiente e modo PgBouncer"""
+    from app.conexoes import opcoes_engine, QueuePoolMedido
+
+    assert opcoes_engine('sqlite:///:memory:') == {}
+
+    monkeypatch.setenv('DB_POOL_SIZE', '2')
+    monkeypatch.setenv('DB_POOL_PRE_PING', 'false')
+    opcoes = opcoes_engine('postgresql://u:s@db/escola')
+    assert opcoes['poolclass'] is QueuePoolMedido
+    assert opcoes['pool_size'] == 2
+    assert opcoes['pool_pre_ping'] is False
+    assert 'connect_args' not in opcoes
+
+    monkeypatch.setenv('DB_POOLER', 'pgbouncer')
+    opcoes = opcoes_engine('postgresql+psycopg://u:s@db/escola')
+    assert opcoes['connect_args'] == {'prepare_threshold': None}
+
+def test_metricas_pool_conexoes():
+    """Testar gauge de conexões em uso e histograma de espera no checkout"""
+    from sqlalchemy import create_engine, text
+    from app.conexoes import QueuePoolMedido, POOL_CONEXOES_EM_USO, POOL_ESPERA_CHECKOUT, instrumentar_pool
+
+    def amostra(metrica, sufixo):
+        for familia in metrica.collect():
+            for s in familia.samples:
+                if s.name.endswith(sufixo):
+                    return s.value
+
+    engine = create_engine('sqlite://', poolclass=QueuePoolMedido, pool_size=1)
+    instrumentar_pool(engine)
+    checkouts = amostra(POOL_ESPERA_CHECKOUT, '_count')
+    em_uso = amostra(POOL_CONEXOES_EM_USO, '')
+
+    with engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+        assert amostra(POOL_CONEXOES_EM_USO, '') == em_uso + 1
+
+    assert amostra(POOL_CONEXOES_EM_USO, '') == em_uso
+    assert amostra(POOL_ESPERA_CHECKOUT, '_count') == checkouts + 1
+
+def test_dashboard_resumo(app, client):
+    """Testar resumo do dashboard em uma única consulta e servido do cache"""
+    ids = _criar_alunos(app, ['Ana', 'Bruno'])
+    _criar_pagamentos(app, ids[:1], 2)
+    _criar_pagamentos(app, ids[1:], 1, status='Pago')
+
+    consultas, response = _contar_consultas(app, lambda: client.get('/api/dashboard/resumo'))
+    data = json.loads(response.data)
+    assert consultas == 1
+    assert (data['total_alunos'], data['total_professores'], data['total_turmas']) == (2, 1, 1)
+    assert (data['pagamentos_pendentes'], data['pagamentos_pagos']) == (2, 1)
+    assert (data['total_pendente'], data['total_recebido']) == (1600.0, 800.0)
+
+    consultas, response = _contar_consultas(app, lambda: client.get('/api/dashboard/resumo'))
+    assert consultas == 0
+    assert json.loads(response.data) == data
+
+def test_relatorio_frequencia_resumo_mensal(app, client):
+    """Testar relatório de frequência servido pelo resumo mensal e mantido a cada gravação"""
+    from app.models import FrequenciaMensal
+    from app.frequencia import recalcular_frequencia
+    ids = _criar_alunos(app, ['Ana', 'Bruno'])
+
+    for dia, presentes in [('2024-05-31', [True, True]), ('2024-06-03', [True, False]),
+                           ('2024-06-04', [False, False]), ('2024-07-01', [True, True])]:
+        response = client.post('/api/presencas/chamada', json={
+            'data_presenca': dia,
+            'presencas': [{'id_aluno': i, 'presente': p} for i, p in zip(ids, presentes)]
+        })
+        assert response.status_code == 200
+
+    response = client.post('/api/presencas/', json={'id_aluno': ids[0], 'data_presenca': '2024-06-05', 'presente': True})
+    id_presenca = json.loads(response.data)['id']
+    client.put(f'/api/presencas/{id_presenca}', json={'presente': False})
+
+    with app.app_context():
+        resumo = {(f.id_aluno, f.mes.isoformat()): (f.total_dias, f.dias_presentes)
+                  for f in FrequenciaMensal.query.all()}
+    assert resumo[(ids[0], '2024-06-01')] == (3, 1)
+    assert resumo[(ids[1], '2024-06-01')] == (2, 0)
+
+    def relatorio(inicio, fim):
+        response = client.get(f'/api/presencas/relatorio/frequencia?data_inicio={inicio}&data_fim={fim}')
+        return {f['id_aluno']: (f['total_dias'], f['dias_presentes'])
+                for f in json.loads(response.data)['frequencia_por_aluno']}
+
+    # Mês completo, pontas parciais e período dentro de um único mês
+    assert relatorio('2024-06-01', '2024-06-30') == {ids[0]: (3, 1), ids[1]: (2, 0)}
+    assert relatorio('2024-05-31', '2024-07-01') == {ids[0]: (5, 3), ids[1]: (4, 2)}
+    assert relatorio('2024-06-04', '2024-06-05') == {ids[0]: (2, 0), ids[1]: (1, 0)}
+
+    client.delete(f'/api/presencas/{id_presenca}')
+    assert relatorio('2024-06-01', '2024-06-30')[ids[0]] == (2, 1)
+
+    # O mês que ficou sem presenças sai do resumo
+    response = client.post('/api/presencas/', json={'id_aluno': ids[0], 'data_presenca': '2024-08-01', 'presente': True})
+    client.delete(f"/api/presencas/{json.loads(response.data)['id']}")
+    with app.app_context():
+        assert FrequenciaMensal.query.filter_by(id_aluno=ids[0]).filter(FrequenciaMensal.mes >= '2024-08-01').count() == 0
+
+    with app.app_context():
+        FrequenciaMensal.query.delete()
+        db.session.commit()
+        recalcular_frequencia()
+    assert relatorio('2024-05-01', '2024-07-31') == {ids[0]: (4, 3), ids[1]: (4, 2)}
+
+def test_frequencia_anos_arquivados(app, client, monkeypatch):
+    """Testar que o resumo dos anos arquivados sobrevive ao recálculo e que eles não recebem presenças"""
+    from datetime import date
+    from app import frequencia
+    from app.models import FrequenciaMensal
+    from app.routes import presencas
+    # Como no Postgres depois de `flask arquivar-presencas 2024`
+    monkeypatch.setattr(frequencia, 'primeiro_ano_ativo', lambda conexao: 2024)
+    monkeypatch.setattr(presencas, 'primeiro_ano_ativo', lambda conexao: 2024)
+    ids = _criar_alunos(app, ['Ana'])
+    with app.app_context():
+        db.session.add(FrequenciaMensal(id_aluno=ids[0], mes=date(2023, 11, 1), id_turma=1, total_dias=20, dias_presentes=18))
+        db.session.commit()
+    response = client.post('/api/presencas/', json={'id_aluno': ids[0], 'data_presenca': '2024-03-01', 'presente': True})
+    id_presenca = json.loads(response.data)['id']
+
+    with app.app_context():
+        frequencia.recalcular_frequencia()
+        meses = {f.mes.isoformat(): f.total_dias for f in FrequenciaMensal.query.filter_by(id_aluno=ids[0])}
+    assert meses == {'2023-11-01': 20, '2024-03-01': 1}
+
+    assert client.post('/api/presencas/', json={'id_aluno': ids[0], 'data_presenca': '2023-11-06', 'presente': True}).status_code == 400
+    chamada = {'data_presenca': '2023-11-06', 'presencas': [{'id_aluno': ids[0], 'presente': True}]}
+    assert client.post('/api/presencas/chamada', json=chamada).status_code == 400
+    assert client.put(f'/api/presencas/{id_presenca}', json={'data_presenca': '2023-11-06'}).status_code == 400
+    assert client.get('/api/presencas/relatorio/frequencia?data_inicio=2023-11-01&data_fim=2023-11-30').get_json()[
+        'frequencia_por_aluno'][0]['total_dias'] == 20
+
+def test_exportacao_streaming_ndjson_csv(app, client):
+    """Testar exportação em streaming das listagens em NDJSON e CSV"""
+    ids = _criar_alunos(app, ['Ana', 'Bruno'])
+    _criar_pagamentos(app, ids, 2)
+    _criar_atividades(app, 2, ids[:1])
+
+    response = client.get('/api/pagamentos/?format=ndjson')
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.is_streamed
+    linhas = [json.loads(l) for l in response.get_data(as_text=True).splitlines()]
+    assert len(linhas) == 4
+    assert linhas[0]['valor_pago'] == 800.0 and linhas[0]['data_pagamento'] == '2024-01-10'
+
+    response = client.get('/api/presencas/', headers={'Accept': 'text/csv'})
+    assert response.mimetype == 'text/csv'
+    assert response.get_data(as_text=True).splitlines() == ['id_presenca,id_aluno,data_presenca,presente']
+
+    response = client.get('/api/alunos/?format=csv&nome=b')
+    linhas = response.get_data(as_text=True).splitlines()
+    assert linhas[0].startswith('id_aluno,nome_completo,data_nascimento')
+    assert len(linhas) == 2 and 'Bruno' in linhas[1]
+
+    response = client.get('/api/atividades/?format=ndjson')
+    atividades = [json.loads(l) for l in response.get_data(as_text=True).splitlines()]
+    assert [len(a['alunos']) for a in atividades] == [1, 1]
+
+    response = client.get('/api/alunos/', headers={'Accept': 'application/json'})
+    assert response.mimetype == 'application/json'
+
+def test_serializacao_valores_exatos(app, client):
+    """Testar que valores monetários saem sem passar por float e datas em ISO 8601"""
+    ids = _criar_alunos(app, ['Ana'])
+    _criar_pagamentos(app, ids, 1)
+
+    response = client.get(f'/api/pagamentos/aluno/{ids[0]}')
+    assert response.status_code == 200
+    assert b'"valor_pago":800.00' in response.data
+    assert response.json[0]['data_pagamento'] == '2024-01-10'
+
+    response = client.get('/api/dashboard/resumo')
+    assert b'"total_pendente":800.00' in response.data
+
+def test_get_condicional_etag(app, client):
+    """Testar ETag, resposta 304 sem ler os dados e nova ETag após uma gravação"""
+    _criar_alunos(app, ['Ana'])
+
+    response = client.get('/api/alunos/')
+    etag = response.headers['ETag']
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+    consultas, response = _contar_consultas(
+        app, lambda: client.get('/api/alunos/', headers={'If-None-Match': etag})
+    )
+    assert response.status_code == 304
+    assert response.data == b''
+    assert consultas == 1
+
+    response = client.post('/api/alunos/', json={
+        'nome_completo': 'Bruno',
+        'data_nascimento': '2020-01-01',
+        'id_turma': 1,
+        'nome_responsavel': 'Responsável',
+        'telefone_responsavel': '11999999999',
+        'email_responsavel': 'resp@teste.com'
+    })
+    assert response.status_code == 201
+
+    response = client.get('/api/alunos/', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert len(response.json) == 2
+
+    # As atividades trazem o nome da turma: renomeá-la muda a ETag
+    etag = client.get('/api/atividades/').headers['ETag']
+    assert client.put('/api/turmas/1', json={'nome_turma': 'Turma Renomeada'}).status_code == 200
+    assert client.get('/api/atividades/', headers={'If-None-Match': etag}).status_code == 200
+
+def test_cache_leitura_local(app, client):
+    """Testar que a segunda leitura vem do cache e que a gravação na turma invalida"""
+    client.get('/api/turmas/')
+    consultas, response = _contar_consultas(app, lambda: client.get('/api/turmas/'))
+    assert response.status_code == 200
+    assert consultas == 1  # Apenas a leitura das versões
+
+    response = client.put('/api/turmas/1', json={'nome_turma': 'Turma Nova'})
+    assert response.status_code == 200
+
+    response = client.get('/api/turmas/')
+    assert response.json[0]['nome_turma'] == 'Turma Nova'
+
+def test_cache_leitura_redis(app, client):
+    """Testar o backend Redis (servidor simulado) e a invalidação por tag"""
+    import fakeredis
+    from app.cache import CacheRedis
+    servidor = fakeredis.FakeRedis()
+    app.extensions['cache'] = CacheRedis(servidor)
+    _criar_alunos(app, ['Ana'], id_turma=1)
+
+    client.get('/api/alunos/?id_turma=1')
+    consultas, response = _contar_consultas(app, lambda: client.get('/api/alunos/?id_turma=1'))
+    assert consultas == 1
+    assert response.json[0]['nome_completo'] == 'Ana'
+    assert servidor.scard('escola:cache:tag:alunos:turma:1') == 1
+
+    client.put('/api/turmas/1', json={'horario': '13:00 - 17:00'})
+    assert servidor.scard('escola:cache:tag:alunos:turma:1') == 0
+
+def test_cache_local_lru():
+    """Testar expulsão LRU, expiração e invalidação do cache em memória"""
+    from app.cache import CacheLocal
+    cache = CacheLocal(max_entradas=2, ttl=60)
+    cache.set('a', b'1', ['x'])
+    cache.set('b', b'2', ['y'])
+    cache.get('a')
+    cache.set('c', b'3', ['x'])
+    assert cache.get('b') is None
+    assert cache.get('a') == b'1'
+
+    cache.invalidar('x')
+    assert cache.get('a') is None and cache.get('c') is None
+
+    cache.ttl = 0
+    cache.set('d', b'4')
+    assert cache.get('d') is None
+
+def test_chatbot_classificacao_intencoes():
+    """Testar palavras inteiras, acentos, plurais e pontuação das intenções"""
+    from app.routes.chatbot import ChatBot
+    classificador = ChatBot().classificador
+
+    assert classificador.classificar('Até que horas fica aberto à noite?') == 'horario'
+    assert classificador.classificar('Boa noite!') == 'saudacao'
+    assert classificador.classificar('PRESENCA do meu filho') == 'presenca'
+    assert classificador.classificar('Quais atividades foram feitas?') == 'atividade'
+    assert classificador.classificar('Minha filha não vai amanhã') is None
+    assert classificador.pontuar('oi, quanto é a mensalidade? posso pagar no pix?') == [
+        ('pagamento', 4), ('saudacao', 1)
+    ]
+
+def test_chatbot_opcoes_sugeridas(client):
+    """Testar que as opções sugeridas levam direto à intenção"""
+    response = client.post('/api/chatbot/mensagem', json={'mensagem': 'Horário de Funcionamento'})
+    assert response.status_code == 200
+    assert response.json['dados_adicionais']['horario_funcionamento'] == '07:00 - 19:00'
+
+def test_chatbot_cache_por_aluno(app, client):
+    """Testar que a resposta do chatbot fica em cache e é invalidada por um novo pagamento"""
+    ids = _criar_alunos(app, ['Ana'])
+    _criar_pagamentos(app, ids, 1)
+    mensagem = {'mensagem': 'Tenho mensalidade pendente?', 'id_aluno': ids[0]}
+
+    response = client.post('/api/chatbot/mensagem', json=mensagem)
+    assert response.json['dados_adicionais'] == {'total_pendente': 800.0, 'quantidade': 1}
+
+    # No cache local a chave leva as versões: o acerto custa só a leitura de versoes_recursos
+    consultas, response = _contar_consultas(app, lambda: client.post('/api/chatbot/mensagem', json=mensagem))
+    assert consultas == 1
+    assert b'"total_pendente":800.00' in response.data
+
+    # Gravação em outro worker: a versão muda, mas a invalidação não chega a este cache
+    from datetime import date
+    from app.models import Pagamento
+    from app.versoes import registrar_alteracao
+    with app.app_context():
+        db.session.add(Pagamento(id_aluno=ids[0], data_pagamento=date(2024, 2, 10), valor_pago=800,
+                                 forma_pagamento='Pix', referencia='02/2024', status='Pendente'))
+        registrar_alteracao('pagamentos')
+        db.session.commit()
+    response = client.post('/api/chatbot/mensagem', json=mensagem)
+    assert response.json['dados_adicionais']['quantidade'] == 2
+
+    response = client.post('/api/pagamentos/', json={
+        'id_aluno': ids[0],
+        'data_pagamento': '2024-03-10',
+        'valor_pago': 800,
+        'forma_pagamento': 'Pix',
+        'referencia': '03/2024',
+        'status': 'Pendente'
+    })
+    assert response.status_code == 201
+
+    response = client.post('/api/chatbot/mensagem', json=mensagem)
+    assert response.json['dados_adicionais']['quantidade'] == 3
+
+def test_chatbot_atividades_recentes(app, client):
+    """Testar a consulta de atividades recentes do aluno pelo chatbot"""
+    ids = _criar_alunos(app, ['Ana'])
+    response = client.post('/api/chatbot/mensagem', json={'mensagem': 'Quais atividades?', 'id_aluno': ids[0]})
+    assert response.json['resposta_bot'].startswith('Não há atividades registradas para Ana')
+
+def test_chatbot_registro_conversas(app, client):
+    """Testar a gravação em lote das conversas e o descarte com a fila cheia"""
+    from app.models import ConversaChatbot
+    from app.registro_conversas import RegistroConversas
+    registro = RegistroConversas(app, tamanho_fila=10, tamanho_lote=5, intervalo=0.01)
+    app.extensions['registro_conversas'] = registro
+
+    for mensagem in ('Oi', 'Qual o horário?', 'Telefone da secretaria'):
+        assert client.post('/api/chatbot/mensagem', json={'mensagem': mensagem}).status_code == 200
+    registro.descarregar()
+
+    with app.app_context():
+        conversas = ConversaChatbot.query.order_by(ConversaChatbot.id_conversa).all()
+        assert [c.intencao for c in conversas] == ['saudacao', 'horario', 'contato']
+
+    # id_aluno inválido ou inexistente é gravado como NULL; uma linha ruim não perde o lote
+    for id_aluno in ('abc', 999):
+        client.post('/api/chatbot/mensagem', json={'mensagem': 'Tenho pagamento pendente?', 'id_aluno': id_aluno})
+    registro.descarregar()
+    from datetime import datetime
+    lote = [{'mensagem': 'a', 'resposta': 'b', 'criado_em': datetime.now()},
+            {'mensagem': 'c', 'resposta': None, 'criado_em': datetime.now()}]
+    registro._gravar(lote)
+    with app.app_context():
+        conversas = ConversaChatbot.query.order_by(ConversaChatbot.id_conversa).all()
+        assert [c.id_aluno for c in conversas[3:5]] == [None, None]
+        assert [c.mensagem for c in conversas[5:]] == ['a']
+
+    cheio = RegistroConversas(app, tamanho_fila=1)
+    cheio._iniciar = lambda: None  # Sem thread: a fila não esvazia
+    assert cheio.registrar(mensagem='a', resposta='b')
+    assert not cheio.registrar(mensagem='c', resposta='d')
+
+def test_login_hash_e_rehash(app, client):
+    """Testar que a senha em texto puro vira hash no login e é refeita ao mudar o custo"""
+    app.extensions['senhas'].metodo = 'pbkdf2:sha256:1000'
+    response = client.post('/api/auth/login', json={'login': 'teste', 'senha': '123456'})
+    assert response.status_code == 200
+    with app.app_context():
+        senha = Usuario.query.filter_by(login='teste').first().senha
+    assert senha.startswith('pbkdf2:sha256:1000$')
+
+    app.extensions['senhas'].metodo = 'pbkdf2:sha256:2000'
+    assert client.post('/api/auth/login', json={'login': 'teste', 'senha': 'errada'}).status_code == 401
+    assert client.post('/api/auth/login', json={'login': 'teste', 'senha': '123456'}).status_code == 200
+    with app.app_context():
+        assert Usuario.query.filter_by(login='teste').first().senha.startswith('pbkdf2:sha256:2000$')
+    assert client.post('/api/auth/login', json={'login': 'ninguem', 'senha': 'x'}).status_code == 401
+
+def test_comando_hash_senhas(app):
+    """Testar a migração das senhas antigas em texto puro"""
+    from werkzeug.security import check_password_hash
+    app.extensions['senhas'].metodo = 'pbkdf2:sha256:1000'
+    resultado = app.test_cli_runner().invoke(args=['hash-senhas'])
+    assert '1 senha(s)' in resultado.output
+    with app.app_context():
+        assert check_password_hash(Usuario.query.filter_by(login='teste').first().senha, '123456')
+
+def test_token_acesso(app, client):
+    """Testar o token devolvido pelo login, a revogação no logout e a expiração"""
+    anonimo = app.test_client()
+    assert anonimo.get('/api/turmas/').status_code == 401
+    assert anonimo.get('/api/turmas/', headers={'Authorization': 'Bearer abc.def'}).status_code == 401
+
+    dados = anonimo.post('/api/auth/login', json={'login': 'teste', 'senha': '123456'}).get_json()
+    cabecalhos = {'Authorization': f"Bearer {dados['token']}"}
+    assert anonimo.get('/api/turmas/', headers=cabecalhos).status_code == 200
+
+    assert anonimo.post('/api/auth/logout', headers=cabecalhos).status_code == 200
+    resposta = anonimo.get('/api/turmas/', headers=cabecalhos)
+    assert resposta.status_code == 401
+    assert resposta.get_json()['error'] == 'Token revogado'
+
+    app.extensions['tokens'].validade = -1  # Todo token emitido já passou da validade
+    resposta = client.get('/api/turmas/')
+    assert resposta.status_code == 401
+    assert resposta.get_json()['error'] == 'Token expirado'
+
+def test_niveis_de_acesso(app):
+    """Testar as restrições por nível sem consultar o usuário no banco"""
+    from app.models import Usuario as ModeloUsuario
+    professor = ModeloUsuario(id_usuario=99, login='prof', nivel_acesso='professor', id_professor=1)
+    token, _ = app.extensions['tokens'].emitir(professor)
+    client = app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+
+    assert client.get('/api/turmas/').status_code == 200
+    assert client.get('/api/presencas/').status_code == 200
+    assert client.post('/api/turmas/', json={'nome_turma': 'X'}).status_code == 403
+    assert client.get('/api/pagamentos/').status_code == 403
+    resumo = client.get('/api/dashboard/resumo').get_json()
+    assert 'total_alunos' in resumo and 'total_recebido' not in resumo and 'pagamentos_pendentes' not in resumo
+    novo = {'login': 'novo', 'senha': 'x', 'nivel_acesso': 'professor'}
+    assert client.post('/api/auth/register', json=novo).status_code == 403
+
+def test_limite_login(app):
+    """Testar os limites de login por conta e por IP, rejeitados antes de consultar o banco"""
+    app.config['LIMITE_LOGIN_USUARIO'] = '2/60'
+    app.config['LIMITE_LOGIN_IP'] = '3/60'
+    client = app.test_client()
+    assert client.post('/api/auth/login', json={'login': 'teste', 'senha': 'x'}).status_code == 401
+    assert client.post('/api/auth/login', json={'login': 'Teste', 'senha': 'x'}).status_code == 401
+    consultas, response = _contar_consultas(
+        app, lambda: client.post('/api/auth/login', json={'login': 'teste', 'senha': '123456'}))
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert consultas == 0
+
+    # Outro login ainda passa pelo limite da conta, mas o IP já gastou o orçamento
+    assert client.post('/api/auth/login', json={'login': 'outro', 'senha': 'x'}).status_code == 429
+    outro_ip = app.test_client()
+    outro_ip.environ_base['REMOTE_ADDR'] = '10.0.0.2'
+    assert outro_ip.post('/api/auth/login', json={'login': 'outro', 'senha': 'x'}).status_code == 401
+
+def test_limite_login_atras_do_frontend(app):
+    """Testar que o IP repassado pelo frontend conta no limite por IP, e só se vier dele"""
+    from app.limites import ProxyConfiavel
+    app.config['LIMITE_LOGIN_USUARIO'] = ''
+    app.config['LIMITE_LOGIN_IP'] = '2/60'
+    app.wsgi_app = ProxyConfiavel(app.wsgi_app, ['172.28.0.10'])
+    frontend = app.test_client()
+    frontend.environ_base['REMOTE_ADDR'] = '172.28.0.10'
+
+    def login(client, ip):
+        return client.post('/api/auth/login', json={'login': 'teste', 'senha': 'x'},
+                           headers={'X-Forwarded-For': ip}).status_code
+
+    assert [login(frontend, '203.0.113.1') for _ in range(3)] == [401, 401, 429]
+    assert login(frontend, '203.0.113.2') == 401
+
+    # De fora do frontend o cabeçalho é ignorado e conta o endereço da conexão
+    direto = app.test_client()
+    direto.environ_base['REMOTE_ADDR'] = '198.51.100.7'
+    assert [login(direto, f'203.0.113.{n}') for n in range(10, 13)] == [401, 401, 429]
+
+def test_limites_janela_deslizante(monkeypatch):
+    """Testar a janela deslizante nos armazenamentos em memória e Redis (simulado)"""
+    import fakeredis
+    from app import limites
+    agora = [1000.0]
+    monkeypatch.setattr(limites.time, 'time', lambda: agora[0])
+    for armazenamento in (limites.LimitesLocal(), limites.LimitesRedis(fakeredis.FakeRedis())):
+        agora[0] = 1000.0
+        assert [armazenamento.consumir('k', 2, 10) for _ in range(3)] == [0, 0, 10]
+        agora[0] = 1015.0  # Metade da janela seguinte: a anterior (3) ainda pesa 1.5
+        assert armazenamento.consumir('k', 2, 10) == 5
+        agora[0] = 1030.0
+        assert armazenamento.consumir('k', 2, 10) == 0
+
+def test_instrumentacao_sql(app, client):
+    """Testar os cabeçalhos de comandos SQL, o detector de N+1 e o orçamento por endpoint"""
+    from app.instrumentacao import OrcamentoSQLExcedido
+    app.config['SQL_CABECALHOS'] = True
+    response = client.get('/api/turmas/')
+    assert response.status_code == 200
+    assert int(response.headers['X-SQL-Comandos']) >= 1
+    assert 'X-SQL-Tempo-Ms' in response.headers
+
+    app.config['SQL_ORCAMENTOS'] = {'turmas.get_turmas': 0}
+    with pytest.raises(OrcamentoSQLExcedido):
+        client.get('/api/turmas/')
+
+    app.config['SQL_ORCAMENTOS'] = {}
+    app.config['SQL_LIMIAR_REPETICOES'] = 1
+    with pytest.raises(OrcamentoSQLExcedido, match='N\\+1'):
+        client.get('/api/turmas/')
+
+    # Comando que falha não deixa nada na conexão do pool
+    with app.app_context():
+        with pytest.raises(Exception):
+            db.session.execute(db.text('SELECT * FROM tabela_inexistente'))
+        db.session.rollback()
+        assert 'inicio_comando' not in db.session.connection().info
+
+def test_registro_requisicoes_lentas(app, client, tmp_path):
+    """Testar o registro das requisições lentas com SQL redigido e o ranking só para administrador"""
+    import json as json_
+    app.config['LENTAS_LIMIAR_MS'] = 0  # Toda requisição conta como lenta
+    app.config['LENTAS_DIRETORIO'] = str(tmp_path)
+    assert client.get('/api/alunos/?nome=Ana').status_code == 200
+    assert client.get('/api/alunos/?nome=Ana').status_code == 200
+
+    registros = [json_.loads(linha) for arquivo in tmp_path.glob('lentas-*.jsonl') for linha in arquivo.open()]
+    assert len(registros) == 2
+    registro = registros[0]
+    assert registro['endpoint'] == 'alunos.get_alunos'
+    assert registro['argumentos'] == ['nome']
+    parametros = json_.dumps([comando['parametros'] for comando in registro['sql']['mais_lentos']])
+    assert 'Ana' not in parametros and '<texto' in parametros
+
+    app.config['LENTAS_LIMIAR_MS'] = None
+    resposta = client.get('/api/diagnostico/lentas')
+    assert resposta.status_code == 200
+    ranking = resposta.get_json()['endpoints']
+    assert ranking[0]['endpoint'] == 'alunos.get_alunos'
+    assert ranking[0]['ocorrencias'] == 2
+
+    from app.models import Usuario as ModeloUsuario
+    secretaria = ModeloUsuario(id_usuario=98, login='sec', nivel_acesso='secretaria')
+    token, _ = app.extensions['tokens'].emitir(secretaria)
+    resposta = app.test_client().get('/api/diagnostico/lentas', headers={'Authorization': f'Bearer {token}'})
+    assert resposta.status_code == 403
+
+def test_amostrador_pilhas():
+    """Testar que o amostrador só anota a pilha das requisições acima do tempo mínimo"""
+    import threading
+    import time
+    from app.lentidao import AmostradorPilhas
+    amostrador = AmostradorPilhas(intervalo=0.005)
+    pronto = threading.Event()
+    resultado = {}
+
+    def consulta_demorada():
+        resultado['pilhas'] = amostrador.iniciar(apos=0.02)
+        pronto.set()
+        time.sleep(0.2)
+        amostrador.encerrar()
+
+    def consulta_rapida():
+        resultado['rapida'] = amostrador.iniciar(apos=10)
+        time.sleep(0.05)
+        amostrador.encerrar()
+
+    threads = [threading.Thread(target=consulta_demorada), threading.Thread(target=consulta_rapida)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert pronto.is_set()
+    assert any('consulta_demorada' in pilha for pilha in resultado['pilhas'])
+    assert not resultado['rapida']
+
+def test_perfil_sob_demanda(app, client, tmp_path):
+    """Testar o profiling pelo cabeçalho X-Perfil: formatos, gravação em arquivo e restrição ao administrador"""
+    import marshal
+    resposta = client.get('/api/turmas/', headers={'X-Perfil': 'pstats'})
+    assert resposta.status_code == 200
+    assert resposta.headers['X-Perfil-Status'] == '200'
+    estatisticas = marshal.loads(resposta.data)
+    assert any(funcao == 'get_turmas' for _, _, funcao in estatisticas)
+
+    resposta = client.get('/api/turmas/', headers={'X-Perfil': 'texto'})
+    assert 'cumulative' in resposta.get_data(as_text=True)
+
+    resposta = client.get('/api/turmas/', headers={'X-Perfil': 'speedscope'})
+    perfil = resposta.get_json()
+    assert perfil['profiles'][0]['type'] == 'sampled'
+    assert len(perfil['profiles'][0]['samples']) == len(perfil['profiles'][0]['weights'])
+
+    assert client.get('/api/turmas/', headers={'X-Perfil': 'outro'}).status_code == 400
+
+    app.config['PERFIL_DIRETORIO'] = str(tmp_path)
+    resposta = client.get('/api/turmas/', headers={'X-Perfil': 'pstats', 'X-Perfil-Destino': 'arquivo'})
+    assert isinstance(resposta.get_json(), list)
+    nome = resposta.headers['X-Perfil-Arquivo']
+    assert [perfil['nome'] for perfil in client.get('/api/diagnostico/perfis').get_json()] == [nome]
+    assert client.get(f'/api/diagnostico/perfis/{nome}').data == (tmp_path / nome).read_bytes()
+
+    # Para quem não é administrador o cabeçalho é ignorado
+    from app.models import Usuario as ModeloUsuario
+    token, _ = app.extensions['tokens'].emitir(ModeloUsuario(id_usuario=97, login='sec', nivel_acesso='secretaria'))
+    resposta = app.test_client().get('/api/turmas/', headers={'Authorization': f'Bearer {token}', 'X-Perfil': 'pstats'})
+    assert 'X-Perfil-Status' not in resposta.headers
+    assert isinstance(resposta.get_json(), list)
+
+def _enviar_importacao(client, tipo, conteudo, nome='dados.csv', **campos):
+    import io
+    if isinstance(conteudo, str):
+        conteudo = conteudo.encode('utf-8')
+    return client.post(f'/api/importacoes/{tipo}', data={'arquivo': (io.BytesIO(conteudo), nome), **campos},
+                       content_type='multipart/form-data')
+
+def test_importacao_alunos_csv(app, client):
+    """Testar a importação de alunos: validação por linha, erros paginados e reenvio sem duplicar"""
+    with app.app_context():
+        id_turma = Turma.query.first().id_turma
+    cabecalho = 'Nome Completo;Data Nascimento;ID Turma;Nome Responsavel;Telefone Responsavel;Email Responsavel\n'
+    linhas = [
+        f'Ana Souza;15/03/2020;{id_turma};Maria;11999999999;maria@teste.com',
+        f'Bruno Lima;2020-13-01;{id_turma};João;11999999999;joao@teste.com',
+        'Carla Dias;2020-05-01;999;Paula;11999999999;paula@teste.com',
+        f'ana souza;2020-03-15;{id_turma};Maria;11999999999;maria@teste.com',
+        f';2020-05-01;{id_turma};Paula;11999999999;paula@teste.com',
+        f'Davi Costa;2021-01-20;{id_turma};Rita;11988888888;rita@teste.com',
+    ]
+    conteudo = cabecalho + '\n'.join(linhas) + '\n'
+
+    resposta = _enviar_importacao(client, 'alunos', conteudo, nome='alunos.csv')
+    assert resposta.status_code == 200
+    resumo = resposta.get_json()
+    assert resumo['status'] == 'concluida'
+    assert (resumo['linhas_lidas'], resumo['importadas'], resumo['com_erro'], resumo['ultima_linha']) == (6, 2, 4, 7)
+
+    url = f"/api/importacoes/{resumo['id_importacao']}/erros"
+    pagina = client.get(f'{url}?limit=2')
+    assert [(erro['linha'], erro['coluna']) for erro in pagina.get_json()] == [(3, 'data_nascimento'), (4, 'id_turma')]
+    pagina = client.get(f"{url}?limit=2&after={pagina.headers['X-Next-Cursor']}")
+    assert [(erro['linha'], erro['coluna']) for erro in pagina.get_json()] == [(5, None), (6, 'nome_completo')]
+    assert 'X-Next-Cursor' not in pagina.headers
+
+    # O mesmo arquivo de novo não duplica os alunos
+    resumo = _enviar_importacao(client, 'alunos', conteudo, nome='alunos.csv').get_json()
+    assert (resumo['importadas'], resumo['ignoradas']) == (0, 2)
+    with app.app_context():
+        assert sorted(aluno.nome_completo for aluno in Aluno.query.all()) == ['Ana Souza', 'Davi Costa']
+
+    assert _enviar_importacao(client, 'alunos', 'nome_completo,id_turma\nAna,1\n').status_code == 400
+    assert _enviar_importacao(client, 'alunos', conteudo, nome='alunos.pdf').status_code == 400
+    assert _enviar_importacao(client, 'alunos', conteudo, nome='a' * 252 + '.csv').status_code == 400
+    assert len(client.get('/api/importacoes/').get_json()) == 2
+
+    from app.models import Usuario as ModeloUsuario
+    token, _ = app.extensions['tokens'].emitir(ModeloUsuario(id_usuario=98, login='prof', nivel_acesso='professor', id_professor=1))
+    professor = app.test_client()
+    professor.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    assert _enviar_importacao(professor, 'alunos', conteudo).status_code == 403
+
+def test_importacao_alunos_xlsx(app, client, monkeypatch):
+    """Testar a importação de uma planilha .xlsx: números como float, datas como datetime e arquivo fechado"""
+    openpyxl = pytest.importorskip('openpyxl')
+    import io
+    from datetime import datetime
+    with app.app_context():
+        id_turma = Turma.query.first().id_turma
+
+    pasta = openpyxl.Workbook()
+    planilha = pasta.active
+    planilha.append(['Nome Completo', 'Data Nascimento', 'ID Turma', 'Nome Responsavel', 'Telefone Responsavel', 'Email Responsavel'])
+    planilha.append(['Ana Souza', datetime(2020, 3, 15), float(id_turma), 'Maria', '11999999999', 'maria@teste.com'])
+    planilha.append([None] * 6)  # Linha em branco no meio da planilha
+    planilha.append(['Bruno Lima', '20/01/2021', id_turma, 'João', 11988888888, 'joao@teste.com'])
+    planilha.append(['Carla Dias', '2020-05-01', 1.5, 'Paula', '11999999999', 'paula@teste.com'])
+    arquivo = io.BytesIO()
+    pasta.save(arquivo)
+
+    fechadas = []
+    carregar = openpyxl.load_workbook
+
+    def carregar_e_observar(*args, **kwargs):
+        lida = carregar(*args, **kwargs)
+        fechar = lida.close
+        lida.close = lambda: (fechadas.append(True), fechar())
+        return lida
+    monkeypatch.setattr(openpyxl, 'load_workbook', carregar_e_observar)
+
+    resposta = _enviar_importacao(client, 'alunos', arquivo.getvalue(), nome='alunos.xlsx')
+    assert resposta.status_code == 200
+    resumo = resposta.get_json()
+    assert (resumo['status'], resumo['linhas_lidas'], resumo['importadas'], resumo['com_erro']) == ('concluida', 3, 2, 1)
+    assert fechadas == [True]
+
+    erros = client.get(f"/api/importacoes/{resumo['id_importacao']}/erros").get_json()
+    assert [(erro['linha'], erro['coluna']) for erro in erros] == [(5, 'id_turma')]
+    with app.app_context():
+        alunos = {a.nome_completo: (a.data_nascimento.isoformat(), a.id_turma)
+                  for a in Aluno.query.filter(Aluno.nome_completo.in_(['Ana Souza', 'Bruno Lima']))}
+    assert alunos == {'Ana Souza': ('2020-03-15', id_turma), 'Bruno Lima': ('2021-01-20', id_turma)}
+
+def test_importacao_pagamentos_retomada(app, client, monkeypatch):
+    """Testar a mescla dos pagamentos (atualiza a referência existente) e a retomada depois de um lote falhar"""
+    from app import importacao as modulo
+    from app.models import Pagamento
+    ids = _criar_alunos(app, ['Ana', 'Bruno'])
+    _criar_pagamentos(app, ids[:1], 1)  # 01/2024 Pendente
+    app.config['IMPORTACAO_LOTE'] = 2
+    conteudo = 'id_aluno,data_pagamento,valor_pago,forma_pagamento,referencia,status\n' + '\n'.join([
+        f'{ids[0]},2024-01-12,"850,00",Pix,01/2024,pago',
+        f'{ids[0]},2024-02-10,850.00,Pix,02/2024,Pago',
+        f'{ids[1]},2024-01-10,850.00,Boleto,01/2024,Atrasado',
+        f'{ids[1]},2024-02-10,850.00,Boleto,02/2024,Pendente',
+        f'{ids[1]},2024-03-10,850.00,Boleto,03/2024,Pago',
+    ]) + '\n'
+
+    mesclar = modulo._mesclar
+    chamadas = []
+
+    def falhar_no_segundo_lote(*args):
+        chamadas.append(1)
+        if len(chamadas) == 2:
+            raise RuntimeError('conexão perdida')
+        return mesclar(*args)
+    monkeypatch.setattr(modulo, '_mesclar', falhar_no_segundo_lote)
+
+    resposta = _enviar_importacao(client, 'pagamentos', conteudo, nome='extrato.csv')
+    assert resposta.status_code == 500
+    resumo = resposta.get_json()
+    assert (resumo['status'], resumo['ultima_linha'], resumo['atualizadas'], resumo['importadas']) == ('interrompida', 3, 1, 1)
+
+    monkeypatch.setattr(modulo, '_mesclar', mesclar)
+    assert _enviar_importacao(client, 'pagamentos', conteudo, nome='outro.csv', retomar=resumo['id_importacao']).status_code == 409
+
+    # Em andamento em outra requisição: só pode ser retomada depois de IMPORTACAO_ABANDONO sem avanço
+    from datetime import datetime, timedelta
+    from app.models import Importacao
+    with app.app_context():
+        importacao = db.session.get(Importacao, resumo['id_importacao'])
+        importacao.status, importacao.atualizado_em = 'em_andamento', datetime.utcnow()
+        db.session.commit()
+    resposta = _enviar_importacao(client, 'pagamentos', conteudo, nome='extrato.csv', retomar=resumo['id_importacao'])
+    assert resposta.status_code == 409
+    with app.app_context():
+        importacao = db.session.get(Importacao, resumo['id_importacao'])
+        importacao.atualizado_em = datetime.utcnow() - timedelta(seconds=app.config['IMPORTACAO_ABANDONO'] + 1)
+        db.session.commit()
+    resposta = _enviar_importacao(client, 'pagamentos', conteudo, nome='extrato.csv', retomar=resumo['id_importacao'])
+    assert resposta.status_code == 200
+    resumo = resposta.get_json()
+    assert (resumo['status'], resumo['linhas_lidas'], resumo['importadas'], resumo['atualizadas'], resumo['com_erro']) == \
+        ('concluida', 5, 3, 1, 1)
+    assert _enviar_importacao(client, 'pagamentos', conteudo, nome='extrato.csv', retomar=resumo['id_importacao']).status_code == 409
+
+    with app.app_context():
+        pagamentos = {(p.id_aluno, p.referencia): (p.status, str(p.valor_pago)) for p in Pagamento.query.all()}
+    assert len(pagamentos) == 4
+    assert pagamentos[(ids[0], '01/2024')] == ('Pago', '850.00')
+    assert pagamentos[(ids[1], '02/2024')] == ('Pendente', '850.00')
+    erros = client.get(f"/api/importacoes/{resumo['id_importacao']}/erros").get_json()
+    assert [(erro['linha'], erro['coluna']) for erro in erros] == [(4, 'status')]
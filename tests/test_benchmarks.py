@@ -0,0 +1,49 @@
+"""
+Gerador de dados e comparação de resultados dos benchmarks (benchmarks/).
+"""
+from benchmarks.dados import criar_aplicacao, descrever, gerar
+from benchmarks.resultados import comparar, estatisticas
+from app import db
+from app.models import Aluno, Pagamento, Presenca, Usuario
+
+ESCALA = {'escolas': 2, 'turmas_por_escola': 2, 'alunos_por_turma': 3, 'anos': 1, 'atividades_por_mes': 1}
+
+def _gerar_e_ler():
+    app = criar_aplicacao()
+    with app.app_context():
+        descricao = gerar(**ESCALA)
+        linhas = (
+            [(a.id_aluno, a.nome_completo, a.id_turma) for a in Aluno.query.order_by(Aluno.id_aluno)],
+            [(p.id_aluno, str(p.data_pagamento), p.status) for p in Pagamento.query.order_by(Pagamento.id_pagamento)],
+            Presenca.query.filter_by(presente=True).count(),
+        )
+        logins = {usuario.login for usuario in Usuario.query}
+        app.extensions['registro_conversas'].encerrar()
+        db.drop_all()
+        if db.engine.dialect.name == 'postgresql':
+            # O que as migrações criam fora dos modelos; senão a próxima aplicação as pula
+            db.session.execute(db.text('DROP TABLE IF EXISTS migracoes_aplicadas'))
+            db.session.execute(db.text('DROP FUNCTION IF EXISTS criar_particao_presencas(INTEGER)'))
+            db.session.commit()
+    return descricao, linhas, logins
+
+def test_gerador_deterministico():
+    """Testar que a mesma escala gera os mesmos dados e que descrever() corresponde ao banco"""
+    descricao, linhas, logins = _gerar_e_ler()
+    assert _gerar_e_ler()[1] == linhas
+
+    alunos, pagamentos, _ = linhas
+    assert descricao == descrever(**ESCALA)
+    assert len(alunos) == descricao['alunos'] == 12
+    assert {turma['id_turma']: turma['alunos'] for turma in descricao['turmas']}[4] == [
+        id_aluno for id_aluno, _, id_turma in alunos if id_turma == 4
+    ]
+    assert {status for *_, status in pagamentos} == {'Pago', 'Pendente'}
+    assert {descricao['administrador'], descricao['secretaria'], 'bench.professor4'} <= logins
+
+def test_comparar_resultados():
+    """Testar a detecção de regressão com tolerância relativa e mínimo absoluto"""
+    base = {'resultados': {'a': estatisticas([0.010] * 10), 'b': estatisticas([0.0010] * 10), 'c': {'n': 0}}}
+    novo = {'resultados': {'a': estatisticas([0.013] * 10), 'b': estatisticas([0.0015] * 10), 'd': estatisticas([1.0])}}
+    linhas = {item: regressao for item, *_, regressao in comparar(base, novo, tolerancia=0.10, minimo_ms=1.0)}
+    assert linhas == {'a': True, 'b': False}  # b piorou 50%, mas só 0.5 ms
@@ -0,0 +1,208 @@
+"""
+Planos de execução das consultas das rotas.
+
+Popula o banco com um volume parecido com o de uma escola depois de alguns anos, chama as
+rotas de consulta e roda EXPLAIN em cada SELECT que elas executaram. O teste falha se
+alguma consulta lê por inteiro uma das tabelas grandes (varredura sequencial), o que indica
+um índice faltando para o filtro da rota. Roda no banco de DATABASE_URL (SQLite em memória
+por padrão; com PostgreSQL as migrações são aplicadas, presencas fica particionada e o banco
+é populado e analisado antes dos EXPLAIN, e também se confere a poda de partições).
+"""
+import pytest
+import random
+import re
+from pathlib import Path
+from datetime import date, timedelta
+from sqlalchemy import event, insert
+from app import create_app, db
+from app.dialeto import tabelas_lidas, tabelas_varridas
+from app.migracoes import _comandos, _indices_concorrentes, aplicar_migracoes, listar_migracoes
+from app.particoes import criar_particoes, particionada
+from app.models import (
+    Aluno, Atividade, AtividadeAluno, Pagamento, Presenca, Professor, Turma, Usuario
+)
+
+TABELAS_GRANDES = {
+    'alunos', 'pagamentos', 'presencas', 'frequencia_mensal', 'atividades', 'atividade_aluno', 'conversas_chatbot'
+}
+
+TURMAS = 20
+ALUNOS_POR_TURMA = 40
+MESES = 12
+DIAS_LETIVOS = 60
+ATIVIDADES = 150
+
+CONSULTAS = [
+    ('GET', '/api/alunos/7'),
+    ('GET', '/api/alunos/?id_turma=3&limit=50'),
+    ('GET', '/api/turmas/3'),
+    ('GET', '/api/pagamentos/aluno/7'),
+    ('GET', '/api/pagamentos/relatorio/periodo?data_inicio=2024-03-01&data_fim=2024-03-31'),
+    ('GET', '/api/pagamentos/relatorio/inadimplencia'),
+    ('GET', '/api/presencas/aluno/7?data_inicio=2024-02-01&data_fim=2024-02-29'),
+    ('GET', '/api/presencas/data/2024-02-05'),
+    ('GET', '/api/presencas/relatorio/diario/2024-02-05'),
+    ('GET', '/api/presencas/relatorio/frequencia?data_inicio=2024-02-10&data_fim=2024-04-20&id_turma=3'),
+    ('GET', '/api/atividades/?data_inicio=2024-03-01&data_fim=2024-03-15'),
+    ('GET', '/api/atividades/5'),
+    ('GET', '/api/atividades/aluno/7?data_inicio=2024-03-01&data_fim=2024-03-31'),
+    ('GET', '/api/atividades/turma/3'),
+    ('GET', '/api/atividades/relatorio/periodo?data_inicio=2024-03-01&data_fim=2024-03-15'),
+    ('POST', '/api/chatbot/mensagem', {'mensagem': 'pagamentos pendentes', 'id_aluno': 7}),
+    ('POST', '/api/chatbot/mensagem', {'mensagem': 'frequência do mês', 'id_aluno': 7}),
+    ('POST', '/api/chatbot/mensagem', {'mensagem': 'atividades recentes', 'id_aluno': 7}),
+]
+
+def _dias_letivos(inicio, quantidade):
+    dia = inicio
+    while quantidade:
+        if dia.weekday() < 5:
+            yield dia
+            quantidade -= 1
+        dia += timedelta(days=1)
+
+def _popular():
+    aleatorio = random.Random(19)
+    db.session.execute(insert(Professor), [
+        {'id_professor': i, 'nome_completo': f'Professor {i}', 'email': f'p{i}@escola.br', 'telefone': '11'}
+        for i in range(1, TURMAS + 1)
+    ])
+    db.session.execute(insert(Turma), [
+        {'id_turma': i, 'nome_turma': f'Turma {i}', 'id_professor': i, 'horario': '08:00 - 12:00'}
+        for i in range(1, TURMAS + 1)
+    ])
+    alunos = [
+        {'id_aluno': i, 'nome_completo': f'Aluno {i}', 'data_nascimento': date(2020, 1, 1),
+         'id_turma': (i - 1) // ALUNOS_POR_TURMA + 1, 'nome_responsavel': 'Responsável',
+         'telefone_responsavel': '11', 'email_responsavel': f'r{i}@escola.br'}
+        for i in range(1, TURMAS * ALUNOS_POR_TURMA + 1)
+    ]
+    db.session.execute(insert(Aluno), alunos)
+
+    db.session.execute(insert(Pagamento), [
+        {'id_aluno': aluno['id_aluno'], 'data_pagamento': date(2024, mes, 10), 'valor_pago': 800,
+         'forma_pagamento': 'Pix', 'referencia': f'{mes:02d}/2024',
+         'status': 'Pendente' if aleatorio.random() < 0.03 else 'Pago'}
+        for aluno in alunos for mes in range(1, MESES + 1)
+    ])
+    dias = list(_dias_letivos(date(2024, 2, 1), DIAS_LETIVOS))
+    db.session.execute(insert(Presenca), [
+        {'id_aluno': aluno['id_aluno'], 'data_presenca': dia, 'presente': aleatorio.random() < 0.9}
+        for aluno in alunos for dia in dias
+    ])
+    for i in range(1, ATIVIDADES + 1):
+        db.session.execute(insert(Atividade), [
+            {'id_atividade': i, 'descricao': f'Atividade {i}', 'data_realizacao': date(2024, 2, 1) + timedelta(days=i)}
+        ])
+        turma = aleatorio.randint(1, TURMAS)
+        db.session.execute(insert(AtividadeAluno), [
+            {'id_atividade': i, 'id_aluno': aluno['id_aluno']} for aluno in alunos if aluno['id_turma'] == turma
+        ])
+    db.session.add(Usuario(login='admin', senha='x', nivel_acesso='administrador'))
+    db.session.commit()
+
+    from app.frequencia import recalcular_frequencia
+    recalcular_frequencia()
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+
+@pytest.fixture(scope='module')
+def app():
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['SQL_ESTRITO'] = True  # Falha o teste se uma rota tiver N+1 (app.instrumentacao)
+    app.config['LIMITE_RELATORIOS'] = None
+    app.config['LIMITE_CHATBOT'] = None
+    with app.app_context():
+        db.create_all()
+        if db.engine.dialect.name == 'postgresql':
+            aplicar_migracoes(db.engine)
+            if particionada(db.session.connection()):
+                criar_particoes(db.session.connection(), [2024])
+                db.session.commit()
+        _popular()
+        yield app
+        app.extensions['registro_conversas'].encerrar()
+        db.drop_all()
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(db.text('DROP TABLE IF EXISTS migracoes_aplicadas'))
+            db.session.execute(db.text('DROP FUNCTION IF EXISTS criar_particao_presencas(INTEGER)'))
+            db.session.commit()
+
+def _consultas_da_rota(app, metodo, url, corpo=None):
+    """SELECTs executados pela rota, com os parâmetros usados"""
+    with app.app_context():
+        token, _ = app.extensions['tokens'].emitir(Usuario.query.filter_by(login='admin').first())
+    consultas = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            consultas.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', registrar)
+    try:
+        resposta = app.test_client().open(
+            url, method=metodo, json=corpo, headers={'Authorization': f'Bearer {token}'}
+        )
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', registrar)
+    assert resposta.status_code == 200, (url, resposta.status_code, resposta.get_data(as_text=True))
+    return consultas
+
+@pytest.mark.parametrize('consulta', CONSULTAS, ids=lambda c: f'{c[0]} {c[1]}')
+def test_rota_sem_varredura_sequencial(app, consulta):
+    """Testar que as consultas da rota usam índices nas tabelas grandes"""
+    metodo, url, *corpo = consulta
+    consultas = _consultas_da_rota(app, metodo, url, *corpo)
+    assert consultas
+
+    with app.app_context():
+        conexao = db.session.connection()
+        for sql, parametros in consultas:
+            varridas = {_tabela(nome) for nome in tabelas_varridas(conexao, sql, parametros)} & TABELAS_GRANDES
+            assert not varridas, f'Varredura sequencial em {sorted(varridas)} na consulta:\n{sql}'
+
+def _tabela(nome):
+    """Nome da tabela particionada a partir do nome da partição (presencas_2024 -> presencas)"""
+    return re.sub(r'^presencas_(\d{4}|padrao)$', 'presencas', nome)
+
+@pytest.mark.parametrize('url', [
+    '/api/presencas/relatorio/diario/2024-02-05',
+    '/api/presencas/relatorio/frequencia?data_inicio=2024-02-10&data_fim=2024-04-20&id_turma=3',
+    '/api/presencas/aluno/7?data_inicio=2024-02-01&data_fim=2024-02-29',
+])
+def test_poda_de_particoes_presencas(app, url):
+    """Testar que as consultas por período leem só a partição do ano pedido"""
+    if db.engine.dialect.name != 'postgresql':
+        pytest.skip('presencas só é particionada no PostgreSQL')
+    consultas = _consultas_da_rota(app, 'GET', url)
+    with app.app_context():
+        conexao = db.session.connection()
+        for sql, parametros in consultas:
+            particoes = {nome for nome in tabelas_lidas(conexao, sql, parametros) if _tabela(nome) != nome}
+            assert particoes <= {'presencas_2024'}, f'Partições {sorted(particoes)} lidas na consulta:\n{sql}'
+
+def test_migracoes_criam_os_indices_dos_modelos():
+    """Testar que init.sql + migrações resultam nos mesmos índices declarados nos modelos"""
+    arquivos = [Path(__file__).resolve().parent.parent / 'database' / 'init.sql']
+    arquivos += [caminho for _, caminho in listar_migracoes()]
+    indices = set()
+    for caminho in arquivos:
+        for comando in _comandos(caminho.read_text(encoding='utf-8')):
+            criado = re.match(r'CREATE INDEX (?:CONCURRENTLY )?IF NOT EXISTS (\w+)', comando)
+            removido = re.match(r'DROP INDEX (?:CONCURRENTLY )?IF EXISTS (\w+)', comando)
+            if criado:
+                indices.add(criado.group(1))
+            elif removido:
+                indices.discard(removido.group(1))
+
+    modelos = {indice.name for tabela in db.metadata.tables.values() for indice in tabela.indexes}
+    assert indices == modelos
+
+def test_migracao_sem_transacao_lista_os_indices_concorrentes():
+    """Testar os índices verificados (indisvalid) antes de repetir uma migração com CONCURRENTLY"""
+    caminho = dict(listar_migracoes())[1]
+    nomes = _indices_concorrentes(caminho.read_text(encoding='utf-8'))
+    assert 'idx_pagamentos_pendentes' in nomes and 'idx_conversas_chatbot_aluno' in nomes
+    assert 'idx_pagamentos_status' not in nomes  # Removido pelo arquivo, não criado